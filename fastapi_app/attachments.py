@@ -0,0 +1,282 @@
+# fastapi-app/attachments.py
+# メモの添付ファイル：内容の SHA-256 をキーにディスクへ保存する（同じ内容のファイルは 1 つだけ）
+#
+# - アップロードはチャンクごとに一時ファイルへ書きながらハッシュを計算する（全体をメモリに載せない）
+# - blobs.ref_count は memo_attachments のトリガーで同じトランザクション内に増減させる
+#   （メモ・ユーザーの削除による ON DELETE CASCADE でも減る）
+# - 参照数 0 になった blob は AttachmentCollector がファイルごと削除する
+#
+# ファイルの配置（os.replace）と削除は DB の書き込みロックを持った状態で行う。
+# blob の行が無いファイル（配置後のロールバック・削除途中の中断）は sweep_orphan_files で掃除する。
+# シャード使用時（shards.py）は blobs がシャードごとにあるため、ファイルも root/shard-NNNN/ に分けて置く
+# （同じ内容の重複排除はシャード内のみ）。
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from shards import shard_pool
+
+logger = logging.getLogger("memo.db")
+
+ATTACHMENT_DIR = os.getenv("MEMO_ATTACHMENT_DIR", "./attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("MEMO_ATTACHMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+
+ATTACHMENT_GC_BATCH_SIZE = 500  # 1 トランザクションで削除する blob の件数
+ATTACHMENT_GC_INTERVAL = 60     # 削除の通知が無くても参照数 0 の blob を探す間隔（秒）
+
+# 一時ファイルの置き場所（ATTACHMENT_DIR 直下。blob と同じファイルシステムにして os.replace で移す）
+_TMP = "tmp"
+
+class AttachmentTooLarge(Exception):
+    pass
+
+_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS memo_attachments_ref_ai AFTER INSERT ON memo_attachments BEGIN
+        UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = new.sha256;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memo_attachments_ref_ad AFTER DELETE ON memo_attachments BEGIN
+        UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = old.sha256;
+    END
+    """,
+]
+
+def init_attachments(engine):
+    """参照数のトリガーを作成する（トリガーが無かった場合は参照数を数え直す）"""
+    with engine.begin() as conn:
+        stale = not conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'memo_attachments_ref_ai'")
+        ).first()
+        for ddl in _TRIGGERS:
+            conn.execute(text(ddl))
+        if stale:
+            conn.execute(text(
+                "UPDATE blobs SET ref_count = (SELECT COUNT(*) FROM memo_attachments a WHERE a.sha256 = blobs.sha256)"
+            ))
+
+@dataclass
+class StagedUpload:
+    """受信を終えた一時ファイル（place() で blob の位置へ移す）"""
+    store: "AttachmentStore"
+    path: str
+    sha256: str
+    size: int
+
+    def place(self):
+        self.store.place(self)
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+class AttachmentStore:
+    """root/<先頭 2 文字>/<sha256> にファイルを置く（1 ディレクトリのファイル数を抑える）"""
+
+    def __init__(self, root: str = ATTACHMENT_DIR):
+        self.root = root
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    async def receive(self, chunks, max_bytes: int = ATTACHMENT_MAX_BYTES) -> StagedUpload:
+        """非同期イテレータ（request.stream() など）を一時ファイルへ書き出しながら SHA-256 を計算する
+
+        max_bytes を超えた時点で一時ファイルを削除して AttachmentTooLarge を送出する。
+        """
+        tmp_dir = os.path.join(self.root, _TMP)
+        os.makedirs(tmp_dir, exist_ok=True)
+        path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(path, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge()
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                # ディスクへの書き出し待ちはイベントループを止めないようスレッドで行う
+                await asyncio.to_thread(os.fsync, f.fileno())
+        except BaseException:
+            # 切断・サイズ超過など（一時ファイルを残さない）
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            raise
+        return StagedUpload(self, path, digest.hexdigest(), size)
+
+    def place(self, staged: StagedUpload):
+        """一時ファイルを blob の位置へ移す（既に同じ内容があれば一時ファイルを削除するだけ）"""
+        final = self.path(staged.sha256)
+        if os.path.exists(final):
+            staged.discard()
+            return
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(staged.path, final)
+
+    def remove(self, sha256: str):
+        try:
+            os.unlink(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def files(self, prefix: str) -> list[str]:
+        """root/<prefix>/ にある blob ファイル名（sha256）の一覧"""
+        try:
+            return os.listdir(os.path.join(self.root, prefix))
+        except FileNotFoundError:
+            return []
+
+    def prefixes(self) -> list[str]:
+        """blob を置くディレクトリ（先頭 2 文字）の一覧（一時ファイル・シャードのディレクトリは含めない）"""
+        try:
+            return sorted(
+                name for name in os.listdir(self.root)
+                if len(name) == 2 and os.path.isdir(os.path.join(self.root, name))
+            )
+        except FileNotFoundError:
+            return []
+
+attachment_store = AttachmentStore()
+
+def shard_store(shard, base: AttachmentStore = attachment_store) -> AttachmentStore:
+    """シャードのファイルの置き場所（シャードを使わない場合は base そのもの）"""
+    if shard.index is None:
+        return base
+    return AttachmentStore(os.path.join(base.root, f"shard-{shard.index:04d}"))
+
+def collect_blobs(db, store: AttachmentStore, limit: int = ATTACHMENT_GC_BATCH_SIZE) -> int:
+    """参照数 0 の blob を最大 limit 件、行とファイルの両方から削除する（書き込み関数として実行）
+
+    ファイルはコミット前（書き込みロックを持っている間）に削除する。コミット後に削除すると、
+    その間に同じ内容がアップロードされて置いたファイルを消してしまうため。
+    """
+    removed = db.execute(
+        text(
+            "DELETE FROM blobs WHERE sha256 IN "
+            "(SELECT sha256 FROM blobs WHERE ref_count <= 0 LIMIT :n) RETURNING sha256"
+        ),
+        {"n": limit},
+    ).scalars().all()
+    for sha256 in removed:
+        store.remove(sha256)
+    db.commit()
+    return len(removed)
+
+def _sweep_prefix(db, store: AttachmentStore, prefix: str) -> int:
+    """root/<prefix>/ のファイルのうち blobs に行が無いものを削除する（書き込み関数として実行）"""
+    names = [name for name in store.files(prefix) if len(name) == 64]
+    if not names:
+        return 0
+    known = set()
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        params = {f"s{i}": name for i, name in enumerate(chunk)}
+        placeholders = ", ".join(f":{key}" for key in params)
+        known.update(db.execute(text(f"SELECT sha256 FROM blobs WHERE sha256 IN ({placeholders})"), params).scalars())
+    orphans = [name for name in names if name not in known]
+    for sha256 in orphans:
+        store.remove(sha256)
+    db.commit()
+    return len(orphans)
+
+def sweep_orphan_files(store: AttachmentStore = attachment_store) -> int:
+    """blobs に行の無いファイルを削除する（ディレクトリごとに別トランザクション）。削除した件数を返す
+
+    受信途中で残った一時ファイル（プロセスの強制終了など）も削除するため、アップロード中には実行しないこと。
+    """
+    removed = 0
+    for shard in shard_pool.each():
+        shard_files = shard_store(shard, store)
+        removed += sum(shard.write(_sweep_prefix, shard_files, prefix) for prefix in shard_files.prefixes())
+        tmp_dir = os.path.join(shard_files.root, _TMP)
+        for name in shard_files.files(_TMP):
+            os.unlink(os.path.join(tmp_dir, name))
+            removed += 1
+    return removed
+
+class AttachmentCollector:
+    """参照数 0 の blob を専用スレッドで削除する（wake() で即座に、それ以外は一定間隔で）
+
+    シャード使用時は wake(user_id) されたユーザーのシャードだけを調べる（一定間隔の削除は全シャード）。
+    """
+
+    def __init__(self, store: AttachmentStore = attachment_store, batch_size: int = ATTACHMENT_GC_BATCH_SIZE,
+                 interval: float = ATTACHMENT_GC_INTERVAL):
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.blobs_removed = 0
+        self._event = threading.Event()
+        self._pending = set()  # wake されたシャードの番号（None は全シャード）
+        self._stopping = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="attachment-gc", daemon=True)
+                self._thread.start()
+
+    def wake(self, user_id: int | None = None):
+        with self._lock:
+            if user_id is None or not shard_pool.enabled:
+                self._pending = None
+            elif self._pending is not None:
+                self._pending.add(shard_pool.index(user_id))
+        self._event.set()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+        if thread is not None:
+            self._event.set()
+            thread.join()
+
+    def collect(self, indexes: list[int] | None = None) -> int:
+        """参照数 0 の blob が無くなるまで削除する（indexes は対象のシャード番号。削除した件数を返す）"""
+        total = 0
+        for shard in shard_pool.each(indexes):
+            store = shard_store(shard, self.store)
+            while True:
+                removed = shard.write(collect_blobs, store, self.batch_size)
+                total += removed
+                self.blobs_removed += removed
+                if removed < self.batch_size:
+                    break
+        return total
+
+    def stats(self) -> dict:
+        return {"blobs_removed": self.blobs_removed}
+
+    def _run(self):
+        while True:
+            woken = self._event.wait(self.interval)
+            self._event.clear()
+            if self._stopping:
+                return
+            with self._lock:
+                pending, self._pending = self._pending, set()
+            try:
+                self.collect(sorted(pending) if woken and pending is not None else None)
+            except Exception:
+                # 残った blob は次の周期で削除される
+                logger.exception("attachment garbage collection failed")
+
+attachment_collector = AttachmentCollector()
@@ -0,0 +1,1407 @@
+# fastapi-app/bench/commands.py
+# 計測・検証コマンド（bench-* / check-*）。manage.py から登録する
+# 一時 DB とデータの投入は bench/seed.py。計測する機能のモジュールは各コマンドの中で読み込む
+
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from db import count_queries, apply_sqlite_pragmas, enable_foreign_keys, use_immediate_transactions, database_size, vacuum
+from compression import enable_memo_text
+from migrations import migrate_shards
+from shards import shard_pool, SHARD_MAX_OPEN
+from user_deletion import USER_DELETE_CHUNK_SIZE
+from bench.seed import temp_engine, create_db, seed, seed_contract, account_memo
+
+# ===================================================
+# bench-search: LIKE 全件走査と FTS5 の比較
+# ===================================================
+_KANA_SYLLABLES = ["か", "き", "く", "さ", "し", "す", "た", "ち", "な", "に", "ま", "み", "ら", "り", "ん", "ー"]
+
+def _search_corpus(keyword: str, hit_ratio: float):
+    """語彙 5000 語のランダム文書（seed の memo 引数）。hit_ratio の割合で keyword を混ぜる"""
+    rnd = random.Random(0)
+    vocab = ["".join(rnd.choices(_KANA_SYLLABLES, k=4)) for _ in range(5000)]
+
+    def memo(i: int) -> dict:
+        words = rnd.choices(vocab, k=60)
+        if rnd.random() < hit_ratio:
+            words[rnd.randrange(len(words))] = keyword
+        return {"title": " ".join(words[:3]), "content": " ".join(words[3:])}
+    return memo
+
+def _time_query(bench_engine, sql: str, params: dict, repeat: int) -> float:
+    with bench_engine.connect() as conn:
+        conn.execute(text(sql), params).all()  # ウォームアップ
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(text(sql), params).all()
+    return (time.perf_counter() - started) / repeat * 1000
+
+def cmd_bench_search(args):
+    with temp_engine() as bench_engine:
+        seed(bench_engine, [1], memos=args.memos, memo=_search_corpus(args.keyword, args.hit_ratio))
+
+        params = {"user_id": 1, "kw": f"%{args.keyword}%", "match": f'"{args.keyword}"'}
+        like_ms = _time_query(bench_engine, """
+            SELECT id FROM memos
+            WHERE user_id = :user_id AND (title LIKE :kw OR content LIKE :kw)
+            ORDER BY updated_at DESC, id DESC LIMIT 20
+        """, params, args.repeat)
+        fts_ms = _time_query(bench_engine, """
+            SELECT m.id FROM memos_fts JOIN memos m ON m.id = memos_fts.rowid
+            WHERE memos_fts MATCH :match AND m.user_id = :user_id
+            ORDER BY bm25(memos_fts, 10.0, 1.0) LIMIT 20
+        """, params, args.repeat)
+
+    print(f"memos={args.memos} keyword={args.keyword!r} hit_ratio={args.hit_ratio}")
+    print(f"  LIKE scan : {like_ms:8.2f} ms/query")
+    print(f"  FTS5 bm25 : {fts_ms:8.2f} ms/query")
+
+# ===================================================
+# check-queries: GET /memos のクエリ数がメモ件数に依存しないことを検証
+# ===================================================
+# タグ 10 件と、タグ 3 件付きのメモ（一覧の計測用）
+_TAGGED = {"tags": 10, "tags_per_memo": 3}
+
+def cmd_check_queries(args):
+    from crud.memo import get_memos
+    from schemas.memo import MemoResponse
+
+    counts = {}
+    for size in args.sizes:
+        with temp_engine() as bench_engine:
+            seed(bench_engine, [1], memos=size, **_TAGGED)
+            db = sessionmaker(bind=bench_engine)()
+            try:
+                # エンドポイントと同じく取得 + レスポンスのシリアライズまでを計測
+                with count_queries(bench_engine) as statements:
+                    memos, _ = get_memos(db, 1, limit=size)
+                    [MemoResponse.model_validate(m).model_dump() for m in memos]
+            finally:
+                db.close()
+        counts[size] = len(statements)
+        print(f"memos={size:6d} statements={len(statements)}")
+
+    if len(set(counts.values())) != 1:
+        raise SystemExit(f"query count grows with memo count: {counts}")
+    print("OK: query count is O(1)")
+
+# ===================================================
+# check-serialization: 高速経路の出力が response_model 経由と同一バイト列であることを検証
+# ===================================================
+def _default_body(response_model, content) -> bytes:
+    """FastAPI 既定の経路：response_model で検証 → JSON 互換に変換 → JSONResponse"""
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(response_model)
+    return JSONResponse(adapter.dump_python(adapter.validate_python(content, from_attributes=True), mode="json")).body
+
+def cmd_check_serialization(args):
+    from crud.memo import get_memos, get_memo_rows, MEMO_SORTS
+    from crud.tag import get_tags, get_tag_rows
+    from crud.category import get_categories, get_category_rows
+    from schemas.memo import MemoResponse
+    from schemas.tag import TagResponse
+    from schemas.category import CategoryResponse
+    from fast_json import dumps
+
+    with temp_engine() as bench_engine:
+        seed_contract(bench_engine)
+        db = sessionmaker(bind=bench_engine)()
+        try:
+            cases = [("tags", list[TagResponse], get_tags(db, 1), get_tag_rows(db, 1)),
+                     ("categories", list[CategoryResponse], get_categories(db, 1), get_category_rows(db, 1))]
+            for sort in MEMO_SORTS:
+                for filters in ({}, {"category_id": 1}, {"tag_id": 2}, {"important": 0}):
+                    cursor = None
+                    for page in range(3):
+                        memos, next_cursor = get_memos(db, 1, sort=sort, cursor=cursor, limit=15, **filters)
+                        rows, next_row_cursor = get_memo_rows(db, 1, sort=sort, cursor=cursor, limit=15, **filters)
+                        if next_cursor != next_row_cursor:
+                            raise SystemExit(f"cursor mismatch: memos sort={sort} {filters} page={page}")
+                        cases.append((f"memos sort={sort} {filters} page={page}", list[MemoResponse], memos, rows))
+                        cursor = next_cursor
+                        if cursor is None:
+                            break
+        finally:
+            db.close()
+
+    for label, response_model, objects, rows in cases:
+        expected, actual = _default_body(response_model, objects), dumps(rows)
+        if expected != actual:
+            raise SystemExit(f"{label}: bodies differ\n  default: {expected[:200]!r}\n  fast:    {actual[:200]!r}")
+        print(f"{label}: {len(actual)} bytes identical")
+    print(f"OK: {len(cases)} responses byte-identical")
+
+# ===================================================
+# bench-serialize: 一覧の取得 + シリアライズ（既定の経路 vs 高速経路）
+# ===================================================
+def cmd_bench_serialize(args):
+    from crud.memo import get_memos, get_memo_rows, MEMO_SORTS
+    from schemas.memo import MemoResponse
+    from fast_json import dumps
+
+    for size in args.sizes:
+        with temp_engine() as bench_engine:
+            seed(bench_engine, [1], memos=size, **_TAGGED)
+            db = sessionmaker(bind=bench_engine)()
+            timings = {}
+            bodies = {}
+            try:
+                for label, render in [
+                    ("default", lambda: _default_body(list[MemoResponse], get_memos(db, 1, limit=size)[0])),
+                    ("fast", lambda: dumps(get_memo_rows(db, 1, limit=size)[0])),
+                ]:
+                    best = float("inf")
+                    for _ in range(args.repeat):
+                        db.expunge_all()  # ORM の識別マップを毎回空にする（リクエストごとの新規セッション相当）
+                        started = time.perf_counter()
+                        bodies[label] = render()
+                        best = min(best, time.perf_counter() - started)
+                    timings[label] = best
+            finally:
+                db.close()
+        if bodies["default"] != bodies["fast"]:
+            raise SystemExit(f"memos={size}: bodies differ")
+        print(f"memos={size:7d} default {timings['default'] * 1000:9.1f} ms   fast {timings['fast'] * 1000:9.1f} ms"
+              f"   x{timings['default'] / timings['fast']:.1f}   ({len(bodies['fast']) / 1e6:.1f} MB)")
+
+# ===================================================
+# bench-writes: 同時書き込みのスループット（直接書き込み vs 単一ライター）
+# ===================================================
+def _bench_write_mode(path: str, mode: str, profile: str, clients: int, writes: int):
+    from write_queue import WriteQueue
+    from crud.memo import create_memo
+    from schemas.memo import MemoCreate
+
+    bind = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    apply_sqlite_pragmas(bind, profile)
+    enable_foreign_keys(bind)
+    enable_memo_text(bind)
+    queue = None
+    if mode == "queue":
+        writer = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0)
+        apply_sqlite_pragmas(writer, profile)
+        enable_foreign_keys(writer)
+        enable_memo_text(writer)
+        use_immediate_transactions(writer)
+        queue = WriteQueue(bind=writer)
+    session_factory = sessionmaker(bind=bind)
+    errors = []
+
+    def client(n: int):
+        for i in range(writes):
+            memo = MemoCreate(title=f"client{n}-{i}", content="x" * 200)
+            try:
+                if queue:
+                    queue.run(create_memo, memo, 1)
+                else:
+                    db = session_factory()
+                    try:
+                        create_memo(db, memo, 1)
+                    finally:
+                        db.close()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    batches = queue.batches if queue else None
+    if queue:
+        queue.stop()
+        queue.bind.dispose()
+    bind.dispose()
+    ok = clients * writes - len(errors)
+    return ok / elapsed, len(errors), batches
+
+def cmd_bench_writes(args):
+    print(f"clients={args.clients} writes/client={args.writes}")
+    for mode, profile in [("direct", "legacy"), ("direct", "default"), ("queue", "default"),
+                          ("direct", "durable"), ("queue", "durable")]:
+        with temp_engine() as bench_engine:
+            seed(bench_engine, [1])
+            path = bench_engine.url.database
+            rate, errors, batches = _bench_write_mode(path, mode, profile, args.clients, args.writes)
+        extra = f" batches={batches}" if batches is not None else ""
+        print(f"  {mode:6s} profile={profile:8s} {rate:9.1f} writes/s  errors={errors}{extra}")
+
+# ===================================================
+# check-write-queue: コミット後の処理がバッチの COMMIT より前に走らないことを検証
+# ===================================================
+def cmd_check_write_queue(args):
+    from write_queue import WriteQueue
+    from db import defer_until_commit, pop_committed
+    from bootstrap_cache import bootstrap_cache, mark_dirty
+    from events import event_hub, emit_change
+
+    log = []  # COMMIT の発行とコミット後の処理の順序
+
+    def on_commit(session):
+        log.extend(pop_committed(session, "check"))
+
+    def job(db, label, fail=False, orphan=False, dirty=False):
+        item_id = db.execute(text("INSERT INTO items (label, parent_id) VALUES (:label, :parent_id) RETURNING rowid"),
+                             {"label": label, "parent_id": 999 if orphan else None}).scalar()
+        defer_until_commit(db, "check", label)
+        emit_change(db, 1, "memo", "create", [item_id])
+        if dirty:
+            # 同じバッチの前の書き込みで /bootstrap のキャッシュが破棄されていれば COMMIT 前に破棄している
+            if bootstrap_cache.get(1, 0) is None:
+                log.append(f"bootstrap invalidated before {label}")
+            mark_dirty(db, 1)
+        if fail:
+            raise ValueError(label)
+
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(db):
+        started.set()
+        release.wait()
+        job(db, "blocker")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = create_engine(f"sqlite:///{os.path.join(tmp, 'check.db')}", connect_args={"check_same_thread": False},
+                               pool_size=1, max_overflow=0)
+        enable_foreign_keys(writer)
+        use_immediate_transactions(writer)
+        with writer.begin() as conn:
+            conn.execute(text("CREATE TABLE parents (id INTEGER PRIMARY KEY)"))
+            # 親の無い行は SAVEPOINT の解放では通り、COMMIT で失敗する
+            conn.execute(text("CREATE TABLE items (label TEXT, parent_id INTEGER "
+                              "REFERENCES parents(id) DEFERRABLE INITIALLY DEFERRED)"))
+        event.listen(writer, "commit", lambda conn: log.append("COMMIT"))
+        event.listen(Session, "after_commit", on_commit)
+        # 変更通知（/events）の配信も記録する
+        event_hub.publish = lambda user_id, kind, data: log.append(f"event {data['ids']}")
+        queue = WriteQueue(bind=writer)
+        try:
+            # 1 本目の実行中に積んだ書き込みは次の 1 バッチにまとまる
+            first = queue.submit(blocker)
+            started.wait()
+            log.clear()  # テーブル作成の COMMIT
+            bootstrap_cache.put(1, 0, b"{}")
+            batch = [queue.submit(job, "a", dirty=True), queue.submit(job, "b", dirty=True), queue.submit(job, "c", fail=True)]
+            release.set()
+            first.result()
+            if batch[1].exception() is None and bootstrap_cache.get(1, 0) is not None:
+                raise SystemExit("bootstrap cache was not invalidated after the COMMIT")
+            errors = [future.exception() for future in batch]
+            if queue.batches != 2 or [type(e).__name__ if e else None for e in errors] != [None, None, "ValueError"]:
+                raise SystemExit(f"unexpected batches={queue.batches} errors={errors}")
+            # COMMIT が失敗したバッチでは何も取り出されない
+            failed = queue.submit(job, "orphan", orphan=True)
+            if failed.exception() is None:
+                raise SystemExit("the orphan row was committed")
+        finally:
+            queue.stop()
+            event.remove(Session, "after_commit", on_commit)
+            del event_hub.publish
+            writer.dispose()
+
+    # 変更通知は on_commit より先に登録されたリスナーが配信する。最後の COMMIT は失敗したバッチのもの
+    expected = ["COMMIT", "event [1]", "blocker", "COMMIT", "event [2]", "event [3]", "a", "b", "COMMIT"]
+    print(f"order: {log}")
+    if log != expected:
+        raise SystemExit(f"expected {expected}")
+    print("OK: deferred work and change events run only after the outer COMMIT "
+          "(not on SAVEPOINT release, not for rolled-back jobs or failed commits)")
+
+# ===================================================
+# bench-batch: 一括 API と 1 件ずつのループの比較
+# ===================================================
+def cmd_bench_batch(args):
+    from crud.memo import create_memo, delete_memo, create_memos_batch, delete_memos_batch
+    from schemas.memo import MemoCreate
+
+    items = [MemoCreate(title=f"memo{i}", content="x" * 200, tag_ids=[1, 2]) for i in range(args.items)]
+    print(f"items={args.items}")
+    for label, create, remove in [
+        ("loop ", lambda db: [create_memo(db, m, 1).id for m in items],
+                  lambda db, ids: [delete_memo(db, i, 1) for i in ids]),
+        ("batch", lambda db: [r["id"] for r in create_memos_batch(db, items, 1)["results"]],
+                  lambda db, ids: delete_memos_batch(db, ids, 1)),
+    ]:
+        with temp_engine() as bench_engine:
+            apply_sqlite_pragmas(bench_engine)
+            seed(bench_engine, [1], **_TAGGED)
+            db = sessionmaker(bind=bench_engine)()
+            try:
+                started = time.perf_counter()
+                ids = create(db)
+                created = time.perf_counter() - started
+                started = time.perf_counter()
+                remove(db, ids)
+                deleted = time.perf_counter() - started
+            finally:
+                db.close()
+        print(f"  {label}: create {args.items / created:9.1f} items/s   delete {args.items / deleted:9.1f} items/s")
+
+# ===================================================
+# bench-export: 大量データのエクスポート / インポートとピークメモリ（RSS）の検証
+# ===================================================
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux は KiB
+
+def cmd_bench_export(args):
+    from crud.memo_io import export_ndjson, parse_ndjson, iter_import_batches, import_memos_batch
+
+    with temp_engine() as bench_engine, tempfile.TemporaryFile() as dump:
+        apply_sqlite_pragmas(bench_engine)
+        # ユーザー 1 のメモをユーザー 2 にインポートする
+        seed(bench_engine, [1], memos=args.rows, tags=10, tags_per_memo=1, memo=lambda i: {"content": "x" * 200})
+        seed(bench_engine, [2])
+        session_factory = sessionmaker(bind=bench_engine)
+        baseline = _peak_rss_mb()
+
+        db = session_factory()
+        started = time.perf_counter()
+        size = 0
+        for chunk in export_ndjson(db, 1):
+            dump.write(chunk)
+            size += len(chunk)
+        db.close()
+        export_s = time.perf_counter() - started
+        export_peak = _peak_rss_mb()
+
+        dump.seek(0)
+        db = session_factory()
+        started = time.perf_counter()
+        imported = 0
+        for rows, _ in iter_import_batches(parse_ndjson(dump)):
+            import_memos_batch(db, rows, 2)
+            imported += len(rows)
+        db.close()
+        import_s = time.perf_counter() - started
+        import_peak = _peak_rss_mb()
+
+    print(f"rows={args.rows} ndjson={size / 1024 / 1024:.1f}MB baseline_rss={baseline:.1f}MB")
+    print(f"  export: {args.rows / export_s:9.0f} rows/s  peak_rss +{export_peak - baseline:.1f}MB")
+    print(f"  import: {imported / import_s:9.0f} rows/s  peak_rss +{import_peak - baseline:.1f}MB")
+    growth = import_peak - baseline
+    if imported != args.rows or growth > args.max_rss_mb:
+        raise SystemExit(f"FAILED: imported={imported} rss_growth={growth:.1f}MB (limit {args.max_rss_mb}MB)")
+    print("OK")
+
+# ===================================================
+# bench-links: URL / ドメイン / ファイルパスでの絞り込み（JSON 走査 vs 検索用テーブル）
+# ===================================================
+def _linked_memo(i: int, domains: int = 1000) -> dict:
+    return {
+        "file_paths": f'["/docs/{i % domains}/a.txt"]',
+        "urls": f'["https://site{i % domains}.example.com/page/{i}", "https://example.org/?id={i}"]',
+    }
+
+def cmd_bench_links(args):
+    from crud.memo import _filter_memos, get_memo_rows
+    from models.memo import Memo
+
+    lookups = {
+        "url": ("urls", "https://example.org/?id=7"),
+        "domain": ("urls", "site7.example.com"),
+        "file_path": ("file_paths", "/docs/7/a.txt"),
+    }
+    with temp_engine() as bench_engine:
+        seed(bench_engine, [1], memos=args.memos, memo=_linked_memo)
+        db = sessionmaker(bind=bench_engine)()
+        try:
+            print(f"memos={args.memos}")
+            failed = []
+            for name, (column, value) in lookups.items():
+                # 従来の方法：本人のメモの JSON を全件読み込んで Python で判定
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    rows = db.execute(text(f"SELECT id, {column} FROM memos WHERE user_id = 1")).all()
+                    if name == "domain":
+                        scanned = [r.id for r in rows if any(f"://{value}/" in u for u in json.loads(r[1] or "[]"))]
+                    else:
+                        scanned = [r.id for r in rows if value in json.loads(r[1] or "[]")]
+                scan_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    memos, _ = get_memo_rows(db, 1, limit=200, **{name: value})
+                index_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+                stmt = _filter_memos(select(Memo.id), 1, **{name: value}).limit(201)
+                compiled = stmt.compile(bench_engine, compile_kwargs={"literal_binds": True})
+                plan = [row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+                print(f"  {name:9s}: JSON scan {scan_ms:8.2f} ms   index {index_ms:8.2f} ms   hits={len(memos)}")
+                for step in plan:
+                    print(f"      {step}")
+                if sorted(m["id"] for m in memos) != sorted(scanned)[:200] or any(step.startswith("SCAN") for step in plan):
+                    failed.append(name)
+        finally:
+            db.close()
+    if failed:
+        raise SystemExit(f"FAILED: {failed} (result mismatch or full scan)")
+    print("OK")
+
+# ===================================================
+# bench-list-fields: 一覧の項目指定（fields=）による応答サイズと DB の読み込み量
+# ===================================================
+# メモ一覧画面（MemoList.vue）が使う項目
+LIST_VIEW_FIELDS = "title,preview,category_id,important,created_at,tags"
+
+def _read_bytes() -> int:
+    """このプロセスが read 系のシステムコールで読んだバイト数（OS のページキャッシュからの読み込みも含む）"""
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+    raise RuntimeError("rchar not found in /proc/self/io")
+
+def cmd_bench_list_fields(args):
+    from crud.memo import get_memo_rows, parse_memo_fields
+    from models.memo import MEMO_PREVIEW_LENGTH
+    from fast_json import dumps
+
+    with temp_engine() as bench_engine:
+        seed(bench_engine, [1], memos=args.memos, tags=5, tags_per_memo=1, memo=lambda i: {
+            "title": f"memo {i}",
+            "content": f"{i} " + "長い本文 " * (args.content_chars // 5),
+            "created_at": datetime(2024, 1, 1) + timedelta(seconds=i),
+            "updated_at": datetime(2024, 1, 1) + timedelta(seconds=i),
+        })
+
+        print(f"memos={args.memos} content={args.content_chars} chars preview={MEMO_PREVIEW_LENGTH} chars")
+        results = {}
+        for label, fields in (("full", None), ("fields", LIST_VIEW_FIELDS)):
+            projection = {"fields": parse_memo_fields(fields)} if fields else {}
+            # ページキャッシュを小さくして、ページングのたびに DB ファイルから読ませる
+            with sessionmaker(bind=bench_engine)() as db:
+                db.execute(text("PRAGMA cache_size=-64"))
+                response_bytes, pages, cursor = 0, 0, None
+                read_before, started = _read_bytes(), time.perf_counter()
+                while True:
+                    memos, cursor = get_memo_rows(db, 1, cursor=cursor, limit=args.page_size, **projection)
+                    response_bytes += len(dumps(memos))
+                    pages += 1
+                    if not cursor:
+                        break
+                elapsed = time.perf_counter() - started
+                db_bytes = _read_bytes() - read_before
+            results[label] = (response_bytes, db_bytes)
+            print(f"  {label:6s}: {pages} pages  {elapsed * 1000 / pages:7.2f} ms/page  "
+                  f"response {response_bytes / pages / 1024:8.1f} KiB/page  db read {db_bytes / pages / 1024:8.1f} KiB/page")
+
+    response_ratio = results["full"][0] / results["fields"][0]
+    read_ratio = results["full"][1] / max(results["fields"][1], 1)
+    print(f"  reduction: response x{response_ratio:.1f}  db read x{read_ratio:.1f}")
+    if response_ratio < args.min_ratio or read_ratio < args.min_ratio:
+        raise SystemExit(f"FAILED: expected at least x{args.min_ratio} reduction")
+    print("OK")
+
+# ===================================================
+# bench-compression: 本文の圧縮の有無によるファイルサイズ・読み書きの所要時間
+# ===================================================
+_LOG_LEVELS = ("INFO", "INFO", "INFO", "WARN", "ERROR")
+
+def _log_body(i: int, size: int) -> str:
+    """貼り付けたログ風の本文（size バイト程度）"""
+    lines, total, n = [], 0, 0
+    while total < size:
+        line = (f"2024-05-{i % 28 + 1:02d}T12:{n % 60:02d}:{(n * 7) % 60:02d} {_LOG_LEVELS[(i + n) % 5]} "
+                f"worker-{n % 8} request id={i * 1000 + n} path=/memos/{n % 97} status=200 所要時間={n % 250}ms")
+        lines.append(line)
+        total += len(line.encode("utf-8")) + 1
+        n += 1
+    return "\n".join(lines)
+
+def _summary(seconds: list) -> str:
+    ordered = sorted(seconds)
+    mean = sum(ordered) / len(ordered)
+    return f"mean {mean * 1000:6.2f} ms  p95 {ordered[int(len(ordered) * 0.95) - 1] * 1000:6.2f} ms"
+
+def _table_size(bind, table: str) -> int:
+    """テーブル本体（B-tree とオーバーフローページ）のバイト数（dbstat 仮想テーブルを使用）"""
+    with bind.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = :name"), {"name": table}).scalar()
+
+def cmd_bench_compression(args):
+    import compression
+    from compression import recompress_memos
+    from crud.memo import create_memo, get_memo, search_memos
+    from schemas.memo import MemoCreate
+
+    sizes = (300, 2_000, 8_000, 32_000)  # 1 KiB 未満の本文は圧縮されない
+    bodies = [_log_body(i, sizes[i % len(sizes)]) for i in range(args.memos)]
+    read_ids = random.Random(0).choices(range(1, args.memos + 1), k=args.reads)
+    enabled = compression.COMPRESSION
+    failed = []
+    try:
+        for mode in ("plain", "compressed"):
+            compression.COMPRESSION = mode == "compressed"
+            with temp_engine() as bench_engine:
+                apply_sqlite_pragmas(bench_engine)
+                seed(bench_engine, [1])
+                session_factory = sessionmaker(bind=bench_engine)
+
+                # 書き込み：1 件ずつ create_memo（コミットまで）
+                writes = []
+                for i, body in enumerate(bodies):
+                    with session_factory() as db:
+                        started = time.perf_counter()
+                        create_memo(db, MemoCreate(title=f"log {i}", content=body), 1)
+                        writes.append(time.perf_counter() - started)
+                vacuum(bench_engine)
+                size = database_size(bench_engine)
+
+                # 読み込み：get_memo（本文を展開して返す）
+                def measure_reads():
+                    reads = []
+                    with session_factory() as db:
+                        for memo_id in read_ids:
+                            db.expunge_all()
+                            started = time.perf_counter()
+                            memo = get_memo(db, memo_id, 1)
+                            reads.append(time.perf_counter() - started)
+                            if memo.content != bodies[memo_id - 1]:
+                                failed.append(f"{mode}: memo {memo_id} content mismatch")
+                        hits = len(search_memos(db, 1, "status=200 worker-3", limit=100))
+                    return reads, hits
+
+                reads, hits = measure_reads()
+                with bench_engine.connect() as conn:
+                    stored = dict(conn.execute(text("SELECT typeof(content), COUNT(*) FROM memos GROUP BY 1")).all())
+                print(f"  {mode:10s}: file {size / 1024 / 1024:7.2f} MiB  memos table {_table_size(bench_engine, 'memos') / 1024 / 1024:7.2f} MiB  "
+                      f"rows {stored}  search hits={hits}")
+                print(f"              write {_summary(writes)}")
+                print(f"              read  {_summary(reads)}")
+
+                if mode == "plain":
+                    # 既存（平文）の DB を compress-memos と同じ処理で圧縮し直す
+                    started = time.perf_counter()
+                    stats = recompress_memos(bench_engine)
+                    elapsed = time.perf_counter() - started
+                    vacuum(bench_engine)
+                    reads, recompressed_hits = measure_reads()
+                    print(f"  recompress: {stats['compressed']}/{stats['scanned']} memos in {elapsed:.2f}s  "
+                          f"file {database_size(bench_engine) / 1024 / 1024:7.2f} MiB  memos table {_table_size(bench_engine, 'memos') / 1024 / 1024:7.2f} MiB  "
+                          f"search hits={recompressed_hits}")
+                    print(f"              read  {_summary(reads)}")
+                    if recompressed_hits != hits:
+                        failed.append("search results changed after recompression")
+    finally:
+        compression.COMPRESSION = enabled
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed[:5]))
+    print("OK")
+
+# ===================================================
+# bench-admin-users: 管理画面のユーザー一覧（ページング + 利用状況の集計）
+# ===================================================
+def cmd_bench_admin_users(args):
+    from crud.user import get_user_rows
+
+    with temp_engine() as bench_engine:
+        # 10 人に 1 人がメモ・タグ・カテゴリを持つ
+        seed(bench_engine, range(1, args.users + 1))
+        seed(bench_engine, range(10, args.users + 1, 10), memos=20, tags=3, categories=1, create_users=False,
+             memo=lambda i: {"content": "本文" * 50})
+        db = sessionmaker(bind=bench_engine)()
+        try:
+            pages = {
+                "first page": {},
+                "next page": {"cursor": None, "q": "user05"},
+                "prefix search": {"q": f"user{args.users // 2:06d}"[:-1]},
+            }
+            failed = []
+            for label, params in pages.items():
+                if "cursor" in params:
+                    _, params["cursor"] = get_user_rows(db, q=params["q"], limit=args.limit)
+                with count_queries(bench_engine) as statements:
+                    started = time.perf_counter()
+                    for _ in range(args.repeat):
+                        rows, _ = get_user_rows(db, limit=args.limit, **params)
+                    elapsed = (time.perf_counter() - started) / args.repeat * 1000
+                per_page = len(statements) // args.repeat
+                print(f"  {label:13s}: {elapsed:7.2f} ms/page  statements={per_page}  rows={len(rows)}  "
+                      f"memos={sum(r['memo_count'] for r in rows)}")
+                if per_page != 2 or not rows:
+                    failed.append(label)
+
+            plan = [row[-1] for row in db.execute(text(
+                "EXPLAIN QUERY PLAN SELECT username, id, role FROM users "
+                "WHERE username >= 'user05' AND username < 'user06' ORDER BY username LIMIT 51"
+            ))]
+            print("  plan:", "; ".join(plan))
+            if any(step.startswith("SCAN") for step in plan):
+                failed.append("plan")
+        finally:
+            db.close()
+    if failed:
+        raise SystemExit(f"FAILED: {failed}")
+    print("OK")
+
+# ===================================================
+# bench-delete-user: メモの多いアカウントの削除（1 トランザクション vs バックグラウンドの分割削除）
+# ===================================================
+_CASCADE_TABLES = ("users", "memos", "memo_tags", "tags", "categories", "memo_urls", "memo_files", "memos_fts", "tombstones")
+
+def _table_counts(bench_engine) -> dict:
+    with bench_engine.connect() as conn:
+        return {table: conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() for table in _CASCADE_TABLES}
+
+_ACCOUNT = {"tags": 10, "categories": 5, "tags_per_memo": 3, "memo": account_memo}
+
+def cmd_bench_delete_user(args):
+    from counters import reconcile_counters
+    from crud.user import delete_user, purge_user_chunk
+
+    failed = []
+    for mode in ("inline", "chunked"):
+        with temp_engine() as bench_engine:
+            apply_sqlite_pragmas(bench_engine)
+            seed(bench_engine, [1], memos=args.memos, **_ACCOUNT)
+            seed(bench_engine, [2], memos=100, **_ACCOUNT)  # 削除されてはいけない別ユーザー
+            before = _table_counts(bench_engine)
+            session_factory = sessionmaker(bind=bench_engine)
+
+            chunk_times = []
+            started = time.perf_counter()
+            with session_factory() as db:
+                if mode == "inline":
+                    status = delete_user(db, 1, inline_limit=args.memos)
+                else:
+                    status = delete_user(db, 1)
+                    # バックグラウンドの UserDeleter と同じ処理を、チャンクごとの所要時間を測りながら実行
+                    more = True
+                    while more:
+                        chunk_started = time.perf_counter()
+                        more = purge_user_chunk(db, 1, args.chunk_size)
+                        chunk_times.append(time.perf_counter() - chunk_started)
+            elapsed = time.perf_counter() - started
+
+            after = _table_counts(bench_engine)
+            with bench_engine.connect() as conn:
+                violations = conn.execute(text("PRAGMA foreign_key_check")).all()
+            drift = reconcile_counters(bench_engine, fix=False)
+
+        # 最長の書き込みロック保持時間：inline は全体、chunked は最も遅いチャンク
+        longest = max(chunk_times) if chunk_times else elapsed
+        print(f"  {mode:7s}: status={status} total {elapsed:7.2f}s  {args.memos / elapsed:9.0f} memos/s  "
+              f"longest write transaction {longest * 1000:8.1f} ms" + (f"  chunks={len(chunk_times)}" if chunk_times else ""))
+        print(f"           before={before}")
+        print(f"           after ={after}")
+        survivor = {"users": 1, "memos": 100, "memo_tags": 300, "tags": 10, "categories": 5,
+                    "memo_urls": 100, "memo_files": 100, "memos_fts": 100, "tombstones": 0}
+        if after != survivor or violations or drift:
+            failed.append(f"{mode}: leftovers or broken references")
+        if mode == "chunked" and longest * 1000 > args.max_chunk_ms:
+            failed.append(f"chunked: a chunk held the write lock for {longest * 1000:.0f} ms")
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# bench-attachments: 添付ファイルの受信（メモリ使用量・速度）・重複排除・参照数による削除の検証
+# ===================================================
+def cmd_bench_attachments(args):
+    from attachments import AttachmentStore, collect_blobs
+    from crud.attachment import create_attachment, delete_attachment
+    from crud.memo import delete_memo
+
+    chunk_size = args.chunk_kb * 1024
+    chunks = args.size_mb * 1024 * 1024 // chunk_size
+    size = chunks * chunk_size
+    expected = hashlib.sha256()
+
+    async def body(digest=None):
+        # 送信側もチャンクごとに生成する（受信側のメモリ使用量だけを測るため）
+        for i in range(chunks):
+            chunk = random.Random(i).randbytes(chunk_size)
+            if digest is not None:
+                digest.update(chunk)
+            yield chunk
+
+    failed = []
+    with temp_engine() as bench_engine, tempfile.TemporaryDirectory() as root:
+        apply_sqlite_pragmas(bench_engine)
+        store = AttachmentStore(root)
+        seed(bench_engine, [1], memos=2, memo=lambda i: {"content": None, "important": 0})
+        baseline = _peak_rss_mb()
+        started = time.perf_counter()
+        staged = asyncio.run(store.receive(body(expected), max_bytes=size))
+        elapsed = time.perf_counter() - started
+        growth = _peak_rss_mb() - baseline
+        print(f"upload: {args.size_mb} MiB in {args.chunk_kb} KiB chunks  {args.size_mb / elapsed:7.1f} MiB/s  "
+              f"peak_rss +{growth:.1f}MB")
+        if staged.sha256 != expected.hexdigest() or staged.size != size:
+            failed.append("upload: hash or size mismatch")
+        if growth > args.max_rss_mb:
+            failed.append(f"upload: rss grew {growth:.1f}MB (limit {args.max_rss_mb}MB)")
+
+        # 同じ内容を 2 つのメモに添付（2 回目は同じ内容の別アップロードとして受信し直す）
+        session_factory = sessionmaker(bind=bench_engine)
+        with session_factory() as db:
+            create_attachment(db, 1, 1, staged, "a.bin", "application/octet-stream")
+            second_id = create_attachment(db, 2, 1, asyncio.run(store.receive(body(), max_bytes=size)), "b.bin", "application/octet-stream").id
+
+        def state():
+            with bench_engine.connect() as conn:
+                blobs = conn.execute(text("SELECT sha256, ref_count FROM blobs")).all()
+            files = [name for prefix in store.prefixes() for name in store.files(prefix)]
+            return blobs, files
+
+        blobs, files = state()
+        print(f"dedupe: attachments=2 blobs={len(blobs)} ref_count={[b.ref_count for b in blobs]} files={len(files)} "
+              f"tmp={len(store.files('tmp'))}")
+        if [tuple(b) for b in blobs] != [(staged.sha256, 2)] or files != [staged.sha256] or store.files("tmp"):
+            failed.append("dedupe: expected one blob referenced twice and one file")
+
+        def collect():
+            with session_factory() as db:
+                return collect_blobs(db, store)
+
+        # メモの削除（ON DELETE CASCADE）→ 参照数 1：削除しない
+        with session_factory() as db:
+            delete_memo(db, 1, 1)
+        removed = collect()
+        blobs, files = state()
+        print(f"after deleting memo 1: removed={removed} blobs={[tuple(b) for b in blobs]} files={len(files)}")
+        if removed or len(files) != 1:
+            failed.append("gc: removed a blob that is still referenced")
+
+        # 添付の削除 → 参照数 0：行とファイルを削除
+        with session_factory() as db:
+            delete_attachment(db, 2, second_id, 1)
+        removed = collect()
+        blobs, files = state()
+        print(f"after deleting the last attachment: removed={removed} blobs={len(blobs)} files={len(files)}")
+        if removed != 1 or blobs or files:
+            failed.append("gc: unreferenced blob was not removed")
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# bench-cold-start: プロセスの起動から最初のリクエストに応答するまでの時間
+# ===================================================
+# 子プロセスで実行する計測（import・スキーマの確認・lifespan の起動・1 回目と 2 回目の GET /memos）
+_COLD_START_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+import db
+import migrations
+imported = time.perf_counter()
+if sys.argv[1] == "legacy":
+    # 移行の導入前：起動のたびに create_all・トリガー等の作成・既存データの検査を行っていた
+    migrations._baseline(db.get_engine())
+else:
+    migrations.migrate(db.get_engine())
+checked = time.perf_counter()
+from datetime import datetime, timedelta, timezone
+from fastapi.testclient import TestClient
+from jose import jwt
+token = jwt.encode({"sub": "user000001", "role": "user", "exp": datetime.now(timezone.utc) + timedelta(minutes=5)},
+                   main.SECRET_KEY, algorithm=main.ALGORITHM)
+headers = {"Authorization": f"Bearer {token}"}
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    first = client.get("/memos", headers=headers)
+    answered = time.perf_counter()
+    second = client.get("/memos", headers=headers)
+    again = time.perf_counter()
+assert first.status_code == second.status_code == 200, (first.status_code, first.text)
+print(json.dumps({
+    "import": imported - started, "schema": checked - imported, "startup": ready - checked,
+    "first_request": answered - ready, "second_request": again - answered, "total": answered - started,
+}))
+"""
+
+# (名前, 子プロセスの引数, 起動時の事前準備 MEMO_PREWARM / MEMO_POOL_PREWARM を行うか)
+_COLD_START_MODES = [
+    ("legacy", "legacy", False),
+    ("migrated", "migrated", False),
+    ("migrated+prewarm", "migrated", True),
+]
+
+def cmd_bench_cold_start(args):
+    # 子プロセスはアプリと同じく fastapi_app ディレクトリで実行する
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = {name: [] for name, _, _ in _COLD_START_MODES}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        bench_engine = create_db(path)
+        seed(bench_engine, [1], memos=args.memos, **_ACCOUNT)
+        bench_engine.dispose()
+
+        # モードを交互に実行する（マシンの負荷の変動が特定のモードに偏らないように）
+        for _ in range(args.runs):
+            for name, mode, prewarm in _COLD_START_MODES:
+                env = dict(os.environ, MEMO_DATABASE_URL=f"sqlite:///{path}", MEMO_ATTACHMENT_DIR=os.path.join(tmp, "attachments"))
+                env["MEMO_PREWARM"] = "1" if prewarm else "0"
+                env["MEMO_POOL_PREWARM"] = "5" if prewarm else "0"
+                out = subprocess.run([sys.executable, "-c", _COLD_START_PROBE, mode], cwd=here, env=env,
+                                     capture_output=True, text=True, check=True).stdout
+                runs[name].append(json.loads(out.strip().splitlines()[-1]))
+
+    results = {name: {key: statistics.median(r[key] for r in rs) for key in rs[0]} for name, rs in runs.items()}
+    print(f"median of {args.runs} runs, {args.memos} memos (ms):")
+    print(f"  {'mode':18s} {'import':>8s} {'schema':>8s} {'startup':>8s} {'1st req':>8s} {'2nd req':>8s} {'total':>8s}")
+    for name, r in results.items():
+        print(f"  {name:18s} {r['import'] * 1000:8.1f} {r['schema'] * 1000:8.1f} {r['startup'] * 1000:8.1f} "
+              f"{r['first_request'] * 1000:8.1f} {r['second_request'] * 1000:8.1f} {r['total'] * 1000:8.1f}")
+    legacy, cold, warm = results["legacy"], results["migrated"], results["migrated+prewarm"]
+    print(f"schema step: {legacy['schema'] * 1000:.1f} ms -> {warm['schema'] * 1000:.1f} ms; "
+          f"first request: {cold['first_request'] * 1000:.1f} ms -> {warm['first_request'] * 1000:.1f} ms with prewarm")
+    # import は計測の揺れが大きいため、判定はスキーマの確認と最初のリクエストの時間で行う
+    failed = []
+    if warm["schema"] >= legacy["schema"]:
+        failed.append("checking the schema version is not faster than the import-time initialization")
+    if warm["first_request"] >= cold["first_request"]:
+        failed.append("prewarm did not shorten the first request")
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# bench-shards: 同時に書き込むユーザー数ごとの書き込みスループット（1 ファイル vs ユーザー単位のシャード）
+# ===================================================
+def _shard_bench_worker(mode: str, directory: str, shards: int, user_id: int, seconds: float, start, results):
+    """1 ユーザー分の書き込みを続けるプロセス（アプリと同じ経路：シャードの単一ライター + CRUD 関数）"""
+    import db as database
+    from crud.memo import create_memo
+    from schemas.memo import MemoCreate
+    # 1 ファイルでのロック待ちは計測対象のため、遅いクエリ（BEGIN IMMEDIATE の待ち）のログは出さない
+    logging.getLogger("memo.db").setLevel(logging.ERROR)
+    if mode == "sharded":
+        shard_pool.configure(shards, directory, SHARD_MAX_OPEN)
+    else:
+        database.init_engines(f"sqlite:///{os.path.join(directory, 'single.db')}")
+    latencies, errors = [], 0
+    with shard_pool.use(user_id) as shard:
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            memo = MemoCreate(title=f"user{user_id}-{len(latencies)}", content="x" * 200)
+            began = time.perf_counter()
+            try:
+                shard.write(create_memo, memo, user_id)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - began)
+    shard_pool.close_all()
+    shard_pool.central.write_queue.stop()
+    database.dispose_engines()
+    results.put((len(latencies) - errors, errors, latencies))
+
+def _bench_shard_mode(mode: str, directory: str, shards: int, users: int, seconds: float) -> dict:
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(users + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=_shard_bench_worker, args=(mode, directory, shards, user_id, seconds, start, results))
+        for user_id in range(1, users + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    # 全プロセスの import・接続が済んでから同時に書き込みを始める
+    start.wait()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    latencies = sorted(latency for _, _, worker_latencies in outcomes for latency in worker_latencies)
+    return {
+        "rate": sum(ok for ok, _, _ in outcomes) / seconds,
+        "errors": sum(errors for _, errors, _ in outcomes),
+        "p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+    }
+
+def cmd_bench_shards(args):
+    from crud.user import create_user_mirror
+
+    shards = max(args.users)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1 ファイル：全ユーザーが同じ DB に書き込む
+        single = create_db(os.path.join(tmp, "single.db"))
+        seed(single, range(1, shards + 1))
+        single.dispose()
+        # シャード：ユーザー 1..shards がそれぞれ別のシャードになる
+        shard_dir = os.path.join(tmp, "shards")
+        shard_pool.configure(shards, shard_dir, shards)
+        migrate_shards(shard_pool)
+        for user_id in range(1, shards + 1):
+            with shard_pool.use(user_id) as shard:
+                shard.write(create_user_mirror, user_id)
+        shard_pool.close_all()
+
+        print(f"{os.cpu_count()} CPUs, {args.seconds:.0f}s per run, one process per user, one create_memo per transaction")
+        for users in args.users:
+            for mode, directory in (("single", tmp), ("sharded", shard_dir)):
+                results[mode, users] = r = _bench_shard_mode(mode, directory, shards, users, args.seconds)
+                print(f"  users={users:3d} {mode:8s} {r['rate']:9.1f} writes/s   p99 {r['p99'] * 1000:7.2f} ms   errors={r['errors']}")
+
+    top, fewest = max(args.users), min(args.users)
+    single, sharded = results["single", top], results["sharded", top]
+    print(f"users={top}: sharded {sharded['rate'] / single['rate']:.2f}x the single file's throughput, "
+          f"p99 {single['p99'] * 1000:.1f} -> {sharded['p99'] * 1000:.1f} ms; "
+          f"sharded throughput {sharded['rate'] / results['sharded', fewest]['rate']:.2f}x that with {fewest} user(s)")
+    failed = []
+    if any(r["errors"] for r in results.values()):
+        failed.append("writes failed")
+    # 1 ファイルでは書き込みロックの待ち（busy_timeout の再試行）が遅延になる。シャードでは待たない
+    if sharded["p99"] >= single["p99"]:
+        failed.append(f"sharded p99 latency is not lower than the single file's with {top} concurrent users")
+    # 別々のファイルへのコミットが並行して進むのはコアが複数ある場合のみ（1 コアでは合計が CPU 時間で頭打ちになる）
+    if (os.cpu_count() or 1) > 1:
+        if sharded["rate"] <= single["rate"]:
+            failed.append(f"sharded throughput is not higher than the single file's with {top} concurrent users")
+        if sharded["rate"] <= results["sharded", fewest]["rate"]:
+            failed.append("sharded throughput does not grow with the number of concurrent users")
+    else:
+        print("only 1 CPU: throughput cannot grow with concurrent users here, checked latency only")
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# bench-events: /events の購読者を多数開いたままにしたときのメモリ使用量と、配信・heartbeat・溢れ・切断の確認
+# ===================================================
+def _current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+class _EventStream:
+    """ASGI アプリに直接つないだ GET /events の 1 本（サーバーを介さずに購読者側の費用だけを測る）"""
+    __slots__ = ("frames", "disconnect", "gate", "task")
+
+    def __init__(self, app, token: str, disconnect: asyncio.Event, gate: asyncio.Event | None = None):
+        self.frames = []
+        self.disconnect = disconnect
+        self.gate = gate
+        self.task = asyncio.create_task(app(self._scope(token), self._receive, self._send))
+
+    @staticmethod
+    def _scope(token: str) -> dict:
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/events", "raw_path": b"/events", "root_path": "", "query_string": b"",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+        }
+
+    async def _receive(self):
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            # gate が閉じている間は受信の遅いクライアント（最初の retry の後で止まる）
+            if self.gate is not None and self.frames:
+                await self.gate.wait()
+            self.frames.append(message["body"])
+
+    def count(self, prefix: bytes) -> int:
+        return sum(frame.startswith(prefix) for frame in self.frames)
+
+async def _wait_until(condition, timeout: float = 30.0) -> float:
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            raise SystemExit("FAILED: timed out waiting for event streams")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - started
+
+async def _open_event_streams(app, tokens: dict, users: list, count: int):
+    """count 本のストリームをユーザーに順に割り当てて開き、全て購読されるまで待つ。(ストリーム, 切断用の Event, 秒数)"""
+    done = asyncio.Event()
+    started = time.perf_counter()
+    streams = [_EventStream(app, tokens[users[i % len(users)]], done) for i in range(count)]
+    await _wait_until(lambda: all(s.frames for s in streams), timeout=max(30.0, count / 50))
+    return streams, done, time.perf_counter() - started
+
+async def _bench_events(app, tokens: dict, args) -> list:
+    from events import event_hub, HEARTBEAT, RESYNC
+    from shards import shard_pool
+    from crud.memo import create_memo
+    from schemas.memo import MemoCreate
+
+    failed = []
+    users = sorted(tokens)
+    async with app.router.lifespan_context(app):
+        # heartbeat：通知の無いストリームにも一定間隔でコメント行が届く
+        default_heartbeat, event_hub.heartbeat = event_hub.heartbeat, 0.2
+        done = asyncio.Event()
+        stream = _EventStream(app, tokens[users[0]], done)
+        await asyncio.sleep(0.7)
+        beats = stream.count(HEARTBEAT)
+        done.set()
+        await stream.task
+        event_hub.heartbeat = default_heartbeat
+        print(f"heartbeat: {beats} in 0.7 s at 0.2 s interval")
+        if beats < 2:
+            failed.append("idle stream did not receive heartbeats")
+
+        # 購読者を開いたままにしてメモリを測る：RSS は計測のための追跡なしで、Python のヒープは tracemalloc で測る
+        gc.collect()
+        rss_before = _current_rss_mb()
+        streams, done, _ = await _open_event_streams(app, tokens, users, args.subscribers)
+        gc.collect()
+        rss_kb = (_current_rss_mb() - rss_before) * 1024 / args.subscribers
+        done.set()
+        await asyncio.gather(*(s.task for s in streams))
+        del streams
+
+        gc.collect()
+        tracemalloc.start()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        streams, done, opened = await _open_event_streams(app, tokens, users, args.subscribers)
+        gc.collect()
+        traced_open = tracemalloc.get_traced_memory()[0]
+        per_kb = (traced_open - traced_before) / args.subscribers / 1024
+        stats = event_hub.stats()
+        print(f"{args.subscribers} idle subscribers over {len(users)} users (opened in {opened:.2f} s with tracemalloc): "
+              f"python heap {per_kb:.1f} KB each, rss {rss_kb:.1f} KB each "
+              f"({per_kb * args.subscribers / 1024:.1f} / {rss_kb * args.subscribers / 1024:.1f} MB in total)")
+        if stats["subscribers"] != args.subscribers:
+            failed.append(f"hub holds {stats['subscribers']} subscribers, expected {args.subscribers}")
+        if per_kb > args.max_kb:
+            failed.append(f"{per_kb:.1f} KB per idle subscriber (limit {args.max_kb} KB)")
+
+        # CRUD の書き込み（実際のコミット）からの配信：そのユーザーのストリームだけに届く
+        target = [s for i, s in enumerate(streams) if users[i % len(users)] == users[0]]
+        others = [s for i, s in enumerate(streams) if users[i % len(users)] != users[0]]
+        started = time.perf_counter()
+        memo = await asyncio.to_thread(shard_pool.central.write, create_memo, MemoCreate(title="event"), users[0])
+        elapsed = await _wait_until(lambda: all(s.count(b"id: ") for s in target))
+        payloads = {json.loads(s.frames[-1].split(b"data: ", 1)[1]) == {"entity": "memo", "op": "create", "ids": [memo.id]} for s in target}
+        print(f"write -> {len(target)} streams of the user: {(time.perf_counter() - started) * 1000:.1f} ms "
+              f"({elapsed * 1000:.1f} ms after commit)")
+        if payloads != {True}:
+            failed.append("change event payload does not match the created memo")
+        if any(s.count(b"id: ") for s in others):
+            failed.append("change event was delivered to other users' streams")
+
+        # 全ユーザーに 1 件ずつ配信（全ストリームへのファンアウト）
+        started = time.perf_counter()
+        for user_id in users:
+            event_hub.publish(user_id, "change", {"entity": "tag", "op": "update", "ids": [1]})
+        elapsed = await _wait_until(lambda: all(s.count(b"id: ") >= (2 if s in target else 1) for s in streams))
+        print(f"fan-out of {len(users)} events to {args.subscribers} streams: {elapsed * 1000:.1f} ms")
+
+        # 受信の遅い購読者：キューが溢れたら溜まった通知を捨てて resync、その後は通常どおり届く
+        slow_user = users[-1]
+        gate = asyncio.Event()
+        slow = _EventStream(app, tokens[slow_user], asyncio.Event(), gate)
+        await _wait_until(lambda: slow.frames)
+        for i in range(event_hub.maxsize * 2):
+            event_hub.publish(slow_user, "change", {"entity": "memo", "op": "update", "ids": [i]})
+        await asyncio.sleep(0.1)
+        gate.set()
+        await _wait_until(lambda: slow.count(RESYNC))
+        event_hub.publish(slow_user, "change", {"entity": "memo", "op": "update", "ids": [-1]})
+        await _wait_until(lambda: b'"ids":[-1]' in slow.frames[-1])
+        received = slow.count(b"id: ")
+        print(f"slow consumer: {event_hub.maxsize * 2} events published while blocked, {received} delivered, "
+              f"resync={slow.count(RESYNC)}, overflows={event_hub.stats()['overflows']}")
+        if slow.count(RESYNC) != 1 or received > event_hub.maxsize + 2:
+            failed.append("slow consumer was not bounded and sent a resync")
+        slow.disconnect.set()
+        await slow.task
+
+        # ユーザーの削除時：そのユーザーのストリームだけを閉じる
+        await asyncio.to_thread(event_hub.disconnect, users[0])
+        await _wait_until(lambda: all(s.task.done() for s in target))
+        if any(s.task.done() for s in others):
+            failed.append("disconnecting one user closed other users' streams")
+
+        # 切断：購読者とその状態が残らない
+        done.set()
+        await asyncio.gather(*(s.task for s in streams))
+        del streams, target, others
+        gc.collect()
+        traced_after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        left = event_hub.stats()["subscribers"]
+        print(f"after disconnect: subscribers={left}, python heap {(traced_after - traced_before) / 1024:+.0f} KB vs before")
+        if left:
+            failed.append(f"{left} subscribers left after disconnect")
+        if traced_after - traced_before > (traced_open - traced_before) / 10:
+            failed.append("memory held by subscribers was not released after disconnect")
+    return failed
+
+def cmd_bench_events(args):
+    # main はアプリの組み立て（エンジンの作成）を伴うため、このコマンドでのみ読み込む
+    import main
+    from jose import jwt
+    from settings import Settings
+
+    logging.getLogger("memo.db").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        bench_engine = create_db(path)
+        seed(bench_engine, range(1, args.users + 1))
+        bench_engine.dispose()
+        app = main.create_app(Settings(
+            database_url=f"sqlite:///{path}", attachment_dir=os.path.join(tmp, "attachments"), shards=0, prewarm=False,
+        ))
+        exp = datetime.utcnow() + timedelta(hours=1)
+        tokens = {
+            i: jwt.encode({"sub": f"user{i:06d}", "role": "user", "exp": exp}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+            for i in range(1, args.users + 1)
+        }
+        failed = asyncio.run(_bench_events(app, tokens, args))
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# bench-related: 関連メモの索引の作成・差分更新・問い合わせ（メモ数の多いユーザー）と重複の検出
+# ===================================================
+_ROMAJI_SYLLABLES = ["ka", "ri", "to", "mo", "ne", "sa", "lu", "vi", "po", "de", "zu", "chi", "ha", "yo", "mi", "te"]
+_KANA = "かきくけこさしすせそたちつてとなにぬねのまみむめもらりるれろアイウエオカキクケコサシスセソ"
+
+def _vocabulary(rng: random.Random, size: int) -> list:
+    """英字・かなの架空の単語（半分ずつ）"""
+    words = set()
+    while len(words) < size:
+        if len(words) % 2:
+            words.add("".join(rng.choice(_ROMAJI_SYLLABLES) for _ in range(rng.randint(2, 4))))
+        else:
+            words.add("".join(rng.choice(_KANA) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def _related_corpus(count: int, topics: int = 500, seed: int = 0) -> list:
+    """count 件の (タイトル, 本文, 話題)。同じ話題のメモは語彙の多くを共有する"""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, 5_000)
+    topic_words = [rng.sample(vocabulary, 20) for _ in range(topics)]
+    memos = []
+    for i in range(count):
+        topic = i % topics
+        words = [rng.choice(topic_words[topic]) if rng.random() < 0.6 else rng.choice(vocabulary) for _ in range(40)]
+        memos.append((" ".join(rng.sample(topic_words[topic], 3)) + f" {i}", "、".join(words) + "。", topic))
+    return memos
+
+def _paraphrase(rng: random.Random, content: str) -> str:
+    """語の 3 割を落として並べ替えた本文"""
+    words = [w for w in content.rstrip("。").split("、") if rng.random() > 0.3]
+    rng.shuffle(words)
+    return "、".join(words) + "。"
+
+def _edit(rng: random.Random, content: str) -> str:
+    """語を 1 つ書き換えた本文（重複に近いメモ）"""
+    words = content.rstrip("。").split("、")
+    position = rng.randrange(len(words))
+    words[position] = words[position][::-1]
+    return "、".join(words) + "。"
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+def cmd_bench_related(args):
+    from related import RELATED, related_cache
+    from crud.related import get_related_index, get_related_memos, find_near_duplicates
+    from crud.memo import create_memo, delete_memo
+    from schemas.memo import MemoCreate
+
+    if not RELATED:
+        raise SystemExit("related memos are disabled (numpy is not installed or MEMO_RELATED=0)")
+    rng = random.Random(1)
+    corpus = _related_corpus(args.memos)
+    failed = []
+    with temp_engine() as bench_engine:
+        apply_sqlite_pragmas(bench_engine)
+        # 話題の数（500）はタグの数（50）の倍数のため、同じ話題のメモには同じタグが付く
+        seed(bench_engine, [1], memos=len(corpus), tags=50, tags_per_memo=1,
+             memo=lambda i: {"title": corpus[i - 1][0], "content": corpus[i - 1][1]})
+        session_factory = sessionmaker(bind=bench_engine)
+        with session_factory() as db:
+            started = time.perf_counter()
+            index = get_related_index(db, 1)
+            build = time.perf_counter() - started
+            print(f"  build     : {args.memos} memos in {build:.2f}s  index {index.nbytes / 1024 / 1024:.1f} MiB "
+                  f"(dim={index.dim})")
+
+            # 問い合わせ：索引のみ（行列とベクトルの積 + 上位 k 件）と、差分の確認・メモの行の取得を含む全体
+            query_ids = [rng.randint(1, args.memos) for _ in range(args.queries)]
+            index_times, total_times = [], []
+            for memo_id in query_ids:
+                started = time.perf_counter()
+                index.query(memo_id, args.k)
+                index_times.append(time.perf_counter() - started)
+            for memo_id in query_ids:
+                started = time.perf_counter()
+                related = get_related_memos(db, memo_id, 1, args.k)
+                total_times.append(time.perf_counter() - started)
+            same_topic = sum(corpus[r["id"] - 1][2] == corpus[memo_id - 1][2] for r in related) / max(len(related), 1)
+            for label, times in (("index", index_times), ("endpoint", total_times)):
+                print(f"  query {label:9s}: p50 {_percentile(times, 0.5) * 1000:6.2f} ms  p99 {_percentile(times, 0.99) * 1000:6.2f} ms  "
+                      f"(k={args.k}, {args.queries} queries)")
+            print(f"  last query: {len(related)} results, {same_topic:.0%} on the same topic")
+            # 目標は索引の問い合わせ（メモ数 × 次元数に比例する部分）で判定する。全体は SQLite の行の読み取り
+            # （10 件の行とタグ、数百 µs）を含み、ページキャッシュや同じマシンの他の負荷で大きくぶれるため表示のみ
+            if _percentile(index_times, 0.99) * 1000 > args.max_ms:
+                failed.append(f"p99 index query latency above {args.max_ms} ms")
+
+            # 差分更新：言い換えたメモを追加すると、次の問い合わせで反映され元のメモが最上位に来る
+            originals = rng.sample(range(1, args.memos + 1), args.probes)
+            twins = {}
+            for memo_id in originals:
+                title, content, _ = corpus[memo_id - 1]
+                twins[create_memo(db, MemoCreate(title=title, content=_paraphrase(rng, content)), 1).id] = memo_id
+            started = time.perf_counter()
+            hits = sum(
+                bool(result) and result[0]["id"] == original
+                for twin, original in twins.items()
+                for result in [get_related_memos(db, twin, 1, 5)]
+            )
+            elapsed = time.perf_counter() - started
+            print(f"  update    : {len(twins)} new memos applied incrementally; their {len(twins)} queries took {elapsed:.2f}s; "
+                  f"original memo ranked first for {hits}/{len(twins)}")
+            if hits < len(twins) * 0.9:
+                failed.append(f"paraphrased memos found their original only {hits}/{len(twins)} times")
+            if related_cache.stats()["builds"] != 1:
+                failed.append("index was rebuilt instead of updated incrementally")
+            deleted = next(iter(twins))
+            delete_memo(db, deleted, 1)
+            if any(r["id"] == deleted for r in get_related_memos(db, twins[deleted], 1, 5)):
+                failed.append("deleted memo still returned as related")
+
+            # 重複に近いメモ：語を 1 つ書き換えて複製したメモと元のメモの組を検出できるか
+            planted = set()
+            for memo_id in rng.sample(range(1, args.memos + 1), args.probes):
+                title, content, _ = corpus[memo_id - 1]
+                planted.add(frozenset((memo_id, create_memo(db, MemoCreate(title=title, content=_edit(rng, content)), 1).id)))
+            started = time.perf_counter()
+            pairs = find_near_duplicates(db, 1, args.threshold, limit=10_000)
+            elapsed = time.perf_counter() - started
+            found = {frozenset((p["a"]["id"], p["b"]["id"])) for p in pairs}
+            print(f"  duplicates: {len(pairs)} pairs >= {args.threshold} in {elapsed:.2f}s; "
+                  f"{len(planted & found)}/{len(planted)} planted pairs found")
+            if len(planted & found) < len(planted) * 0.9:
+                failed.append("planted near-duplicate pairs were not detected")
+    if failed:
+        raise SystemExit("FAILED: " + "; ".join(failed))
+    print("OK")
+
+# ===================================================
+# コマンドの登録（manage.py の main から呼ぶ）
+# ===================================================
+def register_bench_commands(sub):
+    p = sub.add_parser("bench-search", help="benchmark LIKE scan vs FTS5 search")
+    p.add_argument("--memos", type=int, default=100_000)
+    p.add_argument("--keyword", default="請求書")
+    p.add_argument("--hit-ratio", type=float, default=0.001)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=cmd_bench_search)
+
+    p = sub.add_parser("check-queries", help="assert GET /memos issues a constant number of queries")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 200])
+    p.set_defaults(func=cmd_check_queries)
+
+    p = sub.add_parser("check-serialization", help="assert the fast list serializer matches response_model output byte for byte")
+    p.set_defaults(func=cmd_check_serialization)
+
+    p = sub.add_parser("bench-serialize", help="benchmark list serialization: response_model vs fast path")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=cmd_bench_serialize)
+
+    p = sub.add_parser("bench-writes", help="benchmark concurrent writes with and without the single writer")
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--writes", type=int, default=100)
+    p.set_defaults(func=cmd_bench_writes)
+
+    p = sub.add_parser("check-write-queue", help="assert post-commit hooks of queued writes run only after the batch COMMIT")
+    p.set_defaults(func=cmd_check_write_queue)
+
+    p = sub.add_parser("bench-batch", help="benchmark batch memo endpoints vs single-item loops")
+    p.add_argument("--items", type=int, default=500)
+    p.set_defaults(func=cmd_bench_batch)
+
+    p = sub.add_parser("bench-export", help="export/import a large fixture and assert peak RSS stays bounded")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--max-rss-mb", type=float, default=100.0)
+    p.set_defaults(func=cmd_bench_export)
+
+    p = sub.add_parser("bench-links", help="benchmark URL/domain/file path lookups and assert they use the index")
+    p.add_argument("--memos", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_bench_links)
+
+    p = sub.add_parser("bench-admin-users", help="benchmark the paginated admin user list with usage stats")
+    p.add_argument("--users", type=int, default=100_000)
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=cmd_bench_admin_users)
+
+    p = sub.add_parser("bench-compression", help="file size and read / write latency with and without content compression")
+    p.add_argument("--memos", type=int, default=2000)
+    p.add_argument("--reads", type=int, default=2000)
+    p.set_defaults(func=cmd_bench_compression)
+
+    p = sub.add_parser("bench-list-fields", help="response size and DB reads of the memo list with and without fields=")
+    p.add_argument("--memos", type=int, default=2000)
+    p.add_argument("--content-chars", type=int, default=20_000)
+    p.add_argument("--page-size", type=int, default=50)
+    p.add_argument("--min-ratio", type=float, default=10.0)
+    p.set_defaults(func=cmd_bench_list_fields)
+
+    p = sub.add_parser("bench-delete-user", help="time deleting a large account: one transaction vs background chunks")
+    p.add_argument("--memos", type=int, default=200_000)
+    p.add_argument("--chunk-size", type=int, default=USER_DELETE_CHUNK_SIZE)
+    p.add_argument("--max-chunk-ms", type=float, default=500.0)
+    p.set_defaults(func=cmd_bench_delete_user)
+
+    p = sub.add_parser("bench-attachments", help="stream a large upload with bounded memory, check dedupe and reference-counted cleanup")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--chunk-kb", type=int, default=64)
+    p.add_argument("--max-rss-mb", type=float, default=16.0)
+    p.set_defaults(func=cmd_bench_attachments)
+
+    p = sub.add_parser("bench-cold-start", help="time from process start to the first response: import-time init vs migrated schema with pool prewarm")
+    p.add_argument("--memos", type=int, default=2000)
+    p.add_argument("--runs", type=int, default=7)
+    p.set_defaults(func=cmd_bench_cold_start)
+
+    p = sub.add_parser("bench-shards", help="aggregate write throughput by number of concurrent users: single file vs per-user shards")
+    p.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--seconds", type=float, default=3.0)
+    p.set_defaults(func=cmd_bench_shards)
+
+    p = sub.add_parser("bench-events", help="memory cost of idle /events subscribers; delivery, heartbeats, slow consumers and cleanup")
+    p.add_argument("--subscribers", type=int, default=5000)
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--max-kb", type=float, default=48.0, help="fail above this python heap per idle subscriber")
+    p.set_defaults(func=cmd_bench_events)
+
+    p = sub.add_parser("bench-related", help="related-memo index build, incremental update and top-k query latency for a large account")
+    p.add_argument("--memos", type=int, default=50_000)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--probes", type=int, default=50, help="paraphrased memos added after the build")
+    p.add_argument("--threshold", type=float, default=0.85, help="near-duplicate similarity threshold")
+    p.add_argument("--max-ms", type=float, default=10.0,
+                   help="fail above this p99 index query latency (the endpoint latency, which adds the row reads, is reported only)")
+    p.set_defaults(func=cmd_bench_related)
@@ -0,0 +1,137 @@
+# fastapi-app/bench/seed.py
+# 計測・検証コマンド用のデータ投入（移行済みの一時 DB と、ユーザー・タグ・カテゴリ・メモの一括 INSERT）
+
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from db import enable_foreign_keys
+from compression import enable_memo_text
+from migrations import migrate
+from models.memo import memo_preview
+
+# 1 トランザクションで投入するメモの件数
+SEED_CHUNK_SIZE = 10_000
+
+_NOW = {"created_at": "CURRENT_TIMESTAMP", "updated_at": "CURRENT_TIMESTAMP"}
+
+def create_db(path: str):
+    """path に移行済みの DB を作り、そのエンジンを返す（接続ごとの設定はアプリと同じ）"""
+    bind = create_engine(f"sqlite:///{path}")
+    enable_foreign_keys(bind)
+    enable_memo_text(bind)
+    migrate(bind)
+    return bind
+
+@contextmanager
+def temp_engine():
+    """計測用の一時 DB（with ブロックを出ると削除）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        bind = create_db(os.path.join(tmp, "bench.db"))
+        try:
+            yield bind
+        finally:
+            bind.dispose()
+
+def insert_rows(conn, table: str, rows: list, **sql):
+    """rows（列名 → 値の dict、列は全行で共通）を 1 文で INSERT する
+
+    sql は rows に無い列の SQL 式（例: created_at="CURRENT_TIMESTAMP"）。
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    expressions = {column: expr for column, expr in sql.items() if column not in columns}
+    conn.execute(
+        text(f"INSERT INTO {table} ({', '.join(columns + list(expressions))}) "
+             f"VALUES ({', '.join([f':{c}' for c in columns] + list(expressions.values()))})"),
+        rows,
+    )
+
+def _default_memo(i: int) -> dict:
+    return {"title": f"memo{i}", "content": "x", "file_paths": "[]", "urls": "[]", "important": 1}
+
+def seed(bind, user_ids, memos: int = 0, tags: int = 0, categories: int = 0, tags_per_memo: int = 0,
+         memo=None, create_users: bool = True, chunk: int = SEED_CHUNK_SIZE):
+    """user_ids の各ユーザーにタグ tags 件・カテゴリ categories 件・メモ memos 件を作る
+
+    - ユーザー名は user{id:06d}（create_users=False なら既存のユーザーに追加する）。タグ・カテゴリ名は u{id}-tag{k} / u{id}-cat{k}
+    - メモ・タグ・カテゴリの ID は既存の最大値の続きから振る。メモ i（ID）の列は memo(i) の dict で既定値を上書きし、
+      "category" にはそのユーザーのカテゴリの位置（0 始まり）を指定できる
+    - メモ i にはそのユーザーのタグ (i + k) % tags 番目（k < tags_per_memo）を付ける
+    - chunk 件のメモごとにコミットする（大量のデータを 1 つのトランザクションにしない）
+    """
+    with bind.connect() as conn:
+        next_id = {
+            table: conn.execute(text(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")).scalar()
+            for table in ("memos", "tags", "categories")
+        }
+    pending = {"users": [], "tags": [], "categories": [], "memos": [], "memo_tags": []}
+
+    def flush():
+        with bind.begin() as conn:
+            for table, rows in pending.items():
+                insert_rows(conn, table, rows, **(_NOW if table in ("tags", "categories", "memos") else {}))
+                rows.clear()
+
+    for user_id in user_ids:
+        if create_users:
+            pending["users"].append({"id": user_id, "username": f"user{user_id:06d}", "hashed_password": "x", "role": "user"})
+        tag_ids = list(range(next_id["tags"], next_id["tags"] + tags))
+        category_ids = list(range(next_id["categories"], next_id["categories"] + categories))
+        next_id["tags"] += tags
+        next_id["categories"] += categories
+        pending["tags"].extend({"id": t, "name": f"u{user_id}-tag{k}", "user_id": user_id} for k, t in enumerate(tag_ids))
+        pending["categories"].extend({"id": c, "name": f"u{user_id}-cat{k}", "user_id": user_id} for k, c in enumerate(category_ids))
+        for i in range(next_id["memos"], next_id["memos"] + memos):
+            row = {**_default_memo(i), **(memo(i) if memo else {}), "id": i, "user_id": user_id}
+            if "category" in row:
+                row["category_id"] = category_ids[row.pop("category")]
+            row["preview"] = memo_preview(row["content"])
+            pending["memos"].append(row)
+            pending["memo_tags"].extend({"memo_id": i, "tag_id": tag_ids[(i + k) % tags]} for k in range(tags_per_memo))
+            if len(pending["memos"]) >= chunk:
+                flush()
+        next_id["memos"] += memos
+    flush()
+
+def account_memo(i: int) -> dict:
+    """URL・ファイルパス・カテゴリ付きのメモ（seed(..., tags=10, categories=5, tags_per_memo=3, memo=account_memo) と使う）"""
+    return {"content": "本文 " * 40, "category": i % 5, "file_paths": f'["/docs/{i}.txt"]', "urls": f'["https://example.com/{i}"]'}
+
+def seed_contract(bind):
+    """文字種・NULL・マイクロ秒・タグ数などの境界を含むデータ（高速経路のシリアライズと response_model の比較用）"""
+    base = datetime(2024, 1, 2, 3, 4, 5)
+    with bind.begin() as conn:
+        insert_rows(conn, "users", [
+            {"id": 1, "username": "a", "hashed_password": "x", "role": "user"},
+            {"id": 2, "username": "b", "hashed_password": "x", "role": "user"},
+        ])
+        insert_rows(conn, "categories", [
+            {"id": 1, "name": "仕事", "description": None, "user_id": 1, "created_at": base, "updated_at": base},
+            {"id": 2, "name": 'quote " \\ /', "description": "改行\nタブ\t\u2028", "user_id": 1,
+             "created_at": base + timedelta(microseconds=5), "updated_at": base + timedelta(microseconds=5)},
+        ])
+        insert_rows(conn, "tags", [
+            {"id": 1, "name": "重要", "color": "#ff0000", "user_id": 1, "created_at": base, "updated_at": base},
+            {"id": 2, "name": "emoji 🎉", "color": None, "user_id": 1,
+             "created_at": base + timedelta(microseconds=120000), "updated_at": base + timedelta(microseconds=120000)},
+            {"id": 3, "name": "other", "color": None, "user_id": 2, "created_at": base, "updated_at": base},
+        ])
+    seed(bind, [1], memos=40, create_users=False, memo=lambda i: {
+        "title": ["メモ", "<script>&amp;</script>", "\x01 control", "𠮷野家"][i % 4] + str(i),
+        "content": None if i % 3 == 0 else "本文 " * i,
+        "category_id": [None, 1, 2][i % 3],
+        "file_paths": '[]' if i % 2 else '["C:\\\\docs\\\\a.txt", "/tmp/ファイル"]',
+        "urls": '[]' if i % 5 else '["https://example.com/?q=1&r=\\u00e9"]',
+        "important": i % 2,
+        "created_at": base + timedelta(seconds=i // 2, microseconds=(i * 12345) % 1_000_000),
+        "updated_at": base + timedelta(seconds=i // 2, microseconds=(i * 12345) % 1_000_000),
+    })
+    with bind.begin() as conn:
+        insert_rows(conn, "memo_tags", [
+            {"memo_id": i, "tag_id": t} for i in range(1, 41) for t in ([], [1], [2, 1], [1, 2, 3])[i % 4]
+        ])
@@ -0,0 +1,93 @@
+# fastapi-app/bootstrap_cache.py
+# /bootstrap の応答キャッシュ：ユーザーごとにシリアライズ済みのバイト列を変更連番とともに保持する
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import defer_until_commit, pop_committed
+
+def bootstrap_etag(user_id: int, seq: int) -> str:
+    """ETag はユーザーの変更連番（差分同期の token）：連番を読むだけで 304 を判定でき、どのワーカーでも同じ値になる"""
+    return f'"{user_id}-{seq}"'
+
+class BootstrapCache:
+    """ユーザー ID をキーにした LRU キャッシュ（変更連番が一致する場合のみ使う）
+
+    連番はメモ・タグ・カテゴリの変更ごとにトリガーで進むため、別のワーカーでの書き込みでも古い結果は使われない。
+    書き込みのコミットでの破棄はメモリを早めに空けるためのもの。
+    """
+
+    def __init__(self, maxsize: int = 1_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self._entries: OrderedDict[int, tuple[int, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, seq: int) -> bytes | None:
+        """連番 seq の時点の本文（無い・連番が異なれば None）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != seq:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: int, seq: int, body: bytes):
+        """body を連番 seq の時点の本文として保存する（より新しい連番の本文があれば保存しない）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > seq:
+                return
+            self._entries[user_id] = (seq, body)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self, body_size: int):
+        with self._lock:
+            self.not_modified += 1
+            self.bytes_saved += body_size
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "not_modified": self.not_modified,
+                "bytes_saved": self.bytes_saved,
+            }
+
+bootstrap_cache = BootstrapCache()
+
+def mark_dirty(db: Session, user_id: int):
+    """このセッションのコミット時に user_id のキャッシュを破棄する
+
+    ライターキューでは CRUD 内の commit() は flush、書き込みごとの SAVEPOINT の解放でも after_commit が発火するため、
+    最も外側のコミットを待ってから破棄する（db.defer_until_commit）。
+    """
+    defer_until_commit(db, "bootstrap_dirty", user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_dirty(session):
+    for user_id in set(pop_committed(session, "bootstrap_dirty")):
+        bootstrap_cache.invalidate_user(user_id)
@@ -0,0 +1,115 @@
+# fastapi-app/compression.py
+# メモ本文（memos.content）の透過圧縮：一定サイズ以上の本文を zlib で圧縮して BLOB として保存する
+# 平文の行は TEXT のまま（既存の行はそのまま読める）。圧縮した行は BLOB で、先頭 1 バイトが形式を表す
+#
+# SQL からは memo_text(content) で平文を得る（全文検索・LIKE 検索が使用。一覧用プレビューは書き込み時にアプリが設定する）。
+# この関数は接続ごとに登録する必要があり、登録していない接続（sqlite3 コマンド等）からは全文検索のトリガーが動く
+# 書き込み（メモの追加・削除、タイトル・本文の変更）ができない。その他の列の変更と読み取りはできる
+
+import os
+import zlib
+
+from sqlalchemy import event, text
+from sqlalchemy.types import Text, TypeDecorator
+
+# 0 にすると書き込み時に圧縮しない（圧縮済みの行は引き続き読める）
+COMPRESSION = os.getenv("MEMO_COMPRESSION", "1") == "1"
+
+# これ未満（UTF-8 のバイト数）の本文は圧縮しない（短い本文は縮まず、展開の手間だけが増えるため）
+COMPRESS_MIN_BYTES = int(os.getenv("MEMO_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = 6
+
+# 圧縮後がこの割合を超える場合は平文のまま保存する（圧縮の効かない本文）
+COMPRESS_MAX_RATIO = 0.9
+
+# 既存メモを圧縮し直すときの 1 トランザクションあたりの件数
+RECOMPRESS_BATCH_SIZE = 500
+
+_ZLIB = b"\x01"  # 形式マーカー（先頭 1 バイト）
+
+def compress_content(value: str | None):
+    """閾値以上で十分に縮む本文は圧縮した bytes、それ以外は str のまま返す"""
+    if value is None:
+        return None
+    raw = value.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return value
+    packed = _ZLIB + zlib.compress(raw, COMPRESS_LEVEL)
+    if len(packed) > len(raw) * COMPRESS_MAX_RATIO:
+        return value
+    return packed
+
+def decompress_content(value) -> str | None:
+    """DB に保存された本文（str または圧縮済み bytes）を平文に戻す"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:1] == _ZLIB:
+        return zlib.decompress(value[1:]).decode("utf-8")
+    raise ValueError(f"unknown content encoding: {value[:1]!r}")
+
+class CompressedText(TypeDecorator):
+    """Memo.content の列型：書き込み時に圧縮し、SELECT した場合のみ展開する"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_content(value) if COMPRESSION else value
+
+    def process_result_value(self, value, dialect):
+        return decompress_content(value)
+
+def enable_memo_text(bind):
+    """接続ごとに SQL 関数 memo_text(content) を登録する（全文検索のトリガー・ビューが使用）"""
+    @event.listens_for(bind, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("memo_text", 1, decompress_content, deterministic=True)
+
+def _compressible(conn, after: int, batch_size: int):
+    """id > after のメモを id 順に batch_size 件調べ、(最後の id, 調べた件数, 圧縮する行) を返す"""
+    rows = conn.execute(
+        text(
+            "SELECT id, CASE WHEN typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= :min_bytes "
+            "THEN content END AS content FROM memos WHERE id > :after ORDER BY id LIMIT :n"
+        ),
+        {"after": after, "n": batch_size, "min_bytes": COMPRESS_MIN_BYTES},
+    ).all()
+    updates = []
+    for memo_id, content in rows:
+        packed = compress_content(content) if content is not None else None
+        if isinstance(packed, bytes):
+            updates.append({"id": memo_id, "content": packed, "plain_bytes": len(content.encode("utf-8"))})
+    return (rows[-1].id if rows else None), len(rows), updates
+
+# 本文の保存形式を変えるだけで平文は変わらないため、差分同期の採番・全文検索の再索引は行わない
+_SKIPPED_TRIGGERS = ("memos_sync_au", "memos_fts_au")
+
+def recompress_memos(engine, batch_size: int = RECOMPRESS_BATCH_SIZE) -> dict:
+    """平文で保存されている既存メモの本文を圧縮する（id 順に batch_size 件ずつ別トランザクション）
+
+    各トランザクション内で上記のトリガーを削除して作り直す（コミット前に戻すため、他の接続からは
+    トリガーの無い状態は見えない）。途中で中断しても再実行すればよい。
+    {scanned, compressed, bytes_before, bytes_after} を返す。
+    """
+    stats = {"scanned": 0, "compressed": 0, "bytes_before": 0, "bytes_after": 0}
+    names = ", ".join(f"'{name}'" for name in _SKIPPED_TRIGGERS)
+    after = 0
+    while True:
+        with engine.begin() as conn:
+            last_id, scanned, updates = _compressible(conn, after, batch_size)
+            if last_id is None:
+                return stats
+            if updates:
+                triggers = conn.execute(
+                    text(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({names})")
+                ).all()
+                for name, _ in triggers:
+                    conn.execute(text(f"DROP TRIGGER {name}"))
+                conn.execute(text("UPDATE memos SET content = :content WHERE id = :id"), updates)
+                for _, sql in triggers:
+                    conn.execute(text(sql))
+        stats["scanned"] += scanned
+        stats["compressed"] += len(updates)
+        stats["bytes_before"] += sum(u["plain_bytes"] for u in updates)
+        stats["bytes_after"] += sum(len(u["content"]) for u in updates)
+        after = last_id
@@ -0,0 +1,78 @@
+# fastapi-app/counters.py
+# タグ・カテゴリの使用数（memo_count）：memo_tags / memos のトリガーで同じトランザクション内に増減させる
+# （ORM を通らない一括 INSERT / UPDATE / DELETE やタグの付け替えでもずれない）
+
+from sqlalchemy import text
+
+# テーブル → 実際の件数を数えるサブクエリ（id ごとの件数）
+COUNTER_SOURCES = {
+    "tags": "SELECT tag_id AS id, COUNT(*) AS n FROM memo_tags GROUP BY tag_id",
+    "categories": "SELECT category_id AS id, COUNT(*) AS n FROM memos WHERE category_id IS NOT NULL GROUP BY category_id",
+}
+
+_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS memo_tags_count_ai AFTER INSERT ON memo_tags BEGIN
+        UPDATE tags SET memo_count = memo_count + 1 WHERE id = new.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memo_tags_count_ad AFTER DELETE ON memo_tags BEGIN
+        UPDATE tags SET memo_count = memo_count - 1 WHERE id = old.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_count_ai AFTER INSERT ON memos
+    WHEN new.category_id IS NOT NULL BEGIN
+        UPDATE categories SET memo_count = memo_count + 1 WHERE id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_count_ad AFTER DELETE ON memos
+    WHEN old.category_id IS NOT NULL BEGIN
+        UPDATE categories SET memo_count = memo_count - 1 WHERE id = old.category_id;
+    END
+    """,
+    # カテゴリの変更（NULL との間の変更を含む）
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_count_au AFTER UPDATE OF category_id ON memos
+    WHEN new.category_id IS NOT old.category_id BEGIN
+        UPDATE categories SET memo_count = memo_count - 1 WHERE id = old.category_id;
+        UPDATE categories SET memo_count = memo_count + 1 WHERE id = new.category_id;
+    END
+    """,
+]
+
+def init_counters(engine):
+    """既存 DB に memo_count 列を追加してトリガーを作成する
+
+    列を追加した場合と、トリガーが無かった（テーブルの作り直し等で件数が追従していない）場合は集計し直す。
+    """
+    with engine.begin() as conn:
+        stale = not conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'memo_tags_count_ai'")
+        ).first()
+        for table in COUNTER_SOURCES:
+            columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+            if "memo_count" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN memo_count INTEGER NOT NULL DEFAULT 0"))
+                stale = True
+        for ddl in _TRIGGERS:
+            conn.execute(text(ddl))
+    if stale:
+        reconcile_counters(engine)
+
+def reconcile_counters(engine, fix: bool = True) -> list[dict]:
+    """実際の件数と食い違うカウンタを返す（fix=True なら同じトランザクションで修正）"""
+    drift = []
+    with engine.begin() as conn:
+        for table, source in COUNTER_SOURCES.items():
+            rows = conn.execute(text(
+                f"SELECT t.id, t.user_id, t.name, t.memo_count AS stored, COALESCE(a.n, 0) AS actual "
+                f"FROM {table} t LEFT JOIN ({source}) a ON a.id = t.id "
+                f"WHERE t.memo_count != COALESCE(a.n, 0)"
+            )).mappings().all()
+            if fix and rows:
+                conn.execute(text(f"UPDATE {table} SET memo_count = :actual WHERE id = :id"), [dict(r) for r in rows])
+            drift.extend({"table": table, **r} for r in rows)
+    return drift
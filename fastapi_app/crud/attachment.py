@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from sqlalchemy import insert, delete
+from sqlalchemy.orm import Session
+from models.memo import Memo
+from models.attachment import Blob, MemoAttachment
+
+def memo_exists(db: Session, memo_id: int, user_id: int) -> bool:
+    return db.query(Memo.id).filter(Memo.id == memo_id, Memo.user_id == user_id).first() is not None
+
+def get_attachments(db: Session, memo_id: int, user_id: int):
+    """メモの添付ファイル一覧（メモが無ければ None）"""
+    if not memo_exists(db, memo_id, user_id):
+        return None
+    return (
+        db.query(MemoAttachment)
+        .filter(MemoAttachment.memo_id == memo_id, MemoAttachment.user_id == user_id)
+        .order_by(MemoAttachment.id)
+        .all()
+    )
+
+def get_attachment(db: Session, memo_id: int, attachment_id: int, user_id: int):
+    return db.query(MemoAttachment).filter(
+        MemoAttachment.id == attachment_id,
+        MemoAttachment.memo_id == memo_id,
+        MemoAttachment.user_id == user_id,
+    ).first()
+
+def create_attachment(db: Session, memo_id: int, user_id: int, staged, filename: str, content_type: str):
+    """受信済みのアップロード（attachments.StagedUpload）をメモに添付する（メモが無ければ None）"""
+    if not memo_exists(db, memo_id, user_id):
+        return None
+    # 先に blobs へ書き込んで書き込みロックを取ってからファイルを配置する（GC と競合しない）
+    db.execute(
+        insert(Blob).prefix_with("OR IGNORE"),
+        {"sha256": staged.sha256, "size": staged.size, "created_at": datetime.utcnow()},
+    )
+    staged.place()
+    db_attachment = MemoAttachment(
+        memo_id=memo_id,
+        user_id=user_id,
+        sha256=staged.sha256,
+        filename=filename,
+        content_type=content_type,
+        size=staged.size,
+    )
+    db.add(db_attachment)
+    db.commit()
+    db.refresh(db_attachment)
+    return db_attachment
+
+def delete_attachment(db: Session, memo_id: int, attachment_id: int, user_id: int):
+    # blobs.ref_count はトリガーで減り、参照されなくなった実体は GC（attachments.py）が削除する
+    deleted = db.execute(
+        delete(MemoAttachment)
+        .where(MemoAttachment.id == attachment_id, MemoAttachment.memo_id == memo_id, MemoAttachment.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
+        return None
+    db.commit()
+    return True
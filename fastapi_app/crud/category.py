@@ -1,9 +1,19 @@
+from sqlalchemy import select, delete
 from sqlalchemy.orm import Session
 from models.category import Category
 from schemas.category import CategoryCreate, CategoryUpdate
+from bootstrap_cache import mark_dirty
+from events import emit_change
 
 def get_categories(db: Session, user_id: int):
-    return db.query(Category).filter(Category.user_id == user_id).all()
+    return db.query(Category).filter(Category.user_id == user_id).order_by(Category.id).all()
+
+# --- 高速一覧用：ORM オブジェクトを作らず CategoryResponse と同じキー順の dict を返す ---
+CATEGORY_ROW_COLUMNS = (Category.name, Category.description, Category.id, Category.user_id, Category.created_at, Category.updated_at, Category.memo_count)
+
+def get_category_rows(db: Session, user_id: int):
+    rows = db.execute(select(*CATEGORY_ROW_COLUMNS).where(Category.user_id == user_id).order_by(Category.id))
+    return [dict(row._mapping) for row in rows]
 
 def get_category(db: Session, category_id: int, user_id: int):
     return db.query(Category).filter(Category.id == category_id, Category.user_id == user_id).first()
@@ -15,6 +25,9 @@ def create_category(db: Session, category: CategoryCreate, user_id: int):
         user_id=user_id
     )
     db.add(db_category)
+    db.flush()
+    emit_change(db, user_id, "category", "create", [db_category.id])
+    mark_dirty(db, user_id)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -25,14 +38,21 @@ def update_category(db: Session, category_id: int, category: CategoryUpdate, use
         return None
     db_category.name = category.name
     db_category.description = category.description
+    emit_change(db, user_id, "category", "update", [category_id])
+    mark_dirty(db, user_id)
     db.commit()
     db.refresh(db_category)
     return db_category
 
 def delete_category(db: Session, category_id: int, user_id: int):
-    db_category = get_category(db, category_id, user_id)
-    if not db_category:
+    # 属するメモの category_id は外部キーの ON DELETE SET NULL で同じ文の中で NULL になる
+    deleted = db.execute(
+        delete(Category).where(Category.id == category_id, Category.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
         return None
-    db.delete(db_category)
+    emit_change(db, user_id, "category", "delete", [category_id])
+    mark_dirty(db, user_id)
     db.commit()
     return True
@@ -0,0 +1,30 @@
+# crud/category.py の非同期版（AsyncSession.run_sync で同期版を実行）
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import USE_WRITE_QUEUE
+from write_queue import write_queue
+from crud import category as category_crud
+from schemas.category import CategoryCreate, CategoryUpdate
+
+async def get_categories(db: AsyncSession, user_id: int):
+    return await db.run_sync(category_crud.get_categories, user_id)
+
+async def get_category_rows(db: AsyncSession, user_id: int):
+    return await db.run_sync(category_crud.get_category_rows, user_id)
+
+async def get_category(db: AsyncSession, category_id: int, user_id: int):
+    return await db.run_sync(category_crud.get_category, category_id, user_id)
+
+async def create_category(db: AsyncSession, category: CategoryCreate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(category_crud.create_category, category, user_id)
+    return await db.run_sync(category_crud.create_category, category, user_id)
+
+async def update_category(db: AsyncSession, category_id: int, category: CategoryUpdate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(category_crud.update_category, category_id, category, user_id)
+    return await db.run_sync(category_crud.update_category, category_id, category, user_id)
+
+async def delete_category(db: AsyncSession, category_id: int, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(category_crud.delete_category, category_id, user_id)
+    return await db.run_sync(category_crud.delete_category, category_id, user_id)
@@ -1,13 +1,269 @@
-from sqlalchemy.orm import Session
-from models.memo import Memo
+import base64
+import json
+from datetime import datetime
+from typing import Literal
+
+from sqlalchemy import and_, or_, text, select, insert, update, delete, literal, union_all, bindparam
+from sqlalchemy.orm import Session, selectinload
+from models.memo import Memo, MemoUrl, MemoFile, memo_tags, memo_preview
 from models.tag import Tag
-from schemas.memo import MemoCreate, MemoUpdate
+from crud.tag import TAG_ROW_COLUMNS
+from models.category import Category
+from schemas.memo import MemoCreate, MemoUpdate, MemoPatch
+from fts import FTS_MIN_TOKEN_LENGTH
+from bootstrap_cache import mark_dirty
+from events import emit_change
+
+# --- タグは結果全体をまとめて 1 クエリで取得（メモごとの遅延ロードを防ぐ） ---
+def _memo_query(db: Session):
+    return db.query(Memo).options(selectinload(Memo.tags))
+
+# --- 一覧のソート順：名前 -> (キーセットの列, 降順か)。列は全て同じ向きに並べる（複合インデックスをそのまま使う） ---
+MEMO_SORTS = {
+    "updated_desc": ((Memo.updated_at, Memo.id), True),
+    "updated_asc": ((Memo.updated_at, Memo.id), False),
+    "created_desc": ((Memo.created_at, Memo.id), True),
+    "created_asc": ((Memo.created_at, Memo.id), False),
+    "important_desc": ((Memo.important, Memo.updated_at, Memo.id), True),
+    "important_asc": ((Memo.important, Memo.updated_at, Memo.id), False),
+}
+MemoSort = Literal["updated_desc", "updated_asc", "created_desc", "created_asc", "important_desc", "important_asc"]
+_DATETIME_KEYS = {"updated_at", "created_at"}
+
+# --- カーソル（不透明トークン）：ソート順と最後の行のキーの値 ---
+def encode_cursor(memo, sort: str) -> str:
+    keys, _ = MEMO_SORTS[sort]
+    values = [getattr(memo, c.key) for c in keys]
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps({"s": sort, "k": values})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if data["s"] != sort:
+            raise ValueError("cursor does not match sort order")
+        # 以前の形式（(updated_at, id) のみ）のカーソルも受け付ける
+        values = data["k"] if "k" in data else [data["u"], data["i"]]
+        keys, _ = MEMO_SORTS[sort]
+        if len(values) != len(keys):
+            raise ValueError("cursor does not match sort order")
+        return [
+            datetime.fromisoformat(v) if c.key in _DATETIME_KEYS else int(v)
+            for c, v in zip(keys, values)
+        ]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _after_cursor(keys, values, descending: bool):
+    """キーの組が values より後ろ（並び順で）の行の条件。キーは全て NOT NULL（範囲検索でインデックスを使う）"""
+    column, value = keys[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(keys) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _after_cursor(keys[1:], values[1:], descending)))
+
+def normalize_domain(domain: str) -> str:
+    """memo_urls.domain と同じ形（小文字、末尾のドットなし）にそろえる"""
+    return domain.strip().lower().rstrip(".")
+
+def _filter_memos(
+    query,
+    user_id: int,
+    category_id: int | None = None,
+    tag_id: int | None = None,
+    important: int | None = None,
+    url: str | None = None,
+    domain: str | None = None,
+    file_path: str | None = None,
+    sort: str = "updated_desc",
+    cursor: str | None = None,
+):
+    """一覧の絞り込み・キーセット条件・並び順を適用する（Query / Select 共通）"""
+    if sort not in MEMO_SORTS:
+        raise ValueError("Invalid sort")
+    keys, descending = MEMO_SORTS[sort]
+
+    # URL / ドメイン / ファイルパス：検索用テーブル側で本人の行に絞り、memos は主キーで引く
+    # （memos.user_id でも絞ると、そのユーザーの全メモをインデックス走査する計画になる）
+    linked = []
+    if url is not None:
+        linked.append(select(MemoUrl.memo_id).where(MemoUrl.user_id == user_id, MemoUrl.url == url))
+    if domain is not None:
+        linked.append(select(MemoUrl.memo_id).where(MemoUrl.user_id == user_id, MemoUrl.domain == normalize_domain(domain)))
+    if file_path is not None:
+        linked.append(select(MemoFile.memo_id).where(MemoFile.user_id == user_id, MemoFile.path == file_path))
+    if linked:
+        for memo_ids in linked:
+            query = query.filter(Memo.id.in_(memo_ids))
+    else:
+        query = query.filter(Memo.user_id == user_id)
+
+    if category_id is not None:
+        query = query.filter(Memo.category_id == category_id)
+    if tag_id is not None:
+        query = query.filter(Memo.tags.any(Tag.id == tag_id))
+    if important is not None:
+        query = query.filter(Memo.important == important)
+
+    if cursor:
+        query = query.filter(_after_cursor(keys, decode_cursor(cursor, sort), descending))
+
+    return query.order_by(*(c.desc() if descending else c.asc() for c in keys))
+
+def get_memos(db: Session, user_id: int, sort: str = "updated_desc", limit: int = 50, **filters):
+    """フィルタ + キーセットページング。(memos, next_cursor) を返す"""
+    query = _filter_memos(_memo_query(db), user_id, sort=sort, **filters)
+
+    # 1件多く取得して次ページの有無を判定
+    memos = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(memos) > limit:
+        memos = memos[:limit]
+        next_cursor = encode_cursor(memos[-1], sort)
+    return memos, next_cursor
+
+# --- 高速一覧用：列の射影から MemoResponse と同じキー順の dict を組み立てる ---
+# （ORM オブジェクトの生成と response_model による再検証を省く。tag_ids は応答では常に空）
+MEMO_ROW_COLUMNS = (
+    Memo.title, Memo.content, Memo.category_id, Memo.file_paths, Memo.urls, Memo.important,
+    Memo.id, Memo.user_id, Memo.created_at, Memo.updated_at,
+)
+_TAG_CHUNK_SIZE = 500  # SQLite のパラメータ数上限に収まるよう IN を分割
+_TAG_KEYS = tuple(c.key for c in TAG_ROW_COLUMNS)
+# 呼び出しごとに文を組み立てない（一覧・関連メモで毎回使う。組み立てが SQLite の実行より重い）
+_MEMO_TAG_ROWS = (
+    select(memo_tags.c.memo_id, *TAG_ROW_COLUMNS)
+    .join(Tag, Tag.id == memo_tags.c.tag_id)
+    .where(memo_tags.c.memo_id.in_(bindparam("memo_ids", expanding=True)))
+    .order_by(memo_tags.c.memo_id, Tag.id)
+)
+
+def get_memo_tag_rows(db: Session, memo_ids: list[int]) -> dict:
+    """memo_id -> [タグの dict]（Memo.tags と同じく tag.id 順）"""
+    tags_by_memo = {}
+    for start in range(0, len(memo_ids), _TAG_CHUNK_SIZE):
+        rows = db.execute(_MEMO_TAG_ROWS, {"memo_ids": memo_ids[start:start + _TAG_CHUNK_SIZE]})
+        for memo_id, *tag in rows:
+            tags_by_memo.setdefault(memo_id, []).append(dict(zip(_TAG_KEYS, tag)))
+    return tags_by_memo
+
+# --- 一覧の項目指定（fields=）：MemoResponse の項目と preview（本文の先頭）から選ぶ ---
+MEMO_LIST_FIELDS = (
+    "title", "content", "preview", "category_id", "file_paths", "urls", "important", "tag_ids",
+    "id", "user_id", "created_at", "updated_at", "tags",
+)
+MEMO_DEFAULT_FIELDS = tuple(f for f in MEMO_LIST_FIELDS if f != "preview")  # 未指定時（従来通り）
+_MEMO_FIELD_COLUMNS = {c.key: c for c in MEMO_ROW_COLUMNS + (Memo.preview,)}
+
+def parse_memo_fields(fields: str | None) -> tuple:
+    """カンマ区切りの項目名を MEMO_LIST_FIELDS の順に並べて返す（id は常に含める）"""
+    if not fields:
+        return MEMO_DEFAULT_FIELDS
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(MEMO_LIST_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(f for f in MEMO_LIST_FIELDS if f in requested)
+
+def get_memo_rows(db: Session, user_id: int, sort: str = "updated_desc", limit: int = 50,
+                  fields: tuple = MEMO_DEFAULT_FIELDS, **filters):
+    """get_memos と同じ条件で (dict のリスト, next_cursor) を返す
+
+    fields に無い列は SELECT しない（content を含めなければ本文のオーバーフローページを読まない。
+    preview は memos の行内で content より前に保存されている）。
+    並び順のキー（updated_at / created_at / important と id）はカーソル用に常に取得する（並び順ごとの複合インデックスから読める）。
+    """
+    if sort not in MEMO_SORTS:
+        raise ValueError("Invalid sort")
+    keys = [c for c in MEMO_SORTS[sort][0] if c.key not in fields]
+    columns = [_MEMO_FIELD_COLUMNS[f] for f in fields if f in _MEMO_FIELD_COLUMNS]
+    stmt = _filter_memos(select(*keys, *columns), user_id, sort=sort, **filters)
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], sort)
+
+    tags_by_memo = get_memo_tag_rows(db, [row.id for row in rows]) if "tags" in fields else {}
+    items = []
+    for row in rows:
+        values = row._mapping
+        item = {}
+        for f in fields:
+            if f == "tags":
+                item[f] = tags_by_memo.get(row.id, [])
+            elif f == "tag_ids":
+                item[f] = []
+            else:
+                item[f] = values[f]
+        items.append(item)
+    return items, next_cursor
+
+# --- 全文検索（FTS5 + BM25） ---
+def _fts_phrase(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+def _like_pattern(token: str) -> str:
+    escaped = token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def search_memos(db: Session, user_id: int, q: str, limit: int = 20, offset: int = 0):
+    """キーワード検索。[(memo, title_highlight, snippet, rank), ...] を返す
 
-def get_memos(db: Session, user_id: int):
-    return db.query(Memo).filter(Memo.user_id == user_id).all()
+    3文字以上の語は FTS 索引で照合し、trigram で引けない短い語は
+    FTS の結果（または本人のメモ）に対して LIKE で絞り込む。
+    """
+    tokens = q.split()
+    if not tokens:
+        return []
+    fts_tokens = [t for t in tokens if len(t) >= FTS_MIN_TOKEN_LENGTH]
+    short_tokens = [t for t in tokens if len(t) < FTS_MIN_TOKEN_LENGTH]
+
+    params = {"user_id": user_id, "limit": limit, "offset": offset}
+    where = ["m.user_id = :user_id"]
+    for i, token in enumerate(short_tokens):
+        params[f"like{i}"] = _like_pattern(token)
+        where.append(f"(m.title LIKE :like{i} ESCAPE '\\' OR memo_text(m.content) LIKE :like{i} ESCAPE '\\')")
+
+    if fts_tokens:
+        params["match"] = " ".join(_fts_phrase(t) for t in fts_tokens)
+        where.append("memos_fts MATCH :match")
+        sql = f"""
+            SELECT m.id,
+                   highlight(memos_fts, 0, '<mark>', '</mark>') AS title_highlight,
+                   snippet(memos_fts, 1, '<mark>', '</mark>', '…', 16) AS snippet,
+                   bm25(memos_fts, 10.0, 1.0) AS rank
+            FROM memos_fts JOIN memos m ON m.id = memos_fts.rowid
+            WHERE {" AND ".join(where)}
+            ORDER BY rank, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        sql = f"""
+            SELECT m.id, m.title AS title_highlight, substr(m.preview, 1, 64) AS snippet, NULL AS rank
+            FROM memos m
+            WHERE {" AND ".join(where)}
+            ORDER BY m.updated_at DESC, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+
+    rows = db.execute(text(sql), params).all()
+    if not rows:
+        return []
+    memos = {m.id: m for m in _memo_query(db).filter(Memo.id.in_([r.id for r in rows])).all()}
+    return [(memos[r.id], r.title_highlight, r.snippet, r.rank) for r in rows]
+
+def _refresh_with_counts(db: Session, db_memo: Memo):
+    """タグの memo_count はトリガーで更新されるため、付いているタグの値も読み直す"""
+    for tag in db_memo.__dict__.get("tags", ()):
+        db.expire(tag, ["memo_count"])
+    db.refresh(db_memo)
 
 def get_memo(db: Session, memo_id: int, user_id: int):
-    return db.query(Memo).filter(Memo.id == memo_id, Memo.user_id == user_id).first()
+    return _memo_query(db).filter(Memo.id == memo_id, Memo.user_id == user_id).first()
 
 def create_memo(db: Session, memo: MemoCreate, user_id: int):
     db_memo = Memo(
@@ -24,8 +280,11 @@ def create_memo(db: Session, memo: MemoCreate, user_id: int):
         db_memo.tags = tags
 
     db.add(db_memo)
+    db.flush()
+    emit_change(db, user_id, "memo", "create", [db_memo.id])
+    mark_dirty(db, user_id)
     db.commit()
-    db.refresh(db_memo)
+    _refresh_with_counts(db, db_memo)
     return db_memo
 
 def update_memo(db: Session, memo_id: int, memo: MemoUpdate, user_id: int):
@@ -35,6 +294,7 @@ def update_memo(db: Session, memo_id: int, memo: MemoUpdate, user_id: int):
 
     db_memo.title = memo.title
     db_memo.content = memo.content
+    db_memo.preview = memo_preview(memo.content)
     db_memo.category_id = memo.category_id
     db_memo.file_paths = memo.file_paths
     db_memo.urls = memo.urls
@@ -44,8 +304,10 @@ def update_memo(db: Session, memo_id: int, memo: MemoUpdate, user_id: int):
         tags = db.query(Tag).filter(Tag.id.in_(memo.tag_ids), Tag.user_id == user_id).all() if memo.tag_ids else []
         db_memo.tags = tags
 
+    emit_change(db, user_id, "memo", "update", [memo_id])
+    mark_dirty(db, user_id)
     db.commit()
-    db.refresh(db_memo)
+    _refresh_with_counts(db, db_memo)
     return db_memo
 
 def delete_memo(db: Session, memo_id: int, user_id: int):
@@ -53,5 +315,153 @@ def delete_memo(db: Session, memo_id: int, user_id: int):
     if not db_memo:
         return None
     db.delete(db_memo)
+    emit_change(db, user_id, "memo", "delete", [memo_id])
+    mark_dirty(db, user_id)
     db.commit()
     return True
+
+# --- 一括操作（参照先の解決は 1 クエリ、書き込みは executemany、コミットは 1 回） ---
+def _resolve_refs(db: Session, user_id: int, tag_ids, category_ids):
+    """本人のタグ・カテゴリのうち実在する ID を 1 クエリでまとめて取得"""
+    tag_ids, category_ids = set(tag_ids), set(category_ids)
+    if not tag_ids and not category_ids:
+        return set(), set()
+    stmt = union_all(
+        select(literal("tag").label("kind"), Tag.id.label("id"))
+        .where(Tag.user_id == user_id, Tag.id.in_(tag_ids)),
+        select(literal("category").label("kind"), Category.id.label("id"))
+        .where(Category.user_id == user_id, Category.id.in_(category_ids)),
+    )
+    found_tags, found_categories = set(), set()
+    for kind, ref_id in db.execute(stmt):
+        (found_tags if kind == "tag" else found_categories).add(ref_id)
+    return found_tags, found_categories
+
+def _check_refs(fields: dict, found_tags: set, found_categories: set):
+    if fields.get("category_id") is not None and fields["category_id"] not in found_categories:
+        return "Category not found"
+    if set(fields.get("tag_ids") or []) - found_tags:
+        return "Tag not found"
+    return None
+
+def _batch_result(results: list, atomic: bool, apply):
+    """atomic なら 1 件でも失敗があれば何も書き込まない。成功分は apply(成功結果リスト) で書き込む"""
+    failed = [r for r in results if not r["ok"]]
+    if failed and atomic:
+        for r in results:
+            if r["ok"]:
+                r["ok"] = False
+                r["error"] = "Not applied: batch rolled back"
+        return {"committed": False, "succeeded": 0, "failed": len(results), "results": results}
+
+    succeeded = [r for r in results if r["ok"]]
+    if succeeded:
+        apply(succeeded)
+    return {"committed": bool(succeeded), "succeeded": len(succeeded), "failed": len(failed), "results": results}
+
+def _replace_tags(db: Session, tag_ids_by_memo: dict):
+    if not tag_ids_by_memo:
+        return
+    db.execute(delete(memo_tags).where(memo_tags.c.memo_id.in_(list(tag_ids_by_memo))))
+    links = [
+        {"memo_id": memo_id, "tag_id": tag_id}
+        for memo_id, tag_ids in tag_ids_by_memo.items()
+        for tag_id in dict.fromkeys(tag_ids)
+    ]
+    if links:
+        db.execute(insert(memo_tags), links)
+
+def create_memos_batch(db: Session, items: list[MemoCreate], user_id: int, atomic: bool = True):
+    found_tags, found_categories = _resolve_refs(
+        db, user_id,
+        [t for m in items for t in m.tag_ids],
+        [m.category_id for m in items if m.category_id is not None],
+    )
+    results = []
+    for index, memo in enumerate(items):
+        error = _check_refs(memo.model_dump(), found_tags, found_categories)
+        results.append({"index": index, "id": None, "ok": error is None, "error": error})
+
+    def apply(succeeded):
+        now = datetime.utcnow()
+        rows = [
+            {
+                "title": items[r["index"]].title,
+                "content": items[r["index"]].content,
+                "category_id": items[r["index"]].category_id,
+                "file_paths": items[r["index"]].file_paths,
+                "urls": items[r["index"]].urls,
+                "important": items[r["index"]].important,
+                "user_id": user_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for r in succeeded
+        ]
+        ids = db.scalars(insert(Memo).returning(Memo.id, sort_by_parameter_order=True), rows).all()
+        for r, memo_id in zip(succeeded, ids):
+            r["id"] = memo_id
+        _replace_tags(db, {r["id"]: items[r["index"]].tag_ids for r in succeeded if items[r["index"]].tag_ids})
+        emit_change(db, user_id, "memo", "create", ids)
+        mark_dirty(db, user_id)
+        db.commit()
+
+    return _batch_result(results, atomic, apply)
+
+def update_memos_batch(db: Session, items: list[MemoPatch], user_id: int, atomic: bool = True):
+    patches = [p.model_dump(exclude_unset=True) for p in items]
+    owned = set(db.scalars(select(Memo.id).where(Memo.user_id == user_id, Memo.id.in_([p.id for p in items]))))
+    found_tags, found_categories = _resolve_refs(
+        db, user_id,
+        [t for p in patches for t in (p.get("tag_ids") or [])],
+        [p["category_id"] for p in patches if p.get("category_id") is not None],
+    )
+    results = []
+    for index, patch in enumerate(patches):
+        if patch["id"] not in owned:
+            error = "Memo not found"
+        elif "title" in patch and patch["title"] is None:
+            error = "title must not be null"
+        elif "important" in patch and patch["important"] is None:
+            error = "important must not be null"
+        else:
+            error = _check_refs(patch, found_tags, found_categories)
+        results.append({"index": index, "id": patch["id"], "ok": error is None, "error": error})
+
+    def apply(succeeded):
+        now = datetime.utcnow()
+        rows = []
+        tag_ids_by_memo = {}
+        for r in succeeded:
+            fields = dict(patches[r["index"]])
+            tag_ids = fields.pop("tag_ids", None)
+            if tag_ids is not None:
+                tag_ids_by_memo[r["id"]] = tag_ids
+            if "content" in fields:
+                fields["preview"] = memo_preview(fields["content"])
+            rows.append({**fields, "updated_at": now})
+        # 主キー指定の一括 UPDATE（同じ列構成ごとに executemany）
+        db.execute(update(Memo), rows)
+        _replace_tags(db, tag_ids_by_memo)
+        emit_change(db, user_id, "memo", "update", [r["id"] for r in succeeded])
+        mark_dirty(db, user_id)
+        db.commit()
+
+    return _batch_result(results, atomic, apply)
+
+def delete_memos_batch(db: Session, ids: list[int], user_id: int, atomic: bool = True):
+    owned = set(db.scalars(select(Memo.id).where(Memo.user_id == user_id, Memo.id.in_(ids))))
+    results = [
+        {"index": index, "id": memo_id, "ok": memo_id in owned, "error": None if memo_id in owned else "Memo not found"}
+        for index, memo_id in enumerate(ids)
+    ]
+
+    def apply(succeeded):
+        memo_ids = list({r["id"] for r in succeeded})
+        # memo_tags は外部キーの ON DELETE CASCADE で削除される
+        db.execute(delete(Memo).where(Memo.id.in_(memo_ids)).execution_options(synchronize_session=False))
+        emit_change(db, user_id, "memo", "delete", memo_ids)
+        mark_dirty(db, user_id)
+        db.commit()
+
+    return _batch_result(results, atomic, apply)
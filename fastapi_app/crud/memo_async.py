@@ -0,0 +1,31 @@
+# crud/memo.py の非同期版
+# 同期版の処理を AsyncSession.run_sync で実行する（DB I/O は aiosqlite 側で待機し、イベントループを塞がない）
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import USE_WRITE_QUEUE
+from write_queue import write_queue
+from crud import memo as memo_crud
+from schemas.memo import MemoCreate, MemoUpdate
+
+async def get_memos(db: AsyncSession, user_id: int, **filters):
+    return await db.run_sync(memo_crud.get_memos, user_id, **filters)
+
+async def get_memo_rows(db: AsyncSession, user_id: int, **filters):
+    return await db.run_sync(memo_crud.get_memo_rows, user_id, **filters)
+
+async def get_memo(db: AsyncSession, memo_id: int, user_id: int):
+    return await db.run_sync(memo_crud.get_memo, memo_id, user_id)
+
+async def create_memo(db: AsyncSession, memo: MemoCreate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(memo_crud.create_memo, memo, user_id)
+    return await db.run_sync(memo_crud.create_memo, memo, user_id)
+
+async def update_memo(db: AsyncSession, memo_id: int, memo: MemoUpdate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(memo_crud.update_memo, memo_id, memo, user_id)
+    return await db.run_sync(memo_crud.update_memo, memo_id, memo, user_id)
+
+async def delete_memo(db: AsyncSession, memo_id: int, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(memo_crud.delete_memo, memo_id, user_id)
+    return await db.run_sync(memo_crud.delete_memo, memo_id, user_id)
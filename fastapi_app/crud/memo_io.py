@@ -0,0 +1,197 @@
+# メモのエクスポート / インポート（大量データを一定メモリで扱う）
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import select, insert, literal, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.memo import Memo, memo_tags
+from models.tag import Tag
+from models.category import Category
+from schemas.memo import MemoImportRow
+from bootstrap_cache import mark_dirty
+from events import emit_change
+
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+# インポートで受け付ける本文の上限（バイト）。一時ファイルでディスクを埋められないようにする
+IMPORT_MAX_BYTES = int(os.getenv("MEMO_IMPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# CSV では一覧系の列を JSON 文字列で持つ
+EXPORT_COLUMNS = ["id", "title", "content", "category", "tags", "file_paths", "urls", "important", "created_at", "updated_at"]
+_LIST_COLUMNS = ("tags", "file_paths", "urls")
+
+# ===================================================
+# エクスポート
+# ===================================================
+def count_memos(db: Session, user_id: int) -> int:
+    return db.query(Memo).filter(Memo.user_id == user_id).count()
+
+def iter_memo_records(db: Session, user_id: int):
+    """サーバーサイドカーソルから 1 件ずつ dict を返す（タグ名はチャンクごとに 1 クエリ）"""
+    stmt = (
+        select(
+            Memo.id, Memo.title, Memo.content, Category.name.label("category"),
+            Memo.file_paths, Memo.urls, Memo.important, Memo.created_at, Memo.updated_at,
+        )
+        .outerjoin(Category, Category.id == Memo.category_id)
+        .where(Memo.user_id == user_id)
+        .order_by(Memo.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for partition in db.execute(stmt).partitions():
+        tags = {row.id: [] for row in partition}
+        tag_rows = db.execute(
+            select(memo_tags.c.memo_id, Tag.name)
+            .join(Tag, Tag.id == memo_tags.c.tag_id)
+            .where(memo_tags.c.memo_id.in_(list(tags)))
+            .order_by(memo_tags.c.memo_id, Tag.name)
+        )
+        for memo_id, name in tag_rows:
+            tags[memo_id].append(name)
+
+        for row in partition:
+            yield {
+                "id": row.id,
+                "title": row.title,
+                "content": row.content,
+                "category": row.category,
+                "tags": tags[row.id],
+                "file_paths": row.file_paths or [],
+                "urls": row.urls or [],
+                "important": row.important,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            }
+
+def export_ndjson(db: Session, user_id: int):
+    for record in iter_memo_records(db, user_id):
+        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+def export_csv(db: Session, user_id: int):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for i, record in enumerate(iter_memo_records(db, user_id), start=1):
+        for key in _LIST_COLUMNS:
+            record[key] = json.dumps(record[key], ensure_ascii=False)
+        writer.writerow(record)
+        # 一定件数ごとにまとめて送出
+        if i % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+# ===================================================
+# インポート
+# ===================================================
+def parse_ndjson(stream):
+    """バイナリストリームを 1 行ずつ読み、(行番号, dict) を返す（壊れた行は例外オブジェクト）"""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+
+def parse_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    for record in reader:
+        for key in _LIST_COLUMNS:
+            if record.get(key):
+                record[key] = json.loads(record[key])
+            else:
+                record.pop(key, None)
+        for key in ("category", "created_at", "updated_at", "content"):
+            if record.get(key) == "":
+                record[key] = None
+        yield reader.line_num, record
+
+def iter_import_batches(records, batch_size: int = IMPORT_BATCH_SIZE):
+    """(valid_rows, errors) をバッチごとに返す。errors は [(行番号, メッセージ)]"""
+    rows, errors = [], []
+    try:
+        for line_no, record in records:
+            if isinstance(record, Exception):
+                errors.append((line_no, f"Parse error: {record}"))
+            else:
+                try:
+                    rows.append(MemoImportRow.model_validate(record))
+                except ValidationError as e:
+                    errors.append((line_no, e.errors()[0]["msg"]))
+            if len(rows) + len(errors) >= batch_size:
+                yield rows, errors
+                rows, errors = [], []
+    except (ValueError, csv.Error) as e:
+        errors.append((None, f"Parse error: {e}"))
+    yield rows, errors
+
+def _resolve_names(db: Session, user_id: int, tag_names: set, category_names: set):
+    """名前 → ID の対応を 1 クエリで取得し、無いものは作成する（名前が他ユーザーと重複する場合は作成しない）"""
+    stmt = union_all(
+        select(literal("tag").label("kind"), Tag.name.label("name"), Tag.id.label("id"))
+        .where(Tag.user_id == user_id, Tag.name.in_(tag_names)),
+        select(literal("category").label("kind"), Category.name.label("name"), Category.id.label("id"))
+        .where(Category.user_id == user_id, Category.name.in_(category_names)),
+    )
+    tags, categories = {}, {}
+    for kind, name, ref_id in db.execute(stmt):
+        (tags if kind == "tag" else categories)[name] = ref_id
+
+    warnings = []
+    for label, model, names, found in (("tag", Tag, tag_names, tags), ("category", Category, category_names, categories)):
+        created = []
+        for name in sorted(names - found.keys()):
+            try:
+                with db.begin_nested():
+                    found[name] = db.scalar(insert(model).values(name=name, user_id=user_id).returning(model.id))
+                created.append(found[name])
+            except IntegrityError:
+                warnings.append(f"{label} '{name}' is already used by another user; skipped")
+        emit_change(db, user_id, label, "create", created)
+    return tags, categories, warnings
+
+def import_memos_batch(db: Session, rows: list[MemoImportRow], user_id: int):
+    """1 バッチ分を 1 トランザクションで取り込み、警告のリストを返す"""
+    if not rows:
+        return []
+    tags, categories, warnings = _resolve_names(
+        db, user_id,
+        {name for row in rows for name in row.tags},
+        {row.category for row in rows if row.category},
+    )
+    now = datetime.utcnow()
+    values = [
+        {
+            "title": row.title,
+            "content": row.content,
+            "category_id": categories.get(row.category),
+            "file_paths": row.file_paths,
+            "urls": row.urls,
+            "important": row.important,
+            "user_id": user_id,
+            "created_at": row.created_at or now,
+            "updated_at": row.updated_at or row.created_at or now,
+        }
+        for row in rows
+    ]
+    ids = db.scalars(insert(Memo).returning(Memo.id, sort_by_parameter_order=True), values).all()
+    links = [
+        {"memo_id": memo_id, "tag_id": tags[name]}
+        for memo_id, row in zip(ids, rows)
+        for name in dict.fromkeys(row.tags)
+        if name in tags
+    ]
+    if links:
+        db.execute(insert(memo_tags), links)
+    emit_change(db, user_id, "memo", "create", ids)
+    mark_dirty(db, user_id)
+    db.commit()
+    return warnings
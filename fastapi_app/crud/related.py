@@ -0,0 +1,159 @@
+import threading
+
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import Session
+from models.memo import Memo, memo_tags
+from models.tag import Tag
+from models.sync import Tombstone
+from crud.sync import get_sync_token
+from crud.memo import get_memo_tag_rows
+from related import RelatedIndex, related_cache, RELATED_MAX_CHARS
+
+_CHUNK_SIZE = 500  # SQLite のパラメータ数上限に収まるよう IN を分割
+
+# 関連メモの行（問い合わせごとに文を組み立てない。主キーだけで引き、ユーザーは行で確かめる）
+_RELATED_ROWS = (
+    select(Memo.id, Memo.title, Memo.preview, Memo.category_id, Memo.important, Memo.updated_at, Memo.user_id)
+    .where(Memo.id.in_(bindparam("ids", expanding=True)))
+)
+
+# 大きな索引の作成（数秒かかりうる）を同時に何本も走らせない
+_build_lock = threading.Lock()
+
+def _tag_names_by_memo(db: Session, user_id: int, memo_ids: list[int] | None = None) -> dict:
+    """memo_id -> [タグ名]（memo_ids が None ならユーザーの全てのメモ）"""
+    stmt = select(memo_tags.c.memo_id, Tag.name).join(Tag, Tag.id == memo_tags.c.tag_id)
+    if memo_ids is None:
+        statements = [stmt.where(Tag.user_id == user_id)]
+    else:
+        statements = [
+            stmt.where(memo_tags.c.memo_id.in_(memo_ids[start:start + _CHUNK_SIZE]))
+            for start in range(0, len(memo_ids), _CHUNK_SIZE)
+        ]
+    names = {}
+    for statement in statements:
+        for memo_id, name in db.execute(statement):
+            names.setdefault(memo_id, []).append(name)
+    return names
+
+def _memo_documents(db: Session, user_id: int, memo_ids: list[int] | None = None) -> list:
+    """[(メモ ID, タイトル, 本文の先頭, タグ名のリスト)]（memo_ids が None ならユーザーの全てのメモ）"""
+    stmt = select(Memo.id, Memo.title, Memo.content, Memo.user_id)
+    if memo_ids is None:
+        statements = [stmt.where(Memo.user_id == user_id).order_by(Memo.id)]
+    else:
+        # 主キーだけで引く（user_id も条件にすると、SQLite が ix_memos_user_category でユーザーの全てのメモを走査する）
+        statements = [
+            stmt.where(Memo.id.in_(memo_ids[start:start + _CHUNK_SIZE]))
+            for start in range(0, len(memo_ids), _CHUNK_SIZE)
+        ]
+    tag_names = _tag_names_by_memo(db, user_id, memo_ids)
+    documents = []
+    for statement in statements:
+        # 本文は特徴量に使う先頭だけを残す（全てのメモの本文を同時に持たない）
+        for memo_id, title, content, owner_id in db.execute(statement):
+            if owner_id == user_id:
+                documents.append((memo_id, title, (content or "")[:RELATED_MAX_CHARS], tag_names.get(memo_id, [])))
+    return documents
+
+def build_related_index(db: Session, user_id: int) -> RelatedIndex:
+    """user_id の全てのメモから索引を作ってキャッシュに入れる
+
+    先に差分同期の番号を読み、索引にはその番号までを反映済みとして記録する。
+    読み取り中の変更は番号がそれより後になるため、次の問い合わせで差分として反映される。
+    """
+    version = get_sync_token(db, user_id)
+    tag_names = dict(db.execute(select(Tag.id, Tag.name).where(Tag.user_id == user_id)).all())
+    index = RelatedIndex.build(version, _memo_documents(db, user_id), tag_names)
+    related_cache.put(user_id, index)
+    return index
+
+def _apply_changes(db: Session, user_id: int, index: RelatedIndex, version: int):
+    """index.version より後の変更（メモの追加・更新・削除とタグ名の変更）を反映する"""
+    changed = set(db.scalars(
+        select(Memo.id).where(Memo.user_id == user_id, Memo.sync_version > index.version)
+    ))
+    # タグ名の変更はメモの行を変更しないため、名前の変わったタグが付いたメモを作り直す
+    renamed = []
+    for tag_id, name in db.execute(
+        select(Tag.id, Tag.name).where(Tag.user_id == user_id, Tag.sync_version > index.version)
+    ):
+        if index.tag_names.get(tag_id, name) != name:
+            renamed.append(tag_id)
+        index.tag_names[tag_id] = name
+    if renamed:
+        changed.update(db.scalars(select(memo_tags.c.memo_id).where(memo_tags.c.tag_id.in_(renamed))))
+
+    deleted = {"memo": [], "tag": []}
+    for entity, entity_id in db.execute(
+        select(Tombstone.entity, Tombstone.entity_id).where(
+            Tombstone.user_id == user_id,
+            Tombstone.sync_version > index.version,
+            Tombstone.entity.in_(("memo", "tag")),
+        )
+    ):
+        deleted[entity].append(entity_id)
+    for tag_id in deleted["tag"]:
+        index.tag_names.pop(tag_id, None)
+    # 削除後に同じ ID で作られたメモがありうるため、削除を先に反映してから現在の行で作り直す
+    index.remove(deleted["memo"])
+    index.upsert(_memo_documents(db, user_id, sorted(changed)))
+    index.version = version
+    related_cache.record_update()
+
+def get_related_index(db: Session, user_id: int) -> RelatedIndex:
+    """最新の変更まで反映した user_id の索引（無ければ作る）"""
+    version = get_sync_token(db, user_id)
+    index = related_cache.get(user_id)
+    if index is not None and version > index.version:
+        with index.lock:
+            if version > index.version:
+                _apply_changes(db, user_id, index, version)
+    # 変更が多く IDF がずれた索引と、番号が戻った（ユーザーが作り直された）索引は作り直す
+    if index is None or index.stale() or version < index.version:
+        with _build_lock:
+            current = related_cache.get(user_id)
+            if current is not None and current is not index and current.version >= version:
+                return current
+            index = build_related_index(db, user_id)
+    return index
+
+def get_related_memos(db: Session, memo_id: int, user_id: int, k: int = 10):
+    """memo_id に似たメモ（類似度の高い順、最大 k 件）。memo_id が存在しなければ None
+
+    MemoRelated と同じキーの dict のリストを返す（本文は読まず、preview を返す）。
+    """
+    index = get_related_index(db, user_id)
+    with index.lock:
+        hits = index.query(memo_id, k)
+    related_cache.record_query()
+    if hits is None:
+        # 索引の番号を読んだ後に作られたメモは次の問い合わせで反映される
+        exists = db.scalar(select(Memo.id).where(Memo.id == memo_id, Memo.user_id == user_id))
+        return [] if exists else None
+    if not hits:
+        return []
+    rows = {
+        row.id: row for row in db.execute(_RELATED_ROWS, {"ids": [related_id for related_id, _ in hits]})
+        if row.user_id == user_id
+    }
+    tags_by_memo = get_memo_tag_rows(db, list(rows))
+    return [
+        {**rows[related_id]._asdict(), "tags": tags_by_memo.get(related_id, []), "score": score}
+        for related_id, score in hits
+        if related_id in rows
+    ]
+
+def find_near_duplicates(db: Session, user_id: int, threshold: float = 0.85, limit: int = 100) -> list:
+    """類似度が threshold 以上のメモの組 [{"a": {id, title}, "b": {id, title}, "score": 類似度}]（類似度の高い順）"""
+    index = get_related_index(db, user_id)
+    with index.lock:
+        pairs = index.near_duplicates(threshold, limit)
+    ids = sorted({memo_id for a, b, _ in pairs for memo_id in (a, b)})
+    titles = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        titles.update(db.execute(select(Memo.id, Memo.title).where(Memo.id.in_(ids[start:start + _CHUNK_SIZE]))).all())
+    return [
+        {"a": {"id": a, "title": titles.get(a)}, "b": {"id": b, "title": titles.get(b)}, "score": score}
+        for a, b, score in pairs
+    ]
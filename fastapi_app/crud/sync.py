@@ -0,0 +1,95 @@
+import base64
+import json
+
+from sqlalchemy import select, bindparam, and_, or_
+from sqlalchemy.orm import Session, selectinload
+from models.memo import Memo
+from models.tag import Tag
+from models.category import Category
+from models.sync import SyncSequence, Tombstone
+
+_SYNC_TOKEN = select(SyncSequence.seq).where(SyncSequence.user_id == bindparam("user_id"))
+
+def get_sync_token(db: Session, user_id: int) -> int:
+    return db.scalar(_SYNC_TOKEN, {"user_id": user_id}) or 0
+
+_SYNC_STATE = select(SyncSequence.seq, SyncSequence.pruned).where(SyncSequence.user_id == bindparam("user_id"))
+
+class SyncTokenExpired(Exception):
+    """since より後の削除記録が既に削除されている（全件の同期からやり直す必要がある）"""
+
+# --- カーソル（不透明トークン）：同期の範囲（token / since）と最後に返したメモの (sync_version, id) ---
+def encode_sync_cursor(token: int, since: int | None, version: int, memo_id: int) -> str:
+    raw = json.dumps({"t": token, "s": since, "v": version, "i": memo_id})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_sync_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        since = None if data["s"] is None else int(data["s"])
+        return int(data["t"]), since, int(data["v"]), int(data["i"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def get_changes(db: Session, user_id: int, since: int | None = None, cursor: str | None = None, limit: int = 500):
+    """since より後（token 以下）の変更を返す。since が None なら全件。(変更, next_cursor) を返す
+
+    先に token を確定し、以降の変更（version > token）は次回の同期に回すことで、
+    読み取りが同一スナップショットでなくても取りこぼし・重複が起きない。
+    メモは (sync_version, id) のキーセットで limit 件ずつ返す（ix_memos_user_sync_version の範囲検索）。
+    タグ・カテゴリ・削除は 1 ページ目だけに含める。2 ページ目以降は cursor だけを渡す（token / since は cursor が持つ）。
+    """
+    if cursor:
+        token, since, after_version, after_id = decode_sync_cursor(cursor)
+        # ユーザーが作り直されると番号が戻る
+        if token > get_sync_token(db, user_id):
+            raise ValueError("Invalid cursor")
+    else:
+        state = db.execute(_SYNC_STATE, {"user_id": user_id}).first()
+        token, pruned = state if state else (0, 0)
+        if since is not None and not 0 <= since <= token:
+            raise ValueError("Invalid sync token")
+        if since is not None and since < pruned:
+            raise SyncTokenExpired()
+        after_version = after_id = None
+
+    def changed(stmt, model):
+        stmt = stmt.where(model.user_id == user_id, model.sync_version <= token)
+        if since is not None:
+            stmt = stmt.where(model.sync_version > since)
+        return stmt
+
+    stmt = changed(select(Memo).options(selectinload(Memo.tags)), Memo)
+    if after_version is not None:
+        stmt = stmt.where(or_(
+            Memo.sync_version > after_version,
+            and_(Memo.sync_version == after_version, Memo.id > after_id),
+        ))
+    memos = db.scalars(stmt.order_by(Memo.sync_version, Memo.id).limit(limit + 1)).all()
+    next_cursor = None
+    if len(memos) > limit:
+        memos = memos[:limit]
+        next_cursor = encode_sync_cursor(token, since, memos[-1].sync_version, memos[-1].id)
+
+    tags, categories = [], []
+    deleted = {"memos": [], "tags": [], "categories": []}
+    if not cursor:
+        tags = db.scalars(changed(select(Tag), Tag).order_by(Tag.id)).all()
+        categories = db.scalars(changed(select(Category), Category).order_by(Category.id)).all()
+    if not cursor and since is not None:
+        for entity, entity_id in db.execute(
+            select(Tombstone.entity, Tombstone.entity_id)
+            .where(Tombstone.user_id == user_id, Tombstone.sync_version > since, Tombstone.sync_version <= token)
+            .order_by(Tombstone.sync_version)
+        ):
+            deleted[{"memo": "memos", "tag": "tags", "category": "categories"}[entity]].append(entity_id)
+
+    return {
+        "token": str(token),
+        "full": since is None,
+        "memos": memos,
+        "tags": tags,
+        "categories": categories,
+        "deleted": deleted,
+    }, next_cursor
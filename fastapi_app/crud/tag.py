@@ -1,9 +1,19 @@
+from sqlalchemy import select, delete
 from sqlalchemy.orm import Session
 from models.tag import Tag
 from schemas.tag import TagCreate, TagUpdate
+from bootstrap_cache import mark_dirty
+from events import emit_change
 
 def get_tags(db: Session, user_id: int):
-    return db.query(Tag).filter(Tag.user_id == user_id).all()
+    return db.query(Tag).filter(Tag.user_id == user_id).order_by(Tag.id).all()
+
+# --- 高速一覧用：ORM オブジェクトを作らず TagResponse と同じキー順の dict を返す ---
+TAG_ROW_COLUMNS = (Tag.name, Tag.color, Tag.id, Tag.user_id, Tag.created_at, Tag.updated_at, Tag.memo_count)
+
+def get_tag_rows(db: Session, user_id: int):
+    rows = db.execute(select(*TAG_ROW_COLUMNS).where(Tag.user_id == user_id).order_by(Tag.id))
+    return [dict(row._mapping) for row in rows]
 
 def get_tag(db: Session, tag_id: int, user_id: int):
     return db.query(Tag).filter(Tag.id == tag_id, Tag.user_id == user_id).first()
@@ -11,6 +21,9 @@ def get_tag(db: Session, tag_id: int, user_id: int):
 def create_tag(db: Session, tag: TagCreate, user_id: int):
     db_tag = Tag(name=tag.name, color=tag.color, user_id=user_id)
     db.add(db_tag)
+    db.flush()
+    emit_change(db, user_id, "tag", "create", [db_tag.id])
+    mark_dirty(db, user_id)
     db.commit()
     db.refresh(db_tag)
     return db_tag
@@ -21,14 +34,20 @@ def update_tag(db: Session, tag_id: int, tag: TagUpdate, user_id: int):
         return None
     db_tag.name = tag.name
     db_tag.color = tag.color
+    emit_change(db, user_id, "tag", "update", [tag_id])
+    mark_dirty(db, user_id)
     db.commit()
     db.refresh(db_tag)
     return db_tag
 
 def delete_tag(db: Session, tag_id: int, user_id: int):
-    db_tag = get_tag(db, tag_id, user_id)
-    if not db_tag:
+    # memo_tags は外部キーの ON DELETE CASCADE で同じ文の中で削除される（関連するメモをロードしない）
+    deleted = db.execute(
+        delete(Tag).where(Tag.id == tag_id, Tag.user_id == user_id).execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
         return None
-    db.delete(db_tag)
+    emit_change(db, user_id, "tag", "delete", [tag_id])
+    mark_dirty(db, user_id)
     db.commit()
     return True
@@ -0,0 +1,30 @@
+# crud/tag.py の非同期版（AsyncSession.run_sync で同期版を実行）
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import USE_WRITE_QUEUE
+from write_queue import write_queue
+from crud import tag as tag_crud
+from schemas.tag import TagCreate, TagUpdate
+
+async def get_tags(db: AsyncSession, user_id: int):
+    return await db.run_sync(tag_crud.get_tags, user_id)
+
+async def get_tag_rows(db: AsyncSession, user_id: int):
+    return await db.run_sync(tag_crud.get_tag_rows, user_id)
+
+async def get_tag(db: AsyncSession, tag_id: int, user_id: int):
+    return await db.run_sync(tag_crud.get_tag, tag_id, user_id)
+
+async def create_tag(db: AsyncSession, tag: TagCreate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(tag_crud.create_tag, tag, user_id)
+    return await db.run_sync(tag_crud.create_tag, tag, user_id)
+
+async def update_tag(db: AsyncSession, tag_id: int, tag: TagUpdate, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(tag_crud.update_tag, tag_id, tag, user_id)
+    return await db.run_sync(tag_crud.update_tag, tag_id, tag, user_id)
+
+async def delete_tag(db: AsyncSession, tag_id: int, user_id: int):
+    if USE_WRITE_QUEUE:
+        return await write_queue.run_async(tag_crud.delete_tag, tag_id, user_id)
+    return await db.run_sync(tag_crud.delete_tag, tag_id, user_id)
@@ -1,18 +1,25 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import select, delete, update, union_all, literal, func, cast, LargeBinary
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from models.user import User
+from models.memo import Memo
+from models.tag import Tag
+from models.category import Category
 from schemas.user import UserCreate, UserLogin
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from principal_cache import principal_cache
+from bootstrap_cache import bootstrap_cache
+import hashing
 
-# --- パスワードハッシュ化（最大72バイトに切り詰め） ---
+# --- パスワードハッシュ化（専用プロセスプールで実行、最大72バイトに切り詰め） ---
 def get_password_hash(password: str) -> str:
-    password_bytes = password.encode("utf-8")[:72]
-    return pwd_context.hash(password_bytes)
+    return hashing.hash_password(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    plain_bytes = plain_password.encode("utf-8")[:72]
-    return pwd_context.verify(plain_bytes, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
 
 # --- ユーザー作成 ---
 def create_user(db: Session, user: UserCreate):
@@ -26,17 +33,83 @@ def create_user(db: Session, user: UserCreate):
     db.refresh(db_user)
     return db_user
 
-# --- 全ユーザー取得 ---
-def get_users(db: Session):
-    return db.query(User).all()
+# --- シャードのユーザー行（shards.py。メモ等の外部キーの参照先。ユーザー名・パスワードは中央 DB のみ） ---
+def create_user_mirror(db: Session, user_id: int):
+    db.execute(
+        sqlite_insert(User)
+        .values(id=user_id, username=f"#{user_id}", hashed_password="", role="user")
+        .on_conflict_do_nothing(index_elements=[User.id])
+    )
+    db.commit()
+
+# --- ユーザー一覧（ユーザー名順のキーセットページング + 利用状況） ---
+USER_ROW_COLUMNS = (User.username, User.id, User.role)
+USER_STAT_KEYS = ("memo_count", "tag_count", "category_count", "content_bytes")
+
+def encode_user_cursor(username: str) -> str:
+    raw = json.dumps({"n": username})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_user_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        username = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["n"]
+        if not isinstance(username, str):
+            raise ValueError("cursor is not a username")
+        return username
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
 
-# --- ID指定でユーザー取得 ---
+def get_user_stats(db: Session, user_ids: list[int]) -> dict:
+    """user_id -> {memo_count, tag_count, category_count, content_bytes}（ページ分をまとめて 1 クエリで集計）"""
+    if not user_ids:
+        return {}
+    # 本文の量はタイトル + 本文の UTF-8 バイト数
+    content_bytes = func.length(cast(Memo.title, LargeBinary)) + func.coalesce(func.length(cast(Memo.content, LargeBinary)), 0)
+    stmt = union_all(
+        select(literal("memo_count"), Memo.user_id, func.count(), func.sum(content_bytes))
+        .where(Memo.user_id.in_(user_ids)).group_by(Memo.user_id),
+        select(literal("tag_count"), Tag.user_id, func.count(), literal(0))
+        .where(Tag.user_id.in_(user_ids)).group_by(Tag.user_id),
+        select(literal("category_count"), Category.user_id, func.count(), literal(0))
+        .where(Category.user_id.in_(user_ids)).group_by(Category.user_id),
+    )
+    stats = {user_id: dict.fromkeys(USER_STAT_KEYS, 0) for user_id in user_ids}
+    for key, user_id, count, size in db.execute(stmt):
+        stats[user_id][key] = count
+        if key == "memo_count":
+            stats[user_id]["content_bytes"] = size
+    return stats
+
+def get_user_rows(db: Session, q: str | None = None, cursor: str | None = None, limit: int = 50, stats=None):
+    """ユーザー名順に (利用状況付きの dict のリスト, next_cursor) を返す（q はユーザー名の前方一致）
+
+    ユーザー名のインデックスを範囲検索するため、件数が増えても 1 ページ分しか読まない。
+    stats はユーザー ID のリストから利用状況を返す関数（省略時は db で get_user_stats。シャード使用時は shard_pool.user_stats）
+    """
+    stmt = select(*USER_ROW_COLUMNS).where(User.deleted_at.is_(None))
+    if q:
+        # 前方一致を範囲条件にする（LIKE は大文字小文字を区別しないためインデックスを使えない）
+        stmt = stmt.where(User.username >= q, User.username < q + "\U0010ffff")
+    if cursor:
+        stmt = stmt.where(User.username > decode_user_cursor(cursor))
+    rows = db.execute(stmt.order_by(User.username).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_user_cursor(rows[-1].username)
+
+    user_ids = [row.id for row in rows]
+    usage = stats(user_ids) if stats else get_user_stats(db, user_ids)
+    return [{**row._asdict(), **usage[row.id]} for row in rows], next_cursor
+
+# --- ID指定でユーザー取得（削除予約中のユーザーは含めない） ---
 def get_user(db: Session, user_id: int):
-    return db.query(User).filter(User.id == user_id).first()
+    return db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
 
-# --- ユーザー名で取得 ---
+# --- ユーザー名で取得（削除予約中のユーザーはログイン・認証できない） ---
 def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+    return db.query(User).filter(User.username == username, User.deleted_at.is_(None)).first()
 
 # --- 認証 ---
 def authenticate_user(db: Session, username: str, password: str):
@@ -47,6 +120,12 @@ def authenticate_user(db: Session, username: str, password: str):
         return None
     return user
 
+# --- ハッシュの差し替え（コスト変更時の再ハッシュ用） ---
+def set_password_hash(db: Session, user: User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+    return user
+
 # --- ユーザー更新 ---
 def update_user(db: Session, user_id: int, new_username: str = None, new_password: str = None, new_role: str = None):
     user = get_user(db, user_id)
@@ -60,13 +139,69 @@ def update_user(db: Session, user_id: int, new_username: str = None, new_passwor
         user.role = new_role
     db.commit()
     db.refresh(user)
+    principal_cache.invalidate_user(user_id)
     return user
 
 # --- ユーザー削除 ---
-def delete_user(db: Session, user_id: int):
+# メモがこの件数を超えるユーザーは削除を予約し、user_deletion.py がバックグラウンドで分割削除する
+USER_DELETE_INLINE_LIMIT = 5000
+
+def delete_user(db: Session, user_id: int, inline_limit: int = USER_DELETE_INLINE_LIMIT):
+    """ユーザーと関連データを削除する
+
+    戻り値：None（存在しない）/ "deleted"（削除済み）/ "scheduled"（削除予約。呼び出し側で分割削除を開始する）
+    メモ・タグ・カテゴリ・memo_tags などは外部キーの ON DELETE CASCADE により 1 文で連鎖削除される。
+    """
     user = get_user(db, user_id)
     if not user:
-        return False
-    db.delete(user)
+        return None
+    memo_count = db.scalar(
+        select(func.count()).select_from(select(Memo.id).where(Memo.user_id == user_id).limit(inline_limit + 1).subquery())
+    )
+    if memo_count > inline_limit:
+        user.deleted_at = datetime.utcnow()
+        status = "scheduled"
+    else:
+        db.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+        db.expunge(user)
+        status = "deleted"
+    db.commit()
+    principal_cache.invalidate_user(user_id)
+    bootstrap_cache.invalidate_user(user_id)
+    return status
+
+def mark_user_deleted(db: Session, user_id: int) -> bool:
+    """削除を予約する（ログイン・認証を止める）。予約済み・存在しない場合は False
+
+    シャード使用時は中央 DB の行を予約してからシャードのデータを削除し、最後に中央 DB の行を削除する。
+    """
+    marked = db.execute(
+        update(User).where(User.id == user_id, User.deleted_at.is_(None)).values(deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    principal_cache.invalidate_user(user_id)
+    bootstrap_cache.invalidate_user(user_id)
+    return marked > 0
+
+def get_pending_user_deletions(db: Session) -> list[int]:
+    """削除予約中のユーザー ID（起動時に分割削除を再開するため）"""
+    return list(db.scalars(select(User.id).where(User.deleted_at.is_not(None)).order_by(User.id)))
+
+def purge_user_chunk(db: Session, user_id: int, chunk_size: int) -> bool:
+    """削除予約中のユーザーのメモを最大 chunk_size 件削除する（残りがあれば True）
+
+    メモが残っていなければユーザー本体を削除する（タグ・カテゴリ等は連鎖削除）。
+    """
+    deleted = db.execute(
+        delete(Memo)
+        .where(Memo.id.in_(select(Memo.id).where(Memo.user_id == user_id).limit(chunk_size)))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if deleted < chunk_size:
+        db.execute(
+            delete(User).where(User.id == user_id, User.deleted_at.is_not(None))
+            .execution_options(synchronize_session=False)
+        )
     db.commit()
-    return True
+    return deleted == chunk_size
@@ -1,24 +1,241 @@
 # fastapi-app/db.py
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+import os
+import time
+from contextlib import contextmanager
 
-# SQLite データベース URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./memos.db"
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
-# エンジン作成
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite 用おまじない
-)
+from metrics import metrics
+from compression import enable_memo_text
+
+# SQLite データベース URL（非同期エンジンはドライバを aiosqlite に替えた同じ URL）
+SQLALCHEMY_DATABASE_URL = os.getenv("MEMO_DATABASE_URL", "sqlite:///./memos.db")
+
+# メモ・タグ・カテゴリ API を AsyncSession で処理するか（MEMO_ASYNC_DB=1 で有効）
+USE_ASYNC_DB = os.getenv("MEMO_ASYNC_DB", "0") == "1"
+
+# メモ・タグ・カテゴリの書き込みを単一ライターに集約するか（MEMO_WRITE_QUEUE=0 で無効）
+USE_WRITE_QUEUE = os.getenv("MEMO_WRITE_QUEUE", "1") == "1"
+
+# ===================================================
+# SQLite チューニング（接続ごとに適用する PRAGMA）
+# ===================================================
+SQLITE_PROFILES = {
+    # WAL + synchronous=NORMAL：読み取りは書き込みを待たず、コミット時の fsync も最小限
+    "default": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,           # ミリ秒。ロック中は即エラーにせず待つ
+        "cache_size": -64000,           # 負数は KiB 指定（約 64MB）
+        "mmap_size": 268435456,         # 256MB
+        "temp_store": "MEMORY",
+    },
+    # 電源断でも直近のコミットを失わない設定
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # SQLite の既定値のまま（ロールバックジャーナル）
+    "legacy": {},
+}
+SQLITE_PROFILE = os.getenv("MEMO_SQLITE_PROFILE", "default")
+
+def apply_sqlite_pragmas(bind, profile: str = None):
+    """エンジンの新規接続ごとに PRAGMA を設定する"""
+    pragmas = SQLITE_PROFILES[profile or SQLITE_PROFILE]
+
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(bind, "connect", _on_connect)
+
+def enable_foreign_keys(bind):
+    """接続ごとに外部キー制約を有効化する（ON DELETE CASCADE / SET NULL による削除の連鎖に必要）"""
+    @event.listens_for(bind, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+def use_immediate_transactions(bind):
+    """書き込み用：BEGIN IMMEDIATE で開始し、SAVEPOINT を正しく扱えるようにする
+
+    pysqlite 既定の暗黙トランザクションを無効化し、SQLAlchemy 側で BEGIN を発行する。
+    """
+    @event.listens_for(bind, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(bind, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def instrument_engine(bind):
+    """SQL 文ごとの実行時間を metrics に加算（リクエスト単位の文数・DB 時間、遅いクエリの検出）"""
+    @event.listens_for(bind, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe_statement(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(bind, "handle_error")
+    def _handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            metrics.observe_statement(context.statement or "", time.perf_counter() - started.pop())
+
+# ===================================================
+# エンジン（init_engines で作成。import しただけでは作らない）
+# ===================================================
+engine = None         # 読み取り + キューを通らない書き込み
+writer_engine = None  # 単一ライター用（接続は 1 本のみ、write_queue.py から使用）
+async_engine = None   # 非同期モード時のみ（aiosqlite が必要）
 
-# セッション作成
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
-    bind=engine
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+def _configure(bind):
+    apply_sqlite_pragmas(bind)
+    enable_foreign_keys(bind)
+    enable_memo_text(bind)
+    instrument_engine(bind)
+
+def create_engines(url: str):
+    """url の (読み書き用エンジン, 単一ライター用エンジン) を作成する（shards.py のシャードも同じ構成）"""
+    reader = create_engine(
+        url,
+        connect_args={"check_same_thread": False},  # SQLite 用おまじない
+    )
+    _configure(reader)
+
+    writer = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+    )
+    _configure(writer)
+    use_immediate_transactions(writer)
+    return reader, writer
+
+def init_engines(url: str = SQLALCHEMY_DATABASE_URL):
+    """url のエンジンを作成して SessionLocal / AsyncSessionLocal に結び付ける（作成済みのエンジンは破棄する）
+
+    接続はまだ開かない（最初の使用時、または prewarm_pools で開く）。
+    """
+    global engine, writer_engine, async_engine
+    dispose_engines()
+
+    engine, writer_engine = create_engines(url)
+
+    if USE_ASYNC_DB:
+        async_engine = create_async_engine(make_url(url).set(drivername="sqlite+aiosqlite"))
+        _configure(async_engine.sync_engine)
+
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    return engine
+
+def get_engine():
+    """読み書き用エンジン（未作成なら既定の URL で作成）"""
+    if engine is None:
+        init_engines()
+    return engine
+
+def dispose_engines():
+    """作成済みのエンジンの接続を全て閉じる（非同期エンジンは終了処理で先に await async_engine.dispose() すること）"""
+    for bind in (engine, writer_engine, async_engine.sync_engine if async_engine is not None else None):
+        if bind is not None:
+            bind.dispose()
+
+def _open_connections(bind, size: int):
+    """size 本の接続を同時に開いてからプールへ返す（接続時の PRAGMA・関数登録とスキーマの読み込みを済ませる）
+
+    DBAPI の接続で直接実行する（書き込み用エンジンの BEGIN IMMEDIATE を発行しない）。
+    """
+    connections = []
+    try:
+        for _ in range(size):
+            connection = bind.raw_connection()
+            connections.append(connection)
+            connection.cursor().execute("SELECT count(*) FROM sqlite_master").fetchall()
+    finally:
+        for connection in connections:
+            connection.close()
+
+async def prewarm_pools(size: int):
+    """起動時に接続を開いておく（最初のリクエストが接続の確立を待たないように）"""
+    if size <= 0:
+        return
+    await asyncio.to_thread(_open_connections, engine, size)
+    await asyncio.to_thread(_open_connections, writer_engine, 1)
+    if async_engine is not None:
+        connections = [await async_engine.connect() for _ in range(size)]
+        for connection in connections:
+            await connection.exec_driver_sql("SELECT count(*) FROM sqlite_master")
+            await connection.close()
+
+# ===================================================
+# コミット後の処理（キャッシュの破棄・変更通知など）
+# ===================================================
+def defer_until_commit(db: Session, key: str, item):
+    """最も外側のトランザクションのコミット後に pop_committed(session, key) で取り出す item を記録する
+
+    ライターキューは書き込みごとに SAVEPOINT で分離するが、SAVEPOINT の解放でも after_commit が発火する。
+    その時点ではまだ COMMIT されていない（後続の COMMIT が失敗することもある）ため取り出さない。
+    SAVEPOINT がロールバックされた場合は、その中で記録した item だけを捨てる。
+    """
+    db.info.setdefault("deferred", {}).setdefault(key, []).append((db.get_nested_transaction(), item))
+
+def pop_committed(session: Session, key: str) -> list:
+    """after_commit のリスナーから呼ぶ：最も外側のコミットなら記録された item を返す（SAVEPOINT の解放では []）"""
+    # in_transaction() は最も外側の after_commit でも True のため、SAVEPOINT の中かどうかで判定する
+    if session.in_nested_transaction():
+        return []
+    return [item for _, item in session.info.get("deferred", {}).pop(key, ())]
+
+def _rolled_back(transaction, rolled_back) -> bool:
+    """transaction（記録時の SAVEPOINT）が rolled_back 自身かその内側か"""
+    while transaction is not None:
+        if transaction is rolled_back:
+            return True
+        transaction = transaction.parent
+    return False
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    deferred = session.info.get("deferred")
+    if deferred and previous_transaction.nested:
+        for key, entries in deferred.items():
+            deferred[key] = [(tx, item) for tx, item in entries if not _rolled_back(tx, previous_transaction)]
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted(session, transaction):
+    # 最も外側のトランザクションの終了時に残っている item（ロールバック・コミットせずに close）は捨てる
+    if transaction.parent is None:
+        session.info.pop("deferred", None)
+
 # Base クラス
 Base = declarative_base()
 
@@ -30,3 +247,36 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 非同期版（async def のエンドポイントで使用）
+async def get_async_db():
+    """FastAPI の Depends で利用する AsyncSession 供給関数"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def database_size(bind) -> int:
+    """DB ファイルのバイト数（ページ数 × ページサイズ）"""
+    with bind.connect() as conn:
+        return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+def vacuum(bind):
+    """WAL をチェックポイントしてから VACUUM する（ファイルを縮める）"""
+    with bind.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+
+# 発行された SQL 文を記録する（N+1 検出・クエリ数の検証用）
+@contextmanager
+def count_queries(bind=None):
+    """with ブロック内で実行された SQL 文のリストを返す"""
+    target = bind if bind is not None else engine
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(target, "before_cursor_execute", _before_cursor_execute)
@@ -0,0 +1,177 @@
+# fastapi-app/events.py
+# 変更通知（GET /events の Server-Sent Events）：メモ・タグ・カテゴリの作成・更新・削除をユーザーごとに配信する
+#
+# - CRUD の書き込み関数が emit_change でセッションに記録し、実際のコミット後に配信する（ロールバックされた変更は配信しない）
+# - 購読者ごとのキューは上限付き。溢れた（受信が遅い）購読者には溜まった通知を捨てて resync を送り、全件の取り直しを促す
+# - 通知が無い間も一定間隔でコメント行（heartbeat）を送り、プロキシ等に接続を切られないようにする
+# - 配信は同じプロセス内のみ（複数ワーカーの場合、別のワーカーでの変更は届かない）。このためクライアントは
+#   自分の書き込みの結果を通知に頼らず反映し、通知は他のセッションでの変更を知るためだけに使うこと
+
+import asyncio
+import json
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import defer_until_commit, pop_committed
+
+# 通知が無い場合に heartbeat を送る間隔（秒）
+EVENTS_HEARTBEAT = float(os.getenv("MEMO_EVENTS_HEARTBEAT", "15"))
+# 購読者ごとに溜めておける通知の数（超えたら resync）
+EVENTS_QUEUE_SIZE = int(os.getenv("MEMO_EVENTS_QUEUE_SIZE", "64"))
+
+HEARTBEAT = b": ping\n\n"
+# 切断時の再接続までの待ち時間（ミリ秒、EventSource の既定値は実装依存のため明示する）
+RETRY = b"retry: 3000\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+def _frame(event_id: int, kind: str, data: dict) -> bytes:
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n".encode()
+
+class Subscription:
+    """1 本のストリームの購読（イベントループのスレッドからのみ操作する）"""
+    __slots__ = ("user_id", "maxsize", "closed", "overflowed", "_frames", "_waiter")
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.closed = False
+        self.overflowed = False
+        self._frames = []  # 上限は数十件のため deque より小さい list で持つ（購読者の大半は空のまま待つ）
+        self._waiter = None
+
+    def put(self, frame: bytes) -> bool:
+        """溢れた場合は溜まった通知を捨てて False（以降は resync を送るまで受け付けない）"""
+        if self.overflowed:
+            return False
+        if len(self._frames) >= self.maxsize:
+            self._frames.clear()
+            self.overflowed = True
+            self._wake()
+            return False
+        self._frames.append(frame)
+        self._wake()
+        return True
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next(self, timeout: float) -> bytes | None:
+        """次に送るフレーム（timeout 秒通知が無ければ heartbeat、閉じられたら None）"""
+        if not self._frames and not self.overflowed and not self.closed:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiter = None
+        if self.closed:
+            return None
+        if self.overflowed:
+            self.overflowed = False
+            return RESYNC
+        if self._frames:
+            return self._frames.pop(0)
+        return HEARTBEAT
+
+class EventHub:
+    """ユーザー ID ごとの購読者への配信（publish はどのスレッドからでも呼べる）"""
+
+    def __init__(self, maxsize: int = EVENTS_QUEUE_SIZE, heartbeat: float = EVENTS_HEARTBEAT):
+        self.maxsize = maxsize
+        self.heartbeat = heartbeat
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self._loop = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """イベントループ上で呼ぶ（配信はこのループで行う）"""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(user_id, self.maxsize)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, kind: str, data: dict):
+        """user_id の購読者に通知する（購読者がいなければ何もしない）"""
+        loop = self._loop
+        # 購読者のいないユーザーの書き込みではエンコードもスレッド間の受け渡しもしない
+        if loop is None or user_id not in self._subscribers:
+            return
+        with self._lock:
+            self._last_id += 1
+            frame = _frame(self._last_id, kind, data)
+            self.published += 1
+        try:
+            loop.call_soon_threadsafe(self._deliver, user_id, frame)
+        except RuntimeError:
+            # イベントループが終了している
+            pass
+
+    def disconnect(self, user_id: int):
+        """user_id のストリームを全て閉じる（ユーザーの削除時。どのスレッドからでも呼べる）"""
+        loop = self._loop
+        if loop is None or user_id not in self._subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._close_user, user_id)
+        except RuntimeError:
+            pass
+
+    def _deliver(self, user_id: int, frame: bytes):
+        for subscription in self._subscribers.get(user_id, ()):
+            if subscription.overflowed:
+                continue  # resync を送るまでの通知は捨てる
+            if subscription.put(frame):
+                self.delivered += 1
+            else:
+                self.overflows += 1
+
+    def _close_user(self, user_id: int):
+        for subscription in self._subscribers.pop(user_id, ()):
+            subscription.close()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(s) for s in list(self._subscribers.values())),
+            "users": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+event_hub = EventHub()
+
+def emit_change(db: Session, user_id: int, entity: str, op: str, ids: list[int]):
+    """このセッションのコミット時に変更を通知する（entity: memo / tag / category、op: create / update / delete）
+
+    mark_dirty と同様、CRUD 内の commit() はライターキューでは SAVEPOINT の解放にすぎないため、
+    最も外側のコミット（db.pop_committed）を待ってから配信する。作成時は flush して ID を確定してから呼ぶこと。
+    """
+    if ids:
+        defer_until_commit(db, "pending_events", (user_id, {"entity": entity, "op": op, "ids": list(ids)}))
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    # ロールバックされたジョブ・コミットに失敗したバッチの通知は db 側で破棄される
+    for user_id, data in pop_committed(session, "pending_events"):
+        event_hub.publish(user_id, "change", data)
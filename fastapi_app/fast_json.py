@@ -0,0 +1,41 @@
+# fastapi-app/fast_json.py
+# 一覧系レスポンスの高速シリアライズ：response_model による検証・再シリアライズを省き、
+# 組み立て済みの dict / list をそのまま JSON 化する（orjson があれば使用）
+
+import json
+import os
+import time
+from datetime import datetime
+
+from fastapi.responses import Response
+
+from metrics import observe_serialization
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# 0 にすると従来通り response_model 経由で返す
+FAST_JSON = os.getenv("MEMO_FAST_JSON", "1") == "1"
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj) -> bytes:
+    """FastAPI 既定の JSONResponse と同じバイト列（区切り文字に空白なし、非 ASCII はそのまま）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        try:
+            return dumps(content)
+        finally:
+            observe_serialization(started)
@@ -0,0 +1,194 @@
+# fastapi-app/foreign_keys.py
+# 既存 DB の外部キー（ON DELETE CASCADE / SET NULL）と列の並びをモデルの定義に合わせる
+# SQLite は制約や列の位置を ALTER できないため、該当テーブルを作り直して行をコピーする
+
+import logging
+import re
+
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from db import Base
+
+logger = logging.getLogger("memo.db")
+
+def _expected(table) -> dict:
+    """(参照元の列, 参照先テーブル) -> ON DELETE の動作"""
+    return {
+        (tuple(fk.column_keys), fk.referred_table.name): (fk.ondelete or "NO ACTION").upper()
+        for fk in table.foreign_key_constraints
+    }
+
+def _foreign_keys(cursor, name: str) -> dict:
+    """PRAGMA foreign_key_list を制約 id ごとにまとめる：id -> (列, 参照先テーブル, ON DELETE)"""
+    found = {}
+    for fk_id, _, parent, column, _, _, on_delete, _ in cursor.execute(f"PRAGMA foreign_key_list({name})").fetchall():
+        columns, _, _ = found.setdefault(fk_id, ([], parent, on_delete.upper()))
+        columns.append(column)
+    return found
+
+def _actual(cursor, name: str) -> dict:
+    return {
+        (tuple(columns), parent): on_delete
+        for columns, parent, on_delete in _foreign_keys(cursor, name).values()
+    }
+
+def _generated(cursor, name: str) -> set:
+    """生成列の名前（PRAGMA table_xinfo の hidden が 2: VIRTUAL、3: STORED）"""
+    return {row[1] for row in cursor.execute(f"PRAGMA table_xinfo({name})") if row[6] in (2, 3)}
+
+def _layout_differs(cursor, table) -> bool:
+    """既存の列の並びがモデルと異なるか、生成列（ALTER TABLE では追加・変更できない）が無い・式が異なるか、
+    生成列だった列がモデルでは通常の列か、fill の指定された列（ALTER TABLE では途中に追加できない列）が無いか
+
+    通常の列でまだ追加されていないもの（起動時に ALTER TABLE で末尾に追加する列）は除いて比べる。
+    """
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_xinfo({table.name})")]
+    sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).fetchone()[0]
+    if any(c.computed is not None and (c.name not in columns or str(c.computed.sqltext) not in sql) for c in table.columns):
+        return True
+    generated = _generated(cursor, table.name)
+    if any(c.computed is None and (c.name in generated or ("fill" in c.info and c.name not in columns)) for c in table.columns):
+        return True
+    return columns != [c for c in table.columns.keys() if c in columns]
+
+def _stale_tables(cursor) -> list:
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [
+        table for table in Base.metadata.sorted_tables
+        if table.name in existing and table.foreign_key_constraints
+        and (_expected(table) != _actual(cursor, table.name) or _layout_differs(cursor, table))
+    ]
+
+def _rebuild(cursor, dialect, table):
+    """新しい定義でテーブルを作り、列をコピーして置き換える（インデックスも作り直す）
+
+    モデルでも生成列の列は新しいテーブルで計算し直される。生成列から通常の列になった列は保存済みの値をコピーし、
+    既存のテーブルに無い列で info["fill"]（SQL 式）の指定があるものはその値で埋める。
+    """
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_xinfo({table.name})")]
+    unknown = set(columns) - set(table.columns.keys())
+    if unknown:
+        raise RuntimeError(f"{table.name}: columns {sorted(unknown)} are not in the model; refusing to rebuild")
+    copied = [name for name in columns if table.columns[name].computed is None]
+    filled = {c.name: c.info["fill"] for c in table.columns if "fill" in c.info and c.name not in columns}
+
+    new_name = f"_new_{table.name}"
+    ddl = str(CreateTable(table).compile(dialect=dialect))
+    cursor.execute(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {new_name} ", 1))
+    column_list = ", ".join(copied + list(filled))
+    values = ", ".join(copied + list(filled.values()))
+    cursor.execute(f"INSERT INTO {new_name} ({column_list}) SELECT {values} FROM {table.name}")
+    cursor.execute(f"DROP TABLE {table.name}")
+    cursor.execute(f"ALTER TABLE {new_name} RENAME TO {table.name}")
+    for index in table.indexes:
+        cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+
+def _dependents(cursor, name: str) -> list:
+    """name のテーブルのトリガーと、name を参照するトリガー・ビューの [(種類, 名前, SQL)]（ビューが先）"""
+    pattern = re.compile(rf"\b{re.escape(name)}\b")
+    return [
+        (kind, obj, sql)
+        for kind, obj, table, sql in cursor.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('view', 'trigger') ORDER BY type DESC, name"
+        ).fetchall()
+        if table == name or pattern.search(sql)
+    ]
+
+def _remove_orphans(cursor) -> dict:
+    """参照先の無い行を ON DELETE の規則どおりに削除 / NULL 化する（テーブル名 -> 件数）
+
+    以前の実装ではユーザーを削除してもメモ・タグ等が残っていたため、その掃除も兼ねる。
+    連鎖する行（孤立したメモのタグ付けなど）が無くなるまで繰り返す。
+    """
+    removed, foreign_keys = {}, {}
+    while True:
+        violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+        if not violations:
+            return removed
+        for table, rowid, _, fk_id in violations:
+            if table not in foreign_keys:
+                foreign_keys[table] = _foreign_keys(cursor, table)
+            columns, _, on_delete = foreign_keys[table][fk_id]
+            if on_delete == "SET NULL":
+                assignments = ", ".join(f"{column} = NULL" for column in columns)
+                cursor.execute(f"UPDATE {table} SET {assignments} WHERE rowid = ?", (rowid,))
+            else:
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+            removed[table] = removed.get(table, 0) + 1
+
+def upgrade_foreign_keys(engine) -> bool:
+    """外部キーの定義または列の並びが古いテーブルを作り直す（作り直した場合は True）
+
+    作り直しの間は外部キー制約を無効にし、1 トランザクションで行う。トリガー・ビューは他のテーブルを
+    参照していて作り直しの妨げになるため全て削除する（呼び出し後に init_sync・init_memo_fts などで作り直すこと）。
+    """
+    raw = engine.raw_connection()
+    try:
+        dbapi_connection = raw.driver_connection
+        dbapi_connection.isolation_level = None  # BEGIN / COMMIT をこちらで発行する
+        cursor = dbapi_connection.cursor()
+        stale = _stale_tables(cursor)
+        if not stale:
+            return False
+
+        # foreign_keys はトランザクション外でしか切り替えられない
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, name in cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'view')").fetchall():
+                cursor.execute(f"DROP {kind.upper()} {name}")
+            for table in stale:
+                _rebuild(cursor, engine.dialect, table)
+            removed = _remove_orphans(cursor)
+            # 削除したメモが全文検索インデックスに残るため、索引を削除して init_memo_fts で作り直させる
+            # （参照先のビューも削除済みのため、ここでは 'rebuild' できない）
+            if removed.get("memos"):
+                cursor.execute("DROP TABLE IF EXISTS memos_fts")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        logger.warning(
+            "rebuilt tables to match the model (ON DELETE rules, columns): %s; removed orphaned rows: %s",
+            ", ".join(table.name for table in stale), removed or "none",
+        )
+        return True
+    finally:
+        # PRAGMA・isolation_level を変更した接続はプールに戻さない
+        raw.invalidate()
+
+def rebuild_table(engine, table) -> bool:
+    """列の構成がモデルと異なる 1 つのテーブルを作り直す（移行用。作り直した場合は True）
+
+    upgrade_foreign_keys と違い、そのテーブルのトリガーと、そのテーブルを参照するトリガー・ビューだけを
+    削除し、作り直した後に保存されていた定義のまま作り直す（行の ID は変わらないため全文検索の索引もそのまま）。
+    """
+    raw = engine.raw_connection()
+    try:
+        dbapi_connection = raw.driver_connection
+        dbapi_connection.isolation_level = None  # BEGIN / COMMIT をこちらで発行する
+        cursor = dbapi_connection.cursor()
+        if not _layout_differs(cursor, table):
+            return False
+
+        # foreign_keys はトランザクション外でしか切り替えられない
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            dependents = _dependents(cursor, table.name)
+            for kind, name, _ in dependents:
+                cursor.execute(f"DROP {kind.upper()} {name}")
+            _rebuild(cursor, engine.dialect, table)
+            for _, _, sql in dependents:
+                cursor.execute(sql)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        logger.warning(
+            "rebuilt table %s to match the model; recreated %d triggers and views", table.name, len(dependents),
+        )
+        return True
+    finally:
+        # PRAGMA・isolation_level を変更した接続はプールに戻さない
+        raw.invalidate()
@@ -0,0 +1,74 @@
+# fastapi-app/fts.py
+# memos.title / memos.content の全文検索インデックス（SQLite FTS5）
+
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger("memo.db")
+
+# 日本語は単語区切りが無いため trigram トークナイザを使用（3文字以上で部分一致）
+FTS_MIN_TOKEN_LENGTH = 3
+
+# 本文を平文に戻すビュー（memos.content は圧縮されている場合がある。compression.py）
+FTS_SOURCE = "memos_plain"
+
+# memos_plain を外部コンテンツとして参照し、本文は二重に持たない
+_DDL = [
+    f"""
+    CREATE VIEW IF NOT EXISTS {FTS_SOURCE} AS
+    SELECT id, title, memo_text(content) AS content FROM memos
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS memos_fts USING fts5(
+        title, content,
+        content='{FTS_SOURCE}', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    # トリガーで INSERT / UPDATE / DELETE を差分反映
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_ai AFTER INSERT ON memos BEGIN
+        INSERT INTO memos_fts(rowid, title, content) VALUES (new.id, new.title, memo_text(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_ad AFTER DELETE ON memos BEGIN
+        INSERT INTO memos_fts(memos_fts, rowid, title, content) VALUES ('delete', old.id, old.title, memo_text(old.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_fts_au AFTER UPDATE OF title, content ON memos BEGIN
+        INSERT INTO memos_fts(memos_fts, rowid, title, content) VALUES ('delete', old.id, old.title, memo_text(old.content));
+        INSERT INTO memos_fts(rowid, title, content) VALUES (new.id, new.title, memo_text(new.content));
+    END
+    """,
+]
+
+_TRIGGER_NAMES = ("memos_fts_ai", "memos_fts_ad", "memos_fts_au")
+
+def init_memo_fts(engine):
+    """FTS テーブルとトリガーを作成（新規作成時は既存メモから索引を構築）
+
+    memos を直接参照していた以前の索引（本文の圧縮に未対応）は作り直す。
+    """
+    with engine.begin() as conn:
+        sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'memos_fts'")
+        ).scalar()
+        exists = sql is not None and f"content='{FTS_SOURCE}'" in sql
+        if sql is not None and not exists:
+            logger.warning("recreating memos_fts on top of %s", FTS_SOURCE)
+            for name in _TRIGGER_NAMES:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text("DROP TABLE memos_fts"))
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text("INSERT INTO memos_fts(memos_fts) VALUES ('rebuild')"))
+
+def rebuild_memo_fts(engine):
+    """memos テーブルから索引を作り直す"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO memos_fts(memos_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO memos_fts(memos_fts) VALUES ('optimize')"))
@@ -0,0 +1,87 @@
+# fastapi-app/hashing.py
+# bcrypt のハッシュ化・検証を専用プロセスプールで実行する
+# （ログイン集中時にリクエスト用スレッドプールを CPU で塞がないため）
+
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# ===================================================
+# 設定
+# ===================================================
+BCRYPT_ROUNDS = 12      # コストを変えるとログイン時に自動で再ハッシュされる
+HASH_WORKERS = 2        # ハッシュ専用プロセス数
+HASH_QUEUE_SIZE = 32    # 実行中 + 待機中の上限（超えたら 503）
+HASH_RETRY_AFTER = 1    # 503 時の Retry-After（秒）
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashingBusy(Exception):
+    """ハッシュ待ち行列が満杯（呼び出し側は 503 を返す）"""
+
+# ===================================================
+# ワーカープロセス側で実行される関数
+# ===================================================
+def _hash(password_bytes: bytes, rounds: int) -> str:
+    return pwd_context.handler("bcrypt").using(rounds=rounds).hash(password_bytes)
+
+def _verify(password_bytes: bytes, hashed_password: str) -> bool:
+    return pwd_context.verify(password_bytes, hashed_password)
+
+# ===================================================
+# プール（初回利用時に起動）
+# ===================================================
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _executor
+
+def _submit(fn, *args):
+    """空きが無ければ待たずに HashingBusy を送出"""
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+# ===================================================
+# 公開 API（パスワードは最大72バイトに切り詰め）
+# ===================================================
+def _truncate(password: str) -> bytes:
+    return password.encode("utf-8")[:72]
+
+def hash_password(password: str) -> str:
+    return _submit(_hash, _truncate(password), BCRYPT_ROUNDS).result()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return _submit(_verify, _truncate(plain_password), hashed_password).result()
+
+async def hash_password_async(password: str) -> str:
+    """イベントループ上で待機（スレッドを占有しない）"""
+    return await asyncio.wrap_future(_submit(_hash, _truncate(password), BCRYPT_ROUNDS))
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(_submit(_verify, _truncate(plain_password), hashed_password))
+
+def needs_rehash(hashed_password: str) -> bool:
+    """設定中のコストと異なるハッシュなら True"""
+    return pwd_context.needs_update(hashed_password)
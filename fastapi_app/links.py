@@ -0,0 +1,114 @@
+# fastapi-app/links.py
+# メモの URL / ファイルパスの検索用テーブル：memos.urls / file_paths（JSON）を memo_urls / memo_files へ
+# トリガーで 1 要素 1 行に展開する（同じトランザクション内で親のメモと一緒に書き込まれ、
+# ORM を通らない一括 INSERT / UPDATE / DELETE でもずれない）
+
+from sqlalchemy import text
+
+# 既存メモを展開し直すときの 1 トランザクションあたりの件数
+LINK_BATCH_SIZE = 1000
+
+def _position(column: str, char: str) -> str:
+    """column 内で char が最初に現れる位置（無ければ末尾の次）"""
+    return f"(CASE instr({column}, '{char}') WHEN 0 THEN length({column}) + 1 ELSE instr({column}, '{char}') END)"
+
+def _url_rows(memo: str, source: str = "", where: str = "") -> str:
+    """memo_urls に入れる行の SELECT（memo は new または memos の別名）
+
+    ドメインは「スキーム:// の後からパス・クエリ・フラグメントの前まで」からユーザー情報とポートを除き、
+    小文字にしたもの（スキームの無い値は NULL）。
+    """
+    return f"""
+        SELECT memo_id, user_id, position, url,
+               NULLIF(lower(rtrim(CASE
+                   WHEN host LIKE '[%' THEN substr(host, 1, instr(host, ']'))
+                   WHEN instr(host, ':') > 0 THEN substr(host, 1, instr(host, ':') - 1)
+                   ELSE host
+               END, '.')), '')
+        FROM (
+            SELECT memo_id, user_id, position, url, substr(authority, instr(authority, '@') + 1) AS host
+            FROM (
+                SELECT memo_id, user_id, position, url,
+                       substr(rest, 1, min({_position("rest", "/")}, {_position("rest", "?")}, {_position("rest", "#")}) - 1) AS authority
+                FROM (
+                    SELECT {memo}.id AS memo_id, {memo}.user_id AS user_id, j.key AS position, j.value AS url,
+                           CASE WHEN instr(j.value, '://') > 0 THEN substr(j.value, instr(j.value, '://') + 3) END AS rest
+                    FROM {source}json_each({memo}.urls) AS j
+                    WHERE j.type = 'text'{where}
+                )
+            )
+        )
+    """
+
+def _file_rows(memo: str, source: str = "", where: str = "") -> str:
+    """memo_files に入れる行の SELECT"""
+    return f"""
+        SELECT {memo}.id, {memo}.user_id, j.key, j.value
+        FROM {source}json_each({memo}.file_paths) AS j
+        WHERE j.type = 'text'{where}
+    """
+
+_INSERT_URLS = "INSERT INTO memo_urls (memo_id, user_id, position, url, domain)"
+_INSERT_FILES = "INSERT INTO memo_files (memo_id, user_id, position, path)"
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS memos_links_ai AFTER INSERT ON memos BEGIN
+        {_INSERT_URLS} {_url_rows("new")};
+        {_INSERT_FILES} {_file_rows("new")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS memos_urls_au AFTER UPDATE OF urls ON memos
+    WHEN new.urls IS NOT old.urls BEGIN
+        DELETE FROM memo_urls WHERE memo_id = old.id;
+        {_INSERT_URLS} {_url_rows("new")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS memos_files_au AFTER UPDATE OF file_paths ON memos
+    WHEN new.file_paths IS NOT old.file_paths BEGIN
+        DELETE FROM memo_files WHERE memo_id = old.id;
+        {_INSERT_FILES} {_file_rows("new")};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS memos_links_ad AFTER DELETE ON memos BEGIN
+        DELETE FROM memo_urls WHERE memo_id = old.id;
+        DELETE FROM memo_files WHERE memo_id = old.id;
+    END
+    """,
+]
+
+def init_memo_links(engine):
+    """トリガーを作成する（初めて作成したときは既存メモの JSON を展開する）"""
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'memos_links_ai'")
+        ).first()
+        for ddl in _TRIGGERS:
+            conn.execute(text(ddl))
+    if not exists:
+        rebuild_memo_links(engine)
+
+def rebuild_memo_links(engine, batch_size: int = LINK_BATCH_SIZE) -> int:
+    """memos の JSON から memo_urls / memo_files を作り直す（id 順に batch_size 件ずつ別トランザクション）
+
+    範囲ごとに削除してから入れ直すため、途中で中断しても再実行すればよい。処理したメモの件数を返す。
+    """
+    where = " AND m.id > :after AND m.id <= :upto"
+    after, total = 0, 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                text("SELECT id FROM memos WHERE id > :after ORDER BY id LIMIT :n"),
+                {"after": after, "n": batch_size},
+            ).scalars().all()
+            if not ids:
+                return total
+            params = {"after": after, "upto": ids[-1]}
+            conn.execute(text("DELETE FROM memo_urls WHERE memo_id > :after AND memo_id <= :upto"), params)
+            conn.execute(text("DELETE FROM memo_files WHERE memo_id > :after AND memo_id <= :upto"), params)
+            conn.execute(text(f"{_INSERT_URLS} {_url_rows('m', 'memos AS m, ', where)}"), params)
+            conn.execute(text(f"{_INSERT_FILES} {_file_rows('m', 'memos AS m, ', where)}"), params)
+        after, total = ids[-1], total + len(ids)
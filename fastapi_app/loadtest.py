@@ -0,0 +1,456 @@
+# fastapi-app/loadtest.py
+# 負荷試験・レイテンシ回帰ベンチマーク
+# 一時ディレクトリに新しい SQLite DB を作って一括投入し、main.app の全エンドポイントを
+# インプロセスの ASGI クライアント（httpx.ASGITransport）から同時実行して、
+# ルートごとのスループットと p50/p95/p99 を JSON に記録する。基準値と比較し、劣化があれば失敗する。
+#
+#   python loadtest.py                                   # sync / async 両モードを実行して基準値と比較
+#   python loadtest.py --save-baseline                   # 結果を基準値として保存
+#   python loadtest.py --modes async --concurrency 500 --routes "GET /memos"
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "loadtest_baseline.json")
+
+# モードごとの環境変数（main の import 前に設定する必要があるため、モードごとに子プロセスで実行）
+MODES = {
+    "sync": {"MEMO_ASYNC_DB": "0"},
+    "async": {"MEMO_ASYNC_DB": "1"},
+    "sharded": {"MEMO_ASYNC_DB": "0", "MEMO_SHARDS": "4"},
+}
+
+PASSWORD = "bench-password"
+KEYWORD = "ベンチマーク"  # 検索ルート用（約 1% のメモに含める）
+BATCH_SIZE = 10           # 一括 API・インポート 1 リクエストあたりの件数
+# bcrypt を伴うルートはリクエスト数を別に指定する
+SLOW_ROUTES = {"POST /login", "POST /admin/users", "PUT /admin/users/{user_id}"}
+ATTACHMENT_BODY = bytes(range(256)) * 256  # 添付ファイルのルート用（64 KiB、全ユーザー共通の 1 blob）
+
+# ===================================================
+# データ投入
+# ===================================================
+class Fixture:
+    """投入したデータの ID（リクエストの組み立てに使用）"""
+
+    def __init__(self):
+        self.admin = None
+        self.users = []          # [{"id", "username", "headers", "memos", "tags", "categories", "attachments"}]
+        self.pools = {}          # 削除系ルート用：1 リクエストごとに 1 つずつ消費する (user, id)
+        self.spare_users = []    # DELETE /admin/users 用
+        self.rename_user = None  # PUT /admin/users 用
+
+def _token_headers(username: str, role: str) -> dict:
+    from jose import jwt
+    from main import SECRET_KEY, ALGORITHM
+    token = jwt.encode({"sub": username, "role": role, "exp": datetime.utcnow() + timedelta(hours=6)}, SECRET_KEY, algorithm=ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+def seed(engine, args, pool_size: int) -> Fixture:
+    """users × (memos, tags, categories) を executemany で投入（ID は採番済みで入れる）"""
+    from sqlalchemy import text
+    from hashing import hash_password
+    from attachments import attachment_store, StagedUpload
+    from models.memo import memo_preview
+
+    fixture = Fixture()
+    hashed = hash_password(PASSWORD)  # 全ユーザー共通（bcrypt は 1 回だけ）
+    base = datetime(2024, 1, 1)
+    users, memos, tags, categories, links, attachments = [], [], [], [], [], []
+    next_id = {"memo": 1, "tag": 1, "category": 1, "attachment": 1}
+
+    def new_id(kind):
+        next_id[kind] += 1
+        return next_id[kind] - 1
+
+    users.append({"id": 1, "username": "admin", "hashed_password": hashed, "role": "admin"})
+    fixture.admin = {"id": 1, "username": "admin", "headers": _token_headers("admin", "admin")}
+
+    per_user_pool = math.ceil(pool_size / args.users)
+    for n in range(args.users):
+        user_id, username = n + 2, f"user{n}"
+        users.append({"id": user_id, "username": username, "hashed_password": hashed, "role": "user"})
+        user = {"id": user_id, "username": username, "headers": _token_headers(username, "user"),
+                "memos": [], "tags": [], "categories": [], "attachments": []}
+        for kind, table, count in (("tag", tags, args.tags), ("category", categories, args.categories)):
+            for k in range(count + per_user_pool):
+                row_id = new_id(kind)
+                table.append({"id": row_id, "name": f"{kind}-{user_id}-{k}", "user_id": user_id, "at": base})
+                if k < count:
+                    user["tags" if kind == "tag" else "categories"].append(row_id)
+                else:
+                    fixture.pools.setdefault(kind, []).append((user, row_id))
+        # 削除系（1 件削除・一括削除）の分も余分に作る
+        for k in range(args.memos + per_user_pool * (1 + BATCH_SIZE)):
+            memo_id = new_id("memo")
+            words = f"memo {memo_id} " + ("本文 " * 20) + (KEYWORD if memo_id % 100 == 0 else "")
+            memos.append({
+                "id": memo_id,
+                "title": f"memo {memo_id}",
+                "content": words,
+                "preview": memo_preview(words),
+                "category_id": user["categories"][k % len(user["categories"])] if user["categories"] else None,
+                "user_id": user_id,
+                "at": base + timedelta(seconds=memo_id),
+            })
+            for t in user["tags"][k % 3:k % 3 + 2]:
+                links.append({"memo_id": memo_id, "tag_id": t})
+            if k < args.memos:
+                user["memos"].append(memo_id)
+            else:
+                fixture.pools.setdefault("memo", []).append((user, memo_id))
+        # 添付ファイル（削除用の分は削除されないメモに付ける）
+        for k in range(1 + per_user_pool):
+            attachment_id, memo_id = new_id("attachment"), user["memos"][k % len(user["memos"])]
+            attachments.append({"id": attachment_id, "memo_id": memo_id, "user_id": user_id, "filename": f"file-{attachment_id}.bin", "at": base})
+            if k == 0:
+                user["attachments"].append((memo_id, attachment_id))
+            else:
+                fixture.pools.setdefault("attachment", []).append((user, f"{memo_id}/attachments/{attachment_id}"))
+        fixture.users.append(user)
+
+    for k in range(pool_size + 1):
+        user_id = args.users + 2 + k
+        users.append({"id": user_id, "username": f"spare{k}", "hashed_password": hashed, "role": "user"})
+        fixture.spare_users.append(user_id)
+    fixture.rename_user = fixture.spare_users.pop()
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, hashed_password, role) VALUES (:id, :username, :hashed_password, :role)"), users)
+        conn.execute(text("INSERT INTO tags (id, name, user_id, created_at, updated_at) VALUES (:id, :name, :user_id, :at, :at)"), tags)
+        conn.execute(text("INSERT INTO categories (id, name, user_id, created_at, updated_at) VALUES (:id, :name, :user_id, :at, :at)"), categories)
+        conn.execute(
+            text("INSERT INTO memos (id, title, content, preview, category_id, file_paths, urls, important, user_id, created_at, updated_at) "
+                 "VALUES (:id, :title, :content, :preview, :category_id, '[]', '[]', 1, :user_id, :at, :at)"),
+            memos,
+        )
+        if links:
+            conn.execute(text("INSERT INTO memo_tags (memo_id, tag_id) VALUES (:memo_id, :tag_id)"), links)
+        if attachments:
+            sha256 = hashlib.sha256(ATTACHMENT_BODY).hexdigest()
+            conn.execute(text("INSERT INTO blobs (sha256, size, created_at) VALUES (:sha256, :size, :at)"),
+                         {"sha256": sha256, "size": len(ATTACHMENT_BODY), "at": base})
+            conn.execute(
+                text("INSERT INTO memo_attachments (id, memo_id, user_id, sha256, filename, content_type, size, created_at) "
+                     "VALUES (:id, :memo_id, :user_id, :sha256, :filename, 'application/octet-stream', :size, :at)"),
+                [{**a, "sha256": sha256, "size": len(ATTACHMENT_BODY)} for a in attachments],
+            )
+            staged_path = os.path.join(tempfile.mkdtemp(), "blob")
+            with open(staged_path, "wb") as f:
+                f.write(ATTACHMENT_BODY)
+            attachment_store.place(StagedUpload(attachment_store, staged_path, sha256, len(ATTACHMENT_BODY)))
+    return fixture
+
+# ===================================================
+# ルート定義：request(i) -> httpx.AsyncClient.request の引数
+# ===================================================
+def build_routes(fixture: Fixture) -> dict:
+    users = fixture.users
+    admin = fixture.admin["headers"]
+    pools = {kind: iter(items) for kind, items in fixture.pools.items()}
+    spare_users = iter(fixture.spare_users)
+
+    def user(i):
+        return users[i % len(users)]
+
+    def pick(items, i):
+        return items[(i * 7919) % len(items)]
+
+    def pop(kind):
+        owner, row_id = next(pools[kind])
+        return owner, row_id
+
+    def delete_one(kind, path):
+        def request(i):
+            owner, row_id = pop(kind)
+            return {"method": "DELETE", "url": f"{path}/{row_id}", "headers": owner["headers"]}
+        return request
+
+    def delete_batch(i):
+        picked = [pop("memo") for _ in range(BATCH_SIZE)]
+        # 同一ユーザーのメモのみを対象にする（他人のメモは Not found になるため）
+        owner = picked[0][0]
+        ids = [row_id for u, row_id in picked if u is owner]
+        return {"method": "DELETE", "url": "/memos/batch", "headers": owner["headers"], "json": {"ids": ids}}
+
+    def import_body(i):
+        lines = [json.dumps({"title": f"imported {i}-{k}", "content": "x" * 100, "tags": ["imported"]}) for k in range(BATCH_SIZE)]
+        return ("\n".join(lines) + "\n").encode()
+
+    return {
+        "POST /login": lambda i: {"method": "POST", "url": "/login", "json": {"username": user(i)["username"], "password": PASSWORD}},
+
+        "GET /categories": lambda i: {"method": "GET", "url": "/categories", "headers": user(i)["headers"]},
+        "GET /categories/{category_id}": lambda i: {"method": "GET", "url": f"/categories/{pick(user(i)['categories'], i)}", "headers": user(i)["headers"]},
+        "POST /categories": lambda i: {"method": "POST", "url": "/categories", "headers": user(i)["headers"], "json": {"name": f"new-category-{i}"}},
+        "PUT /categories/{category_id}": lambda i: {"method": "PUT", "url": f"/categories/{pick(user(i)['categories'], i)}", "headers": user(i)["headers"],
+                                                    "json": {"name": f"renamed-category-{i}", "description": "updated"}},
+        "DELETE /categories/{category_id}": delete_one("category", "/categories"),
+
+        "GET /tags": lambda i: {"method": "GET", "url": "/tags", "headers": user(i)["headers"]},
+        "GET /tags/{tag_id}": lambda i: {"method": "GET", "url": f"/tags/{pick(user(i)['tags'], i)}", "headers": user(i)["headers"]},
+        "POST /tags": lambda i: {"method": "POST", "url": "/tags", "headers": user(i)["headers"], "json": {"name": f"new-tag-{i}", "color": "#336699"}},
+        "PUT /tags/{tag_id}": lambda i: {"method": "PUT", "url": f"/tags/{pick(user(i)['tags'], i)}", "headers": user(i)["headers"],
+                                         "json": {"name": f"renamed-tag-{i}", "color": "#996633"}},
+        "DELETE /tags/{tag_id}": delete_one("tag", "/tags"),
+
+        "GET /memos": lambda i: {"method": "GET", "url": "/memos", "headers": user(i)["headers"]},
+        "GET /memos?fields": lambda i: {"method": "GET", "url": "/memos", "headers": user(i)["headers"],
+                                        "params": {"fields": "title,preview,category_id,important,created_at,tags"}},
+        "GET /memos/{memo_id}": lambda i: {"method": "GET", "url": f"/memos/{pick(user(i)['memos'], i)}", "headers": user(i)["headers"]},
+        "POST /memos": lambda i: {"method": "POST", "url": "/memos", "headers": user(i)["headers"],
+                                  "json": {"title": f"new memo {i}", "content": "本文 " * 50, "tag_ids": user(i)["tags"][:2]}},
+        "PUT /memos/{memo_id}": lambda i: {"method": "PUT", "url": f"/memos/{pick(user(i)['memos'], i)}", "headers": user(i)["headers"],
+                                           "json": {"title": f"updated memo {i}", "content": "更新 " * 50, "tag_ids": user(i)["tags"][1:3]}},
+        "DELETE /memos/{memo_id}": delete_one("memo", "/memos"),
+        "GET /memos/search": lambda i: {"method": "GET", "url": "/memos/search", "headers": user(i)["headers"], "params": {"q": KEYWORD}},
+        "GET /memos/{memo_id}/related": lambda i: {"method": "GET", "url": f"/memos/{pick(user(i)['memos'], i)}/related", "headers": user(i)["headers"]},
+        "POST /memos/batch": lambda i: {"method": "POST", "url": "/memos/batch", "headers": user(i)["headers"],
+                                        "json": {"items": [{"title": f"batch {i}-{k}", "tag_ids": user(i)["tags"][:1]} for k in range(BATCH_SIZE)]}},
+        "PATCH /memos/batch": lambda i: {"method": "PATCH", "url": "/memos/batch", "headers": user(i)["headers"],
+                                         "json": {"items": [{"id": pick(user(i)["memos"], i * BATCH_SIZE + k), "important": k % 2} for k in range(BATCH_SIZE)]}},
+        "DELETE /memos/batch": delete_batch,
+        "GET /memos/export": lambda i: {"method": "GET", "url": "/memos/export", "headers": user(i)["headers"]},
+        "POST /memos/import": lambda i: {"method": "POST", "url": "/memos/import", "headers": user(i)["headers"], "content": import_body(i)},
+        "POST /memos/{memo_id}/attachments": lambda i: {"method": "POST", "url": f"/memos/{pick(user(i)['memos'], i)}/attachments",
+                                                        "headers": user(i)["headers"], "params": {"filename": f"upload-{i}.bin"}, "content": ATTACHMENT_BODY},
+        "GET /memos/{memo_id}/attachments": lambda i: {"method": "GET", "url": f"/memos/{user(i)['attachments'][0][0]}/attachments", "headers": user(i)["headers"]},
+        "GET /memos/{memo_id}/attachments/{attachment_id}": lambda i: {"method": "GET", "url": "/memos/{}/attachments/{}".format(*user(i)["attachments"][0]),
+                                                                       "headers": user(i)["headers"]},
+        "DELETE /memos/{memo_id}/attachments/{attachment_id}": delete_one("attachment", "/memos"),
+        "GET /bootstrap": lambda i: {"method": "GET", "url": "/bootstrap", "headers": user(i)["headers"]},
+        "GET /sync": lambda i: {"method": "GET", "url": "/sync", "headers": user(i)["headers"]},
+
+        "GET /admin/users": lambda i: {"method": "GET", "url": "/admin/users", "headers": admin},
+        "GET /admin/users/{user_id}": lambda i: {"method": "GET", "url": f"/admin/users/{user(i)['id']}", "headers": admin},
+        "POST /admin/users": lambda i: {"method": "POST", "url": "/admin/users", "headers": admin, "json": {"username": f"created{i}", "password": PASSWORD}},
+        "PUT /admin/users/{user_id}": lambda i: {"method": "PUT", "url": f"/admin/users/{fixture.rename_user}", "headers": admin,
+                                                 "json": {"username": f"renamed{i}", "password": PASSWORD}},
+        "DELETE /admin/users/{user_id}": lambda i: {"method": "DELETE", "url": f"/admin/users/{next(spare_users)}", "headers": admin},
+        "GET /admin/auth-cache": lambda i: {"method": "GET", "url": "/admin/auth-cache", "headers": admin},
+        "GET /admin/bootstrap-cache": lambda i: {"method": "GET", "url": "/admin/bootstrap-cache", "headers": admin},
+        "GET /admin/related-cache": lambda i: {"method": "GET", "url": "/admin/related-cache", "headers": admin},
+        "GET /admin/metrics": lambda i: {"method": "GET", "url": "/admin/metrics", "headers": admin},
+    }
+
+def uncovered_routes(app, routes: dict) -> list:
+    """main.app に登録されているのにルート定義がないもの"""
+    from fastapi.routing import APIRoute
+    registered = {f"{method} {route.path}" for route in app.routes if isinstance(route, APIRoute) for method in route.methods}
+    return sorted(registered - set(routes))
+
+# ===================================================
+# 計測
+# ===================================================
+def _percentile(sorted_values: list, p: float) -> float:
+    """最近接順位法"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400)),
+        "statuses": {str(status): n for status, n in sorted(statuses.items(), key=str)},
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+async def drive(client, request, start: int, count: int, concurrency: int) -> dict:
+    """request(i) を count 回、concurrency 本のワーカーで実行する"""
+    latencies, statuses = [], {}
+    indexes = iter(range(start, start + count))
+
+    async def worker():
+        for i in indexes:
+            kwargs = request(i)
+            started = time.perf_counter()
+            try:
+                status = (await client.request(**kwargs)).status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, count)))))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+async def run_routes(app, routes: dict, args) -> dict:
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        for name, request in routes.items():
+            count = args.slow_requests if name in SLOW_ROUTES else args.requests
+            await drive(client, request, count, args.warmup, 1)  # ウォームアップ（計測に含めない）
+            results[name] = await drive(client, request, 0, count, args.concurrency)
+            print(f"  {name:36s} {_format(results[name])}", file=sys.stderr)
+
+        if args.login_flood and "POST /login" in routes and "GET /memos" in routes:
+            # ログイン集中時に他のルートの遅延が悪化しないか（bcrypt はプロセスプールで待つ）
+            offset = args.slow_requests + args.warmup
+            flood, reads = await asyncio.gather(
+                drive(client, routes["POST /login"], offset, args.login_flood, args.concurrency),
+                drive(client, routes["GET /memos"], offset, args.requests, args.concurrency),
+            )
+            results["POST /login [login flood]"] = flood
+            results["GET /memos [login flood]"] = reads
+            for name in ("POST /login [login flood]", "GET /memos [login flood]"):
+                print(f"  {name:36s} {_format(results[name])}", file=sys.stderr)
+    return results
+
+def _format(r: dict) -> str:
+    return (f"{r['rps']:9.1f} req/s  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms"
+            + (f"  errors {r['errors']} {r['statuses']}" if r["errors"] else ""))
+
+def run_mode(args) -> dict:
+    """子プロセス側：一時ディレクトリに新しい DB を作って 1 モード分を計測"""
+    workdir = tempfile.mkdtemp(prefix="memo-loadtest-")
+    os.chdir(workdir)  # db.py の URL（./memos.db）を一時ディレクトリに向ける
+    sys.path.insert(0, HERE)
+    import main
+    from db import get_engine
+    from migrations import migrate
+    from shards import shard_pool
+    from shard_split import split_shards
+    from attachments import attachment_store
+
+    async def run():
+        # 削除系ルートは 1 リクエストで 1 件（一括は BATCH_SIZE 件）消費する
+        pool_size = max(args.requests, args.slow_requests) + args.warmup + args.login_flood
+        started = time.perf_counter()
+        # 起動前に投入する（シャード使用時は投入した DB を manage.py split-shards と同じ手順で分割してから起動する）
+        migrate(get_engine())
+        fixture = seed(get_engine(), args, pool_size)
+        if shard_pool.enabled:
+            split_shards(get_engine(), shard_pool, attachment_store)
+        print(f"[{args.worker}] seeded {args.users} users × {args.memos} memos in {time.perf_counter() - started:.1f}s ({workdir})", file=sys.stderr)
+
+        # httpx.ASGITransport は lifespan を送らないため、起動・終了処理（スキーマの確認・バックグラウンド処理）をここで行う
+        async with main.app.router.lifespan_context(main.app):
+            routes = build_routes(fixture)
+            missing = uncovered_routes(main.app, routes)
+            if missing:
+                print(f"[{args.worker}] WARNING: routes without a load-test definition: {', '.join(missing)}", file=sys.stderr)
+            if args.routes:
+                unknown = set(args.routes) - set(routes)
+                if unknown:
+                    raise SystemExit(f"unknown routes: {', '.join(sorted(unknown))}")
+                routes = {name: request for name, request in routes.items() if name in args.routes}
+            return await run_routes(main.app, routes, args)
+
+    return asyncio.run(run())
+
+# ===================================================
+# 基準値との比較
+# ===================================================
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """劣化（遅延が threshold 倍以上かつ min_delta_ms 以上増加、またはスループット低下）の一覧"""
+    regressions = []
+    for mode, routes in current["modes"].items():
+        for name, cur in routes.items():
+            base = baseline.get("modes", {}).get(mode, {}).get(name)
+            if base is None:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if cur[key] > base[key] * (1 + threshold) and cur[key] - base[key] > min_delta_ms:
+                    regressions.append(f"[{mode}] {name}: {key} {base[key]} -> {cur[key]}")
+            if cur["rps"] < base["rps"] * (1 - threshold):
+                regressions.append(f"[{mode}] {name}: rps {base['rps']} -> {cur['rps']}")
+    return regressions
+
+def unexpected_errors(current: dict) -> list:
+    """5xx・例外（ログイン集中時の 503 は想定内のため除く）"""
+    return [
+        f"[{mode}] {name}: {r['statuses']}"
+        for mode, routes in current["modes"].items()
+        for name, r in routes.items()
+        if r["errors"] and "[login flood]" not in name
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test and latency regression check")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--memos", type=int, default=1_000, help="memos per user")
+    parser.add_argument("--tags", type=int, default=20, help="tags per user")
+    parser.add_argument("--categories", type=int, default=10, help="categories per user")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--slow-requests", type=int, default=20, help="requests per route for bcrypt-bound routes")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--login-flood", type=int, default=200, help="logins fired alongside GET /memos (0 to skip)")
+    parser.add_argument("--routes", nargs="+", help='only run these routes, e.g. "GET /memos"')
+    parser.add_argument("--output", default="loadtest_result.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency regressions smaller than this")
+    parser.add_argument("--worker", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker_output, "w") as f:
+            json.dump(run_mode(args), f)
+        return
+
+    result = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            **{key: getattr(args, key) for key in ("users", "memos", "tags", "categories", "concurrency", "requests", "slow_requests", "login_flood")},
+        },
+        "modes": {},
+    }
+    for mode in args.modes:
+        print(f"== {mode} ==", file=sys.stderr)
+        with tempfile.NamedTemporaryFile(suffix=".json") as out:
+            argv = [a for a in sys.argv[1:] if a != "--save-baseline"]
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *argv, "--worker", mode, "--worker-output", out.name],
+                env={**os.environ, **MODES[mode]}, check=True,
+            )
+            with open(out.name) as f:
+                result["modes"][mode] = json.load(f)
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    failures = unexpected_errors(result)
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures += compare(result, json.load(f), args.threshold, args.min_delta_ms)
+    else:
+        print(f"no baseline at {args.baseline} (run with --save-baseline to create one)")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+    print("OK: no regressions")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,65 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi import Header
+from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from fastapi import Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import NoMatchFound
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, FileResponse
+from sqlalchemy.orm import Session, configure_mappers
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+import gc
+import json
+import tempfile
 from jose import jwt, JWTError
 
-from db import Base, engine, get_db
+import db as database
+from db import get_db, get_async_db, USE_ASYNC_DB, init_engines, dispose_engines, prewarm_pools
+from settings import Settings
+from migrations import migrate, check_schema, migrate_shards, check_shards
+from shards import shard_pool, shard_of, check_layout
+from write_queue import write_queue
+from user_deletion import user_deleter
+from attachments import (
+    ATTACHMENT_MAX_BYTES,
+    AttachmentTooLarge,
+    attachment_collector,
+    attachment_store,
+    shard_store,
+)
+from principal_cache import Principal, principal_cache
+from bootstrap_cache import bootstrap_cache, bootstrap_etag
+from events import event_hub, RETRY, RESYNC
+from related import RELATED, related_cache
+from fast_json import FAST_JSON, FastJSONResponse
+from metrics import metrics, MetricsMiddleware
+from hashing import (
+    HashingBusy,
+    HASH_RETRY_AFTER,
+    hash_password_async,
+    verify_password_async,
+    needs_rehash,
+)
 
 # ===================================================
 # CRUD
 # ===================================================
 from crud.user import (
     create_user,
-    authenticate_user,
-    get_users,
+    create_user_mirror,
+    get_user_rows,
     get_user,
     update_user,
     delete_user,
+    mark_user_deleted,
+    purge_user_chunk,
     get_user_by_username,
+    set_password_hash,
 )
 from crud.category import (
     get_categories,
+    get_category_rows,
     get_category,
     create_category,
     update_category,
@@ -28,6 +67,7 @@ from crud.category import (
 )
 from crud.tag import (
     get_tags,
+    get_tag_rows,
     get_tag,
     create_tag,
     update_tag,
@@ -35,38 +75,65 @@ from crud.tag import (
 )
 from crud.memo import (
     get_memos,
+    get_memo_rows,
+    parse_memo_fields,
     get_memo,
+    search_memos,
     create_memo,
     update_memo,
     delete_memo,
+    create_memos_batch,
+    update_memos_batch,
+    delete_memos_batch,
+    MemoSort,
+)
+
+from crud import memo_async, tag_async, category_async
+from crud.sync import get_changes, get_sync_token, SyncTokenExpired
+from crud.related import get_related_memos
+from crud.memo_io import (
+    count_memos,
+    export_ndjson,
+    export_csv,
+    parse_ndjson,
+    parse_csv,
+    iter_import_batches,
+    import_memos_batch,
+    IMPORT_MAX_BYTES,
+)
+from crud.attachment import (
+    memo_exists,
+    get_attachments,
+    get_attachment,
+    create_attachment,
+    delete_attachment,
 )
 
 # ===================================================
 # Schemas
 # ===================================================
-from schemas.user import UserCreate, UserLogin, UserResponse
+from schemas.user import UserCreate, UserLogin, UserResponse, AdminUserResponse
+from schemas.sync import SyncResponse
+from schemas.bootstrap import BootstrapResponse
 from schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse
 from schemas.tag import TagCreate, TagUpdate, TagResponse
-from schemas.memo import MemoCreate, MemoUpdate, MemoResponse
-
-# ===================================================
-# Models（Base 登録）
-# ===================================================
-import models.user
-import models.category
-import models.tag
-import models.memo
+from schemas.memo import (
+    MemoCreate,
+    MemoUpdate,
+    MemoResponse,
+    MemoSearchResult,
+    MemoRelated,
+    MemoBatchCreate,
+    MemoBatchUpdate,
+    MemoBatchDelete,
+    MemoBatchResult,
+)
+from schemas.attachment import AttachmentResponse
 
 # ===================================================
-# DB 初期化
+# 同期・非同期モード共通の API（認証・検索・一括操作・管理者用など。create_app で登録）
 # ===================================================
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    docs_url=None,
-    redoc_url=None,
-    openapi_url=None
-)
+router = APIRouter()
 
 # ===================================================
 # CORS
@@ -76,13 +143,16 @@ origins = [
     "http://localhost:8080",
     "http://127.0.0.1:8080",
 ]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+# ===================================================
+# bcrypt 待ち行列が満杯 → 503（すぐに失敗させる）
+# ===================================================
+async def hashing_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many login attempts, please retry"},
+        headers={"Retry-After": str(HASH_RETRY_AFTER)},
+    )
 
 # ===================================================
 # JWT 設定
@@ -108,80 +178,125 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24    #60 分 × 24 時間 = 1440分間
 # JWT デコード
 # ===================================================
 def decode_token(token: str):
+    """(username, exp) を返す"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if not username:
             raise HTTPException(status_code=401, detail="Invalid token payload")
-        return username
+        return username, payload.get("exp")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # ===================================================
 # 認証 Dependencies
 # ===================================================
-def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)):
+def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)) -> Principal:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     token = authorization.split(" ")[1]
-    username = decode_token(token)
+
+    # キャッシュ済みなら JWT 検証・DB 参照とも省略（エントリは exp を超えて保持しない）
+    principal = principal_cache.get(token)
+    if principal:
+        return principal
+
+    username, exp = decode_token(token)
     user = get_user_by_username(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    principal = Principal(id=user.id, username=user.username, role=user.role)
+    principal_cache.put(token, principal, token_exp=exp)
+    return principal
 
-def get_current_admin(authorization: str = Header(...), db: Session = Depends(get_db)):
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-    token = authorization.split(" ")[1]
-    username = decode_token(token)
-    admin = get_user_by_username(db, username)
-    if not admin:
-        raise HTTPException(status_code=404, detail="Admin not found")
-    if admin.role != "admin":
+def get_current_admin(user: Principal = Depends(get_current_user)) -> Principal:
+    if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    return admin
+    return user
+
+# ===================================================
+# ユーザーのデータ（メモ・タグ・カテゴリ等）の DB セッション
+# シャード使用時（shards.py）はユーザーのシャード、それ以外は認証と同じ中央 DB のセッション
+# ===================================================
+def get_user_db(user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not shard_pool.enabled:
+        yield db
+        return
+    # 中央 DB は認証にしか使わないため、接続をここで返す
+    db.close()
+    with shard_pool.use(user.id) as shard, shard.session() as user_db:
+        yield user_db
+
+# ===================================================
+# 書き込み（USE_WRITE_QUEUE 時は単一ライターでまとめてコミット）
+# ===================================================
+def write(db: Session | None, fn, *args):
+    """db の接続先（シャード）の単一ライターで実行。db が None の場合は中央 DB に専用のセッションを開いて実行"""
+    if db is None:
+        return shard_pool.central.write(fn, *args)
+    return shard_of(db).write(fn, *args, db=db)
 
 # ===================================================
 # 認証 API
 # ===================================================
-@app.post("/login")
-def login(data: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, data.username, data.password)
-    if not user:
+@router.post("/login")
+async def login(data: UserLogin, db: Session = Depends(get_db)):
+    # DB はスレッドプール、bcrypt は専用プロセスプールで待つ（イベントループは塞がない）
+    user = await run_in_threadpool(get_user_by_username, db, data.username)
+    if not user or not await verify_password_async(data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid username or password")
+    username, role = user.username, user.role
+
+    # bcrypt コストが変更されていれば透過的に再ハッシュ（混雑時は次回に回す）
+    if needs_rehash(user.hashed_password):
+        try:
+            new_hash = await hash_password_async(data.password)
+            await run_in_threadpool(set_password_hash, db, user, new_hash)
+        except HashingBusy:
+            pass
+
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    token = jwt.encode({"sub": user.username, "role": user.role, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+    token = jwt.encode({"sub": username, "role": role, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
     return {"access_token": token}
 
+# ===================================================
+# メモ・タグ・カテゴリ API
+# 同期版（crud_router）と非同期版（async_crud_router）を用意し、
+# USE_ASYNC_DB に応じて末尾でどちらか一方を登録する
+# ===================================================
+crud_router = APIRouter()
+async_crud_router = APIRouter()
+
 # ===================================================
 # カテゴリ CRUD（ユーザー制約）
 # ===================================================
-@app.get("/categories", response_model=list[CategoryResponse])
-def read_categories(user=Depends(get_current_user), db: Session = Depends(get_db)):
+@crud_router.get("/categories", response_model=list[CategoryResponse])
+def read_categories(user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    if FAST_JSON:
+        return FastJSONResponse(get_category_rows(db, user.id))
     return get_categories(db, user.id)
 
-@app.get("/categories/{category_id}", response_model=CategoryResponse)
-def read_category(category_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+@crud_router.get("/categories/{category_id}", response_model=CategoryResponse)
+def read_category(category_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
     category = get_category(db, category_id, user.id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
 
-@app.post("/categories", response_model=CategoryResponse)
-def create_category_endpoint(category: CategoryCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    return create_category(db, category, user.id)
+@crud_router.post("/categories", response_model=CategoryResponse)
+def create_category_endpoint(category: CategoryCreate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    return write(db, create_category, category, user.id)
 
-@app.put("/categories/{category_id}", response_model=CategoryResponse)
-def update_category_endpoint(category_id: int, category: CategoryUpdate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    updated = update_category(db, category_id, category, user.id)
+@crud_router.put("/categories/{category_id}", response_model=CategoryResponse)
+def update_category_endpoint(category_id: int, category: CategoryUpdate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    updated = write(db, update_category, category_id, category, user.id)
     if not updated:
         raise HTTPException(status_code=404, detail="Category not found")
     return updated
 
-@app.delete("/categories/{category_id}")
-def delete_category_endpoint(category_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    ok = delete_category(db, category_id, user.id)
+@crud_router.delete("/categories/{category_id}")
+def delete_category_endpoint(category_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    ok = write(db, delete_category, category_id, user.id)
     if not ok:
         raise HTTPException(status_code=404, detail="Category not found")
     return {"result": "ok"}
@@ -189,31 +304,33 @@ def delete_category_endpoint(category_id: int, user=Depends(get_current_user), d
 # ===================================================
 # タグ CRUD（ユーザー制約）
 # ===================================================
-@app.get("/tags", response_model=list[TagResponse])
-def read_tags(user=Depends(get_current_user), db: Session = Depends(get_db)):
+@crud_router.get("/tags", response_model=list[TagResponse])
+def read_tags(user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    if FAST_JSON:
+        return FastJSONResponse(get_tag_rows(db, user.id))
     return get_tags(db, user.id)
 
-@app.get("/tags/{tag_id}", response_model=TagResponse)
-def read_tag(tag_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+@crud_router.get("/tags/{tag_id}", response_model=TagResponse)
+def read_tag(tag_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
     tag = get_tag(db, tag_id, user.id)
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
     return tag
 
-@app.post("/tags", response_model=TagResponse)
-def create_tag_endpoint(tag: TagCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    return create_tag(db, tag, user.id)
+@crud_router.post("/tags", response_model=TagResponse)
+def create_tag_endpoint(tag: TagCreate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    return write(db, create_tag, tag, user.id)
 
-@app.put("/tags/{tag_id}", response_model=TagResponse)
-def update_tag_endpoint(tag_id: int, tag: TagUpdate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    updated = update_tag(db, tag_id, tag, user.id)
+@crud_router.put("/tags/{tag_id}", response_model=TagResponse)
+def update_tag_endpoint(tag_id: int, tag: TagUpdate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    updated = write(db, update_tag, tag_id, tag, user.id)
     if not updated:
         raise HTTPException(status_code=404, detail="Tag not found")
     return updated
 
-@app.delete("/tags/{tag_id}")
-def delete_tag_endpoint(tag_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    ok = delete_tag(db, tag_id, user.id)
+@crud_router.delete("/tags/{tag_id}")
+def delete_tag_endpoint(tag_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    ok = write(db, delete_tag, tag_id, user.id)
     if not ok:
         raise HTTPException(status_code=404, detail="Tag not found")
     return {"result": "ok"}
@@ -221,63 +338,761 @@ def delete_tag_endpoint(tag_id: int, user=Depends(get_current_user), db: Session
 # ===================================================
 # メモ CRUD（ユーザー制約）
 # ===================================================
-@app.get("/memos", response_model=list[MemoResponse])
-def read_memos(user=Depends(get_current_user), db: Session = Depends(get_db)):
-    return get_memos(db, user.id)
+@crud_router.get("/memos", response_model=list[MemoResponse])
+def read_memos(
+    response: Response,
+    category_id: int | None = None,
+    tag_id: int | None = None,
+    important: int | None = None,
+    url: str | None = None,
+    domain: str | None = None,
+    file_path: str | None = None,
+    sort: MemoSort = "updated_desc",
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    fields: str | None = Query(None, max_length=200),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    try:
+        # 項目指定（fields=）があれば指定の列だけを SELECT して dict で返す
+        projection = {"fields": parse_memo_fields(fields)} if fields else {}
+        memos, next_cursor = (get_memo_rows if FAST_JSON or fields else get_memos)(
+            db, user.id,
+            category_id=category_id,
+            tag_id=tag_id,
+            important=important,
+            url=url,
+            domain=domain,
+            file_path=file_path,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            **projection,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 次ページのカーソルはヘッダで返す（レスポンス本体は従来通りの配列）
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if FAST_JSON or fields:
+        return FastJSONResponse(memos, headers=headers)
+    response.headers.update(headers)
+    return memos
 
-@app.get("/memos/{memo_id}", response_model=MemoResponse)
-def read_memo(memo_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+@crud_router.get("/memos/{memo_id}", response_model=MemoResponse)
+def read_memo(memo_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
     memo = get_memo(db, memo_id, user.id)
     if not memo:
         raise HTTPException(status_code=404, detail="Memo not found")
     return memo
 
-@app.post("/memos", response_model=MemoResponse)
-def create_memo_endpoint(memo: MemoCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    return create_memo(db, memo, user.id)
+@crud_router.post("/memos", response_model=MemoResponse)
+def create_memo_endpoint(memo: MemoCreate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    return write(db, create_memo, memo, user.id)
 
-@app.put("/memos/{memo_id}", response_model=MemoResponse)
-def update_memo_endpoint(memo_id: int, memo: MemoUpdate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    updated = update_memo(db, memo_id, memo, user.id)
+@crud_router.put("/memos/{memo_id}", response_model=MemoResponse)
+def update_memo_endpoint(memo_id: int, memo: MemoUpdate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    updated = write(db, update_memo, memo_id, memo, user.id)
     if not updated:
         raise HTTPException(status_code=404, detail="Memo not found")
     return updated
 
-@app.delete("/memos/{memo_id}")
-def delete_memo_endpoint(memo_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    ok = delete_memo(db, memo_id, user.id)
+@crud_router.delete("/memos/{memo_id}")
+def delete_memo_endpoint(memo_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    ok = write(db, delete_memo, memo_id, user.id)
     if not ok:
         raise HTTPException(status_code=404, detail="Memo not found")
+    attachment_collector.wake(user.id)
+    return {"result": "ok"}
+
+# ===================================================
+# 非同期版 認証 Dependency
+# ===================================================
+async def get_current_user_async(authorization: str = Header(...), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    token = authorization.split(" ")[1]
+
+    principal = principal_cache.get(token)
+    if principal:
+        return principal
+
+    username, exp = decode_token(token)
+    user = await db.run_sync(get_user_by_username, username)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal = Principal(id=user.id, username=user.username, role=user.role)
+    principal_cache.put(token, principal, token_exp=exp)
+    return principal
+
+# ===================================================
+# 非同期版 カテゴリ CRUD（ユーザー制約）
+# ===================================================
+@async_crud_router.get("/categories", response_model=list[CategoryResponse])
+async def read_categories_async(user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    if FAST_JSON:
+        return FastJSONResponse(await category_async.get_category_rows(db, user.id))
+    return await category_async.get_categories(db, user.id)
+
+@async_crud_router.get("/categories/{category_id}", response_model=CategoryResponse)
+async def read_category_async(category_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    category = await category_async.get_category(db, category_id, user.id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return category
+
+@async_crud_router.post("/categories", response_model=CategoryResponse)
+async def create_category_async(category: CategoryCreate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    return await category_async.create_category(db, category, user.id)
+
+@async_crud_router.put("/categories/{category_id}", response_model=CategoryResponse)
+async def update_category_async(category_id: int, category: CategoryUpdate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    updated = await category_async.update_category(db, category_id, category, user.id)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return updated
+
+@async_crud_router.delete("/categories/{category_id}")
+async def delete_category_async(category_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    ok = await category_async.delete_category(db, category_id, user.id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Category not found")
     return {"result": "ok"}
 
+# ===================================================
+# 非同期版 タグ CRUD（ユーザー制約）
+# ===================================================
+@async_crud_router.get("/tags", response_model=list[TagResponse])
+async def read_tags_async(user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    if FAST_JSON:
+        return FastJSONResponse(await tag_async.get_tag_rows(db, user.id))
+    return await tag_async.get_tags(db, user.id)
+
+@async_crud_router.get("/tags/{tag_id}", response_model=TagResponse)
+async def read_tag_async(tag_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    tag = await tag_async.get_tag(db, tag_id, user.id)
+    if not tag:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    return tag
+
+@async_crud_router.post("/tags", response_model=TagResponse)
+async def create_tag_async(tag: TagCreate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    return await tag_async.create_tag(db, tag, user.id)
+
+@async_crud_router.put("/tags/{tag_id}", response_model=TagResponse)
+async def update_tag_async(tag_id: int, tag: TagUpdate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    updated = await tag_async.update_tag(db, tag_id, tag, user.id)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    return updated
+
+@async_crud_router.delete("/tags/{tag_id}")
+async def delete_tag_async(tag_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    ok = await tag_async.delete_tag(db, tag_id, user.id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    return {"result": "ok"}
+
+# ===================================================
+# 非同期版 メモ CRUD（ユーザー制約）
+# ===================================================
+@async_crud_router.get("/memos", response_model=list[MemoResponse])
+async def read_memos_async(
+    response: Response,
+    category_id: int | None = None,
+    tag_id: int | None = None,
+    important: int | None = None,
+    url: str | None = None,
+    domain: str | None = None,
+    file_path: str | None = None,
+    sort: MemoSort = "updated_desc",
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    fields: str | None = Query(None, max_length=200),
+    user=Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        # 項目指定（fields=）があれば指定の列だけを SELECT して dict で返す
+        projection = {"fields": parse_memo_fields(fields)} if fields else {}
+        memos, next_cursor = await (memo_async.get_memo_rows if FAST_JSON or fields else memo_async.get_memos)(
+            db, user.id,
+            category_id=category_id,
+            tag_id=tag_id,
+            important=important,
+            url=url,
+            domain=domain,
+            file_path=file_path,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            **projection,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if FAST_JSON or fields:
+        return FastJSONResponse(memos, headers=headers)
+    response.headers.update(headers)
+    return memos
+
+@async_crud_router.get("/memos/{memo_id}", response_model=MemoResponse)
+async def read_memo_async(memo_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    memo = await memo_async.get_memo(db, memo_id, user.id)
+    if not memo:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    return memo
+
+@async_crud_router.post("/memos", response_model=MemoResponse)
+async def create_memo_async(memo: MemoCreate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    return await memo_async.create_memo(db, memo, user.id)
+
+@async_crud_router.put("/memos/{memo_id}", response_model=MemoResponse)
+async def update_memo_async(memo_id: int, memo: MemoUpdate, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    updated = await memo_async.update_memo(db, memo_id, memo, user.id)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    return updated
+
+@async_crud_router.delete("/memos/{memo_id}")
+async def delete_memo_async(memo_id: int, user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    ok = await memo_async.delete_memo(db, memo_id, user.id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    attachment_collector.wake(user.id)
+    return {"result": "ok"}
+
+# ===================================================
+# メモ検索（同期・非同期モード共通）
+# ===================================================
+@router.get("/memos/search", response_model=list[MemoSearchResult])
+def search_memos_endpoint(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    hits = search_memos(db, user.id, q, limit=limit, offset=offset)
+    return [
+        MemoSearchResult(
+            **MemoResponse.model_validate(memo).model_dump(),
+            title_highlight=title_highlight,
+            snippet=snippet,
+            rank=rank,
+        )
+        for memo, title_highlight, snippet, rank in hits
+    ]
+
+# ===================================================
+# 関連メモ（同期・非同期モード共通）
+# タイトル・本文・タグ名の TF-IDF ベクトルのコサイン類似度が高い順（related.py）
+# ===================================================
+@router.get("/memos/{memo_id}/related", response_model=list[MemoRelated])
+def related_memos_endpoint(
+    memo_id: int,
+    k: int = Query(10, ge=1, le=50),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    if not RELATED:
+        raise HTTPException(status_code=503, detail="Related memos are not available")
+    related = get_related_memos(db, memo_id, user.id, k)
+    if related is None:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    return related
+
+# ===================================================
+# メモ一括操作（同期・非同期モード共通、1 トランザクション）
+# ===================================================
+@router.post("/memos/batch", response_model=MemoBatchResult)
+def create_memos_batch_endpoint(batch: MemoBatchCreate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    return write(db, create_memos_batch, batch.items, user.id, batch.atomic)
+
+@router.patch("/memos/batch", response_model=MemoBatchResult)
+def update_memos_batch_endpoint(batch: MemoBatchUpdate, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    return write(db, update_memos_batch, batch.items, user.id, batch.atomic)
+
+@router.delete("/memos/batch", response_model=MemoBatchResult)
+def delete_memos_batch_endpoint(batch: MemoBatchDelete, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    result = write(db, delete_memos_batch, batch.ids, user.id, batch.atomic)
+    attachment_collector.wake(user.id)
+    return result
+
+# ===================================================
+# メモの添付ファイル（同期・非同期モード共通）
+# 本体は内容の SHA-256 で保存し（同じ内容は 1 つ）、参照されなくなったものは attachment_collector が削除する
+# ===================================================
+@router.post("/memos/{memo_id}/attachments", response_model=AttachmentResponse, status_code=201)
+async def upload_attachment(
+    memo_id: int,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    content_length: int | None = Header(None),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    # 他人のメモ・存在しないメモへのアップロードは受信する前に断る（本文を一時ファイルに書いてから 404 にしない）。
+    # 削除との競合は create_attachment 内の確認で防ぐ
+    if not memo_exists(db, memo_id, user.id):
+        raise HTTPException(status_code=404, detail="Memo not found")
+    # 認証に使った接続は受信の間保持しない（大きなファイルの受信中に読み取りトランザクションを開いたままにしない）
+    db.close()
+    shard = shard_of(db)
+    # 本文はファイルの中身そのもの（multipart ではない）。チャンクごとに一時ファイルへ書きながらハッシュを計算する
+    if content_length is not None and content_length > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Attachment too large")
+    try:
+        staged = await shard_store(shard).receive(request.stream())
+    except AttachmentTooLarge:
+        raise HTTPException(status_code=413, detail="Attachment too large")
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    try:
+        attachment = await run_in_threadpool(shard.write, create_attachment, memo_id, user.id, staged, filename, content_type)
+    finally:
+        # 配置済みなら何もしない（失敗・メモが無い場合に一時ファイルを残さない）
+        staged.discard()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    return attachment
+
+@router.get("/memos/{memo_id}/attachments", response_model=list[AttachmentResponse])
+def read_attachments(memo_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    attachments = get_attachments(db, memo_id, user.id)
+    if attachments is None:
+        raise HTTPException(status_code=404, detail="Memo not found")
+    return attachments
+
+@router.get("/memos/{memo_id}/attachments/{attachment_id}")
+def download_attachment(
+    memo_id: int,
+    attachment_id: int,
+    if_none_match: str | None = Header(None),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    attachment = get_attachment(db, memo_id, attachment_id, user.id)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    # 同じ id の中身は変わらないため、ETag は内容のハッシュ
+    headers = {"ETag": f'"{attachment.sha256}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    # Range（206 / 416）は FileResponse が処理する。サーバーが http.response.pathsend に対応していれば
+    # ファイルの送出はサーバー側（sendfile）に任せ、アプリはファイルを読まない
+    return FileResponse(
+        shard_store(shard_of(db)).path(attachment.sha256),
+        media_type=attachment.content_type,
+        filename=attachment.filename,
+        headers=headers,
+    )
+
+@router.delete("/memos/{memo_id}/attachments/{attachment_id}")
+def delete_attachment_endpoint(memo_id: int, attachment_id: int, user=Depends(get_current_user), db: Session = Depends(get_user_db)):
+    ok = write(db, delete_attachment, memo_id, attachment_id, user.id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    attachment_collector.wake(user.id)
+    return {"result": "ok"}
+
+# ===================================================
+# メモのエクスポート / インポート（ストリーミング、メモリ使用量は件数に依存しない）
+# ===================================================
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv; charset=utf-8"),
+}
+
+@router.get("/memos/export")
+def export_memos_endpoint(format: Literal["ndjson", "csv"] = "ndjson", user=Depends(get_current_user)):
+    export, media_type = EXPORT_FORMATS[format]
+    # レスポンス送信中も使うため、リクエスト単位ではなく専用のセッションを開く
+    shard = shard_pool.acquire(user.id)
+    db = shard.session()
+    try:
+        total = count_memos(db, user.id)
+    except Exception:
+        db.close()
+        shard_pool.release(shard)
+        raise
+
+    def body():
+        try:
+            yield from export(db, user.id)
+        finally:
+            db.close()
+            shard_pool.release(shard)
+
+    # 進捗はクライアント側で X-Total-Count と受信件数から算出する
+    return StreamingResponse(body(), media_type=media_type, headers={
+        "X-Total-Count": str(total),
+        "Content-Disposition": f'attachment; filename="memos.{format}"',
+    })
+
+def _import_progress(upload, format: str, user_id: int):
+    """バッチごとに取り込み、進捗を NDJSON で返す"""
+    records = parse_ndjson(upload) if format == "ndjson" else parse_csv(upload)
+    imported = failed = 0
+    errors, warnings = [], []
+    shard = shard_pool.acquire(user_id)
+    try:
+        for rows, batch_errors in iter_import_batches(records):
+            warnings.extend(shard.write(import_memos_batch, rows, user_id))
+            imported += len(rows)
+            failed += len(batch_errors)
+            errors.extend(batch_errors[:20 - len(errors)])
+            yield json.dumps({"imported": imported, "failed": failed}) + "\n"
+        yield json.dumps({
+            "done": True,
+            "imported": imported,
+            "failed": failed,
+            "errors": [{"line": line, "error": message} for line, message in errors],
+            "warnings": sorted(set(warnings)),
+        }, ensure_ascii=False) + "\n"
+    finally:
+        upload.close()
+        shard_pool.release(shard)
+
+@router.post("/memos/import")
+async def import_memos_endpoint(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    content_length: int | None = Header(None),
+    user=Depends(get_current_user),
+):
+    # 上限は Content-Length で先に弾き、ヘッダーが無い・偽りの場合に備えて受信量も数える
+    if content_length is not None and content_length > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Import too large")
+    # 受信した本文は 1MB を超えると一時ファイルに退避（全体をメモリに載せない）
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > IMPORT_MAX_BYTES:
+            upload.close()
+            raise HTTPException(status_code=413, detail="Import too large")
+        upload.write(chunk)
+    upload.seek(0)
+    return StreamingResponse(_import_progress(upload, format, user.id), media_type="application/x-ndjson")
+
+# ===================================================
+# 初期表示用（メモ 1 ページ目・カテゴリ・タグを 1 回で返す）
+# ===================================================
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+def _render_bootstrap(db: Session, user_id: int) -> bytes:
+    if FAST_JSON:
+        memos, next_cursor = get_memo_rows(db, user_id)
+        return FastJSONResponse({
+            "memos": memos,
+            "next_cursor": next_cursor,
+            "categories": get_category_rows(db, user_id),
+            "tags": get_tag_rows(db, user_id),
+        }).body
+    memos, next_cursor = get_memos(db, user_id)
+    return BootstrapResponse.model_validate(
+        {
+            "memos": memos,
+            "next_cursor": next_cursor,
+            "categories": get_categories(db, user_id),
+            "tags": get_tags(db, user_id),
+        },
+        from_attributes=True,
+    ).model_dump_json().encode()
+
+@router.get("/bootstrap", response_model=BootstrapResponse)
+def bootstrap(if_none_match: str | None = Header(None), user=Depends(get_current_user)):
+    # 変更連番だけを読み、変わっていなければ 304 / キャッシュ済みの本文を返す
+    # 連番は本文より先に読む（読み取り中の書き込みで本文が新しくなっても、次のリクエストで連番が一致せず作り直される）
+    with shard_pool.use(user.id) as shard, shard.session() as db:
+        seq = get_sync_token(db, user.id)
+        etag = bootstrap_etag(user.id, seq)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        body = bootstrap_cache.get(user.id, seq)
+        if _etag_matches(if_none_match, etag):
+            bootstrap_cache.record_not_modified(len(body) if body is not None else 0)
+            return Response(status_code=304, headers=headers)
+        if body is None:
+            body = _render_bootstrap(db, user.id)
+            bootstrap_cache.put(user.id, seq, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ===================================================
+# 差分同期（since 以降の変更と削除のみを返す。メモは X-Next-Cursor のページに分けて返す）
+# ===================================================
+@router.get("/sync", response_model=SyncResponse)
+def sync_endpoint(
+    response: Response,
+    since: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(500, ge=1, le=1000),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+):
+    try:
+        changes, next_cursor = get_changes(db, user.id, int(since) if since is not None else None, cursor=cursor, limit=limit)
+    except SyncTokenExpired:
+        # 削除記録の保持期間（MEMO_TOMBSTONE_RETENTION_DAYS）より前の since：since なしで全件から同期し直す
+        raise HTTPException(status_code=410, detail="Sync token expired, full resync required")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    # 次ページのカーソルはヘッダで返す（/memos と同じ。最後のページを受け取るまで token を保存しない）
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return changes
+
+# ===================================================
+# 変更通知（Server-Sent Events。メモ・タグ・カテゴリの作成・更新・削除を events.py の形式で送る）
+# ===================================================
+async def get_stream_user(authorization: str = Header(...)) -> Principal:
+    """get_current_user と同じ認証（ストリームの間 DB セッションを持ち続けないよう、セッションは認証の間だけ開く）"""
+    # キャッシュ済みならスレッドプールも使わない（再接続が集中しても DB・スレッドを消費しない）
+    if authorization.startswith("Bearer "):
+        principal = principal_cache.get(authorization.split(" ")[1])
+        if principal:
+            return principal
+
+    def authenticate():
+        with database.SessionLocal() as db:
+            return get_current_user(authorization, db)
+    return await run_in_threadpool(authenticate)
+
+async def _event_stream(subscription, resync: bool):
+    try:
+        yield RETRY
+        # 再接続（Last-Event-ID 付き）の場合、切断中の変更は再送できないため取り直しを促す
+        if resync:
+            yield RESYNC
+        while True:
+            frame = await subscription.next(event_hub.heartbeat)
+            if frame is None:
+                return
+            yield frame
+    finally:
+        event_hub.unsubscribe(subscription)
+
+@router.get("/events")
+async def events_endpoint(last_event_id: str | None = Header(None), user=Depends(get_stream_user)):
+    subscription = event_hub.subscribe(user.id)
+    return StreamingResponse(_event_stream(subscription, last_event_id is not None), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx でバッファリングさせない
+    })
+
 # ===================================================
 # ユーザー CRUD（管理者用）
 # ===================================================
-@app.get("/admin/users", response_model=list[UserResponse])
-def admin_read_users(admin=Depends(get_current_admin), db: Session = Depends(get_db)):
-    return get_users(db)
+@router.get("/admin/users", response_model=list[AdminUserResponse])
+def admin_read_users(
+    response: Response,
+    q: str | None = Query(None, max_length=100),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin=Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    try:
+        # 利用状況（メモ数など）はシャード使用時はユーザーのシャードで集計する
+        stats = shard_pool.user_stats if shard_pool.enabled else None
+        users, next_cursor = get_user_rows(db, q=q, cursor=cursor, limit=limit, stats=stats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 次ページのカーソルはヘッダで返す（/memos と同じ）
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
 
-@app.get("/admin/users/{user_id}", response_model=UserResponse)
+@router.get("/admin/users/{user_id}", response_model=UserResponse)
 def admin_read_user(user_id: int, admin=Depends(get_current_admin), db: Session = Depends(get_db)):
     user = get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@app.post("/admin/users", response_model=UserResponse)
+@router.post("/admin/users", response_model=UserResponse)
 def admin_create_user(user: UserCreate, admin=Depends(get_current_admin), db: Session = Depends(get_db)):
-    return create_user(db, user)
+    created = create_user(db, user)
+    if shard_pool.enabled:
+        try:
+            with shard_pool.use(created.id) as shard:
+                shard.write(create_user_mirror, created.id)
+        except Exception:
+            # シャードに行を作れなかったユーザーはメモ等を保存できないため残さない
+            delete_user(db, created.id)
+            raise
+    return created
 
-@app.put("/admin/users/{user_id}", response_model=UserResponse)
+@router.put("/admin/users/{user_id}", response_model=UserResponse)
 def admin_update_user(user_id: int, data: UserCreate, admin=Depends(get_current_admin), db: Session = Depends(get_db)):
     updated = update_user(db, user_id, new_username=data.username, new_password=data.password)
     if not updated:
         raise HTTPException(status_code=404, detail="User not found")
     return updated
 
-@app.delete("/admin/users/{user_id}")
+def _delete_sharded_user(db: Session, user_id: int):
+    """シャード使用時の delete_user（戻り値も同じ）
+
+    中央 DB で削除を予約して（ログインを止めて）からシャードのデータを削除し、最後に中央 DB の行を削除する。
+    """
+    if not mark_user_deleted(db, user_id):
+        return None
+    with shard_pool.use(user_id) as shard:
+        status = shard.write(delete_user, user_id)
+    if status == "scheduled":
+        return status
+    # 中央 DB にはメモが無いため 1 回でユーザーの行だけが削除される
+    purge_user_chunk(db, user_id, 1)
+    return "deleted"
+
+@router.delete("/admin/users/{user_id}")
 def admin_delete_user(user_id: int, admin=Depends(get_current_admin), db: Session = Depends(get_db)):
-    success = delete_user(db, user_id)
-    if not success:
+    status = _delete_sharded_user(db, user_id) if shard_pool.enabled else delete_user(db, user_id)
+    if not status:
         raise HTTPException(status_code=404, detail="User not found")
+    if status == "scheduled":
+        # メモが多いユーザーはバックグラウンドで分割削除（ログインは既に不可）
+        user_deleter.submit(user_id)
+        event_hub.disconnect(user_id)
+        related_cache.invalidate_user(user_id)
+        return JSONResponse(status_code=202, content={"result": "scheduled"})
+    attachment_collector.wake(user_id)
+    event_hub.disconnect(user_id)
+    related_cache.invalidate_user(user_id)
     return {"result": "ok"}
+
+@router.get("/admin/auth-cache")
+def admin_auth_cache_stats(admin=Depends(get_current_admin)):
+    return principal_cache.stats()
+
+@router.get("/admin/bootstrap-cache")
+def admin_bootstrap_cache_stats(admin=Depends(get_current_admin)):
+    return bootstrap_cache.stats()
+
+@router.get("/admin/related-cache")
+def admin_related_cache_stats(admin=Depends(get_current_admin)):
+    return related_cache.stats()
+
+@router.get("/admin/metrics", response_class=PlainTextResponse)
+def admin_metrics(admin=Depends(get_current_admin)):
+    auth, boot, deletions = principal_cache.stats(), bootstrap_cache.stats(), user_deleter.stats()
+    collector, shards, events = attachment_collector.stats(), shard_pool.stats(), event_hub.stats()
+    related = related_cache.stats()
+    extra = {
+        "memo_auth_cache_hits_total": ("counter", "Principal cache hits.", auth["hits"]),
+        "memo_auth_cache_misses_total": ("counter", "Principal cache misses.", auth["misses"]),
+        "memo_bootstrap_cache_hits_total": ("counter", "Bootstrap cache hits.", boot["hits"]),
+        "memo_bootstrap_cache_misses_total": ("counter", "Bootstrap cache misses.", boot["misses"]),
+        "memo_bootstrap_not_modified_total": ("counter", "Bootstrap responses answered with 304.", boot["not_modified"]),
+        "memo_bootstrap_bytes_saved_total": ("counter", "Bootstrap body bytes not sent thanks to 304.", boot["bytes_saved"]),
+        "memo_write_queue_batches_total": ("counter", "Group commits performed by the single writer.", write_queue.batches),
+        "memo_write_queue_jobs_total": ("counter", "Write jobs processed by the single writer.", write_queue.jobs),
+        "memo_user_deletions_pending": ("gauge", "Users scheduled for background deletion.", deletions["pending"]),
+        "memo_user_deletion_chunks_total": ("counter", "Chunks committed by background user deletion.", deletions["chunks"]),
+        "memo_attachment_blobs_removed_total": ("counter", "Unreferenced attachment blobs removed by the collector.", collector["blobs_removed"]),
+        "memo_shards_open": ("gauge", "Shard databases currently open.", shards["open"]),
+        "memo_shards_opened_total": ("counter", "Shard databases opened, including reopens after eviction.", shards["opened"]),
+        "memo_shards_evicted_total": ("counter", "Idle shard databases closed by the LRU pool.", shards["evicted"]),
+        "memo_shard_write_batches_total": ("counter", "Group commits performed by the shard writers.", shards["write_batches"]),
+        "memo_shard_write_jobs_total": ("counter", "Write jobs processed by the shard writers.", shards["write_jobs"]),
+        "memo_event_subscribers": ("gauge", "Open /events streams.", events["subscribers"]),
+        "memo_events_published_total": ("counter", "Change events published to users with open streams.", events["published"]),
+        "memo_events_delivered_total": ("counter", "Change events queued to /events streams.", events["delivered"]),
+        "memo_event_overflows_total": ("counter", "Streams that fell behind and were sent a resync.", events["overflows"]),
+        "memo_related_index_bytes": ("gauge", "Memory held by cached related-memo indexes.", related["bytes"]),
+        "memo_related_index_builds_total": ("counter", "Related-memo indexes built from scratch.", related["builds"]),
+        "memo_related_index_updates_total": ("counter", "Incremental related-memo index updates.", related["updates"]),
+        "memo_related_queries_total": ("counter", "Related-memo queries answered.", related["queries"]),
+    }
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ===================================================
+# アプリケーションの作成
+# ===================================================
+def _prewarm(app: FastAPI):
+    """最初のリクエストまで遅延される処理を起動時に済ませる（最初のリクエストの応答時間を 2 回目以降に揃える）"""
+    # include_router したルートの依存関係の解析（存在しない名前の url_path_for は全てのルートを走査する）
+    try:
+        app.url_path_for("__prebuild_routes__")
+    except NoMatchFound:
+        pass
+    # ORM のマッパー（リレーションシップ）の構成
+    configure_mappers()
+    # import で作られた大量のオブジェクトを走査する世代 2 の GC が最初のリクエスト中に走らないよう、
+    # ここで回収してから以降の GC の対象外にする
+    gc.collect()
+    gc.freeze()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    # スキーマは user_version を読んで確かめるだけ（移行は manage.py migrate で事前に行う）
+    if settings.migrate_on_startup:
+        await run_in_threadpool(migrate, database.engine)
+    else:
+        await run_in_threadpool(check_schema, database.engine)
+    # 分割時とシャード数が異なるとユーザーのデータを見つけられないため、一致しなければ起動しない
+    await run_in_threadpool(check_layout, database.engine, settings.shards)
+    if settings.migrate_on_startup:
+        await run_in_threadpool(migrate_shards, shard_pool)
+    else:
+        await run_in_threadpool(check_shards, shard_pool)
+    # 最初のリクエストが接続の確立を待たないよう、プールに接続を開いておく
+    await prewarm_pools(settings.pool_prewarm)
+    # 削除予約のまま残っているユーザーの分割削除を再開し、参照されなくなった添付ファイルの削除を開始
+    await run_in_threadpool(user_deleter.resume)
+    attachment_collector.start()
+    if settings.prewarm:
+        _prewarm(app)
+    yield
+    attachment_collector.stop()
+    user_deleter.stop()
+    write_queue.stop()
+    shard_pool.close_all()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    dispose_engines()
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """設定に従って DB エンジンを作り、アプリケーションを組み立てる（DB への接続・移行は起動時の lifespan で行う）
+
+    エンジン・単一ライター・バックグラウンド処理はプロセスで共有するため、同時に使うアプリは 1 つだけにすること。
+    """
+    settings = settings or Settings()
+    if settings.shards and USE_ASYNC_DB:
+        raise RuntimeError("sharded storage (MEMO_SHARDS) is not supported with MEMO_ASYNC_DB=1")
+    init_engines(settings.database_url)
+    shard_pool.configure(settings.shards, settings.shard_dir, settings.shard_max_open)
+    attachment_store.root = settings.attachment_dir
+
+    app = FastAPI(
+        docs_url=None,
+        redoc_url=None,
+        openapi_url=None,
+        lifespan=lifespan,
+    )
+    app.state.settings = settings
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # JS から読む独自・キャッシュ用ヘッダ（一覧の次ページ、エクスポートの件数、ブートストラップ・添付の ETag）
+        expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],
+    )
+    # ルートごとのレイテンシ・応答サイズ・DB 時間の計測（/admin/metrics で参照）
+    app.add_middleware(MetricsMiddleware)
+    app.add_exception_handler(HashingBusy, hashing_busy_handler)
+
+    # メモ・タグ・カテゴリ API は /memos/search など固定パスの後に登録する
+    app.include_router(router)
+    app.include_router(async_crud_router if USE_ASYNC_DB else crud_router)
+    return app
+
+app = create_app()
@@ -0,0 +1,238 @@
+# fastapi-app/manage.py
+# 運用コマンド（fastapi_app ディレクトリで `python manage.py <command>` として実行）
+# 計測・検証コマンド（bench-* / check-*）は bench/commands.py。機能のモジュールは使うコマンドの中で読み込む
+# （migrate 等で関連メモの索引・numpy などを読み込まない）
+
+import argparse
+import os
+import time
+
+from sqlalchemy import select
+
+from db import get_engine, database_size, vacuum
+from compression import RECOMPRESS_BATCH_SIZE
+from migrations import migrate, check_schema, schema_version, SCHEMA_VERSION, migrate_shards, check_shards
+from shards import shard_pool, check_layout, SHARD_DIR, SHARD_MAX_OPEN
+from links import LINK_BATCH_SIZE
+from sync import TOMBSTONE_RETENTION_DAYS
+from bench.commands import register_bench_commands
+
+# 運用コマンドの対象 DB（スキーマが最新であること）
+def _live_engine():
+    engine = get_engine()
+    check_schema(engine)
+    return engine
+
+# シャード（MEMO_SHARDS）の構成とスキーマの確認
+def _check_live_shards():
+    check_layout(_live_engine(), shard_pool.count)
+    check_shards(shard_pool)
+
+# メモ等を持つ DB（シャード使用時は各シャード、それ以外は中央 DB）を 1 つずつ返す
+def _live_shards():
+    _check_live_shards()
+    return shard_pool.each()
+
+# ===================================================
+# migrate: 未適用のスキーマ移行を実行する（デプロイ時にワーカーの起動前に 1 回）
+# ===================================================
+def cmd_migrate(args):
+    engine = get_engine()
+    current = schema_version(engine)
+    if args.check:
+        print(f"schema version {current} (code expects {SCHEMA_VERSION})")
+        outdated = current != SCHEMA_VERSION
+        for shard in shard_pool.each() if shard_pool.enabled else ():
+            version = schema_version(shard.engine) if os.path.exists(shard.path) else None
+            print(f"  shard {shard.index}: schema version {version}")
+            outdated = outdated or version != SCHEMA_VERSION
+        if outdated:
+            raise SystemExit(1)
+        return
+    started = time.perf_counter()
+    applied = migrate(engine)
+    if applied:
+        print(f"migrated {current} -> {applied[-1]} (applied {applied}) in {time.perf_counter() - started:.2f}s")
+    else:
+        print(f"schema is up to date (version {current})")
+    if shard_pool.enabled:
+        check_layout(engine, shard_pool.count)
+        started = time.perf_counter()
+        migrated = {index: versions for index, versions in migrate_shards(shard_pool).items() if versions}
+        print(f"{shard_pool.count} shards: migrated {len(migrated)} {sorted(migrated)} in {time.perf_counter() - started:.2f}s")
+
+# ===================================================
+# split-shards: 中央 DB のメモ・タグ・カテゴリ等をユーザー単位のシャードに分割する（サーバーを止めて 1 回だけ）
+# ===================================================
+def cmd_split_shards(args):
+    from shard_split import split_shards
+    from attachments import attachment_store
+
+    engine = _live_engine()
+    shard_pool.configure(args.shards, args.shard_dir, SHARD_MAX_OPEN)
+    started = time.perf_counter()
+    result = split_shards(engine, shard_pool, attachment_store)
+    for index, counts in result["shards"].items():
+        print(f"shard {index:4d}: " + " ".join(f"{name}={count}" for name, count in counts.items()))
+    print(f"placed {result['files']} attachment files ({result['missing_files']} missing)")
+    print(f"split into {args.shards} shards in {time.perf_counter() - started:.2f}s; "
+          f"start the server with MEMO_SHARDS={args.shards} MEMO_SHARD_DIR={args.shard_dir}")
+
+# ===================================================
+# rebuild-fts: 全文検索インデックスの再構築
+# ===================================================
+def cmd_rebuild_fts(args):
+    from fts import rebuild_memo_fts
+
+    started = time.perf_counter()
+    for shard in _live_shards():
+        rebuild_memo_fts(shard.engine)
+    print(f"memos_fts rebuilt in {time.perf_counter() - started:.2f}s")
+
+# ===================================================
+# reconcile-counters: タグ・カテゴリの memo_count を実数から再計算し、ずれを報告
+# ===================================================
+def cmd_reconcile_counters(args):
+    from counters import reconcile_counters
+
+    drift = [d for shard in _live_shards() for d in reconcile_counters(shard.engine, fix=not args.dry_run)]
+    for d in drift:
+        print(f"{d['table']:10s} id={d['id']:<6d} user={d['user_id']:<6d} {d['name']!r}: stored={d['stored']} actual={d['actual']}")
+    action = "reported" if args.dry_run else "fixed"
+    print(f"{len(drift)} counters drifted ({action})")
+    if drift and args.dry_run:
+        raise SystemExit(1)
+
+# ===================================================
+# rebuild-links: memos.urls / file_paths（JSON）から memo_urls / memo_files を作り直す
+# ===================================================
+def cmd_rebuild_links(args):
+    from links import rebuild_memo_links
+
+    started = time.perf_counter()
+    total = sum(rebuild_memo_links(shard.engine, batch_size=args.batch_size) for shard in _live_shards())
+    print(f"memo_urls / memo_files rebuilt from {total} memos in {time.perf_counter() - started:.2f}s")
+
+# ===================================================
+# compress-memos: 平文で保存されている既存メモの本文を圧縮する
+# ===================================================
+def cmd_compress_memos(args):
+    from compression import recompress_memos
+
+    started = time.perf_counter()
+    for shard in _live_shards():
+        stats = recompress_memos(shard.engine, batch_size=args.batch_size)
+        name = "" if shard.index is None else f"shard {shard.index}: "
+        print(f"{name}scanned {stats['scanned']} memos, compressed {stats['compressed']} "
+              f"({stats['bytes_before']} -> {stats['bytes_after']} bytes)")
+        if args.vacuum:
+            before = database_size(shard.engine)
+            vacuum(shard.engine)
+            print(f"{name}VACUUM: {before} -> {database_size(shard.engine)} bytes")
+    print(f"done in {time.perf_counter() - started:.2f}s")
+
+# ===================================================
+# gc-attachments: 参照されていない添付ファイルの削除
+# ===================================================
+def cmd_gc_attachments(args):
+    from attachments import attachment_collector, attachment_store, sweep_orphan_files
+
+    # collect・sweep_orphan_files は全シャードを順に処理する
+    _check_live_shards()
+    started = time.perf_counter()
+    removed = attachment_collector.collect()
+    print(f"removed {removed} unreferenced blobs in {time.perf_counter() - started:.2f}s")
+    if args.sweep:
+        # blobs に行の無いファイル（配置後にロールバックされたアップロードなど）
+        print(f"removed {sweep_orphan_files(attachment_store)} orphaned files")
+
+# ===================================================
+# prune-tombstones: 保持期間より古い削除記録の削除（定期的に実行する）
+# ===================================================
+def cmd_prune_tombstones(args):
+    from sync import prune_tombstones
+
+    started = time.perf_counter()
+    removed = sum(prune_tombstones(shard.engine, days=args.days) for shard in _live_shards())
+    print(f"removed {removed} tombstones older than {args.days} days in {time.perf_counter() - started:.2f}s")
+
+# ===================================================
+# near-duplicates: 重複に近いメモ（関連メモの索引で類似度が閾値以上の組）の一覧
+# ===================================================
+def cmd_near_duplicates(args):
+    from related import RELATED, related_cache
+    from crud.related import find_near_duplicates
+    from models.memo import Memo
+
+    if not RELATED:
+        raise SystemExit("related memos are disabled (numpy is not installed or MEMO_RELATED=0)")
+    total = 0
+    for shard in _live_shards():
+        with shard.session() as db:
+            if args.user_id is not None:
+                user_ids = db.scalars(select(Memo.user_id).where(Memo.user_id == args.user_id).limit(1)).all()
+            else:
+                user_ids = db.scalars(select(Memo.user_id).distinct().order_by(Memo.user_id)).all()
+            for user_id in user_ids:
+                pairs = find_near_duplicates(db, user_id, args.threshold, args.limit)
+                # 索引は 1 ユーザーずつ使い捨てる（全ユーザーの索引をキャッシュに溜めない）
+                related_cache.invalidate_user(user_id)
+                for pair in pairs:
+                    print(f"user={user_id:<6d} {pair['score']:.3f}  #{pair['a']['id']} {pair['a']['title']!r}  ~  "
+                          f"#{pair['b']['id']} {pair['b']['title']!r}")
+                total += len(pairs)
+    print(f"{total} near-duplicate pairs (similarity >= {args.threshold})")
+
+# ===================================================
+# エントリポイント
+# ===================================================
+def main():
+    parser = argparse.ArgumentParser(description="Memo app management commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations (run once per deploy, before starting workers)")
+    p.add_argument("--check", action="store_true", help="only report the schema version; exit 1 if migrations are pending")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("split-shards", help="split memos, tags and categories of all users into per-user shard databases (stop the server first)")
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--shard-dir", default=SHARD_DIR)
+    p.set_defaults(func=cmd_split_shards)
+
+    p = sub.add_parser("rebuild-fts", help="rebuild the memo full-text search index")
+    p.set_defaults(func=cmd_rebuild_fts)
+
+    p = sub.add_parser("reconcile-counters", help="rebuild tag/category memo counts and report drift")
+    p.add_argument("--dry-run", action="store_true", help="only report drift (exit 1 if any)")
+    p.set_defaults(func=cmd_reconcile_counters)
+
+    p = sub.add_parser("rebuild-links", help="rebuild the memo URL / file path lookup tables from the JSON columns")
+    p.add_argument("--batch-size", type=int, default=LINK_BATCH_SIZE)
+    p.set_defaults(func=cmd_rebuild_links)
+
+    p = sub.add_parser("gc-attachments", help="remove attachment blobs no longer referenced by any memo")
+    p.add_argument("--sweep", action="store_true", help="also delete files without a blob row and leftover upload temp files (stop the server first)")
+    p.set_defaults(func=cmd_gc_attachments)
+
+    p = sub.add_parser("compress-memos", help="compress memo bodies stored as plain text (size threshold: MEMO_COMPRESS_MIN_BYTES)")
+    p.add_argument("--batch-size", type=int, default=RECOMPRESS_BATCH_SIZE)
+    p.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the database file")
+    p.set_defaults(func=cmd_compress_memos)
+
+    p = sub.add_parser("prune-tombstones", help="delete sync tombstones older than the retention period (clients with older sync tokens must resync)")
+    p.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS, help="retention in days (default: MEMO_TOMBSTONE_RETENTION_DAYS)")
+    p.set_defaults(func=cmd_prune_tombstones)
+
+    p = sub.add_parser("near-duplicates", help="list pairs of near-duplicate memos per user (cosine similarity of the related-memo index)")
+    p.add_argument("--user-id", type=int)
+    p.add_argument("--threshold", type=float, default=0.85)
+    p.add_argument("--limit", type=int, default=100, help="pairs per user")
+    p.set_defaults(func=cmd_near_duplicates)
+
+    register_bench_commands(sub)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# fastapi-app/metrics.py
+# リクエスト単位の計測：ルートごとのレイテンシ・応答サイズのヒストグラム、処理中リクエスト数、
+# リクエストごとの SQL 文数と DB 時間（db.py のエンジンイベントから加算）を集計し、Prometheus 形式で出力する
+
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from starlette.datastructures import MutableHeaders
+
+# 0 より大きいと、この時間（ミリ秒）を超えた SQL を警告ログに出す
+SLOW_QUERY_MS = float(os.getenv("MEMO_SLOW_QUERY_MS", "100"))
+# 1 で Server-Timing ヘッダ（DB 時間 / シリアライズ時間 / その他）を付ける（開発用）
+SERVER_TIMING = os.getenv("MEMO_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# 開いたままの応答（SSE）のパス。処理中件数・レイテンシ等のヒストグラムには含めず、接続の件数だけを数える
+# （開いている本数は memo_event_subscribers で見る）
+STREAMING_PATHS = frozenset({"/events"})
+
+logger = logging.getLogger("memo.db")
+
+@dataclass
+class RequestStats:
+    """処理中のリクエスト 1 件分の計測値（スレッドプールにもコンテキストごと引き継がれる）"""
+    statements: int = 0
+    db_time: float = 0.0
+    serialize_time: float = 0.0
+
+    def server_timing(self, total: float) -> str:
+        app_time = max(total - self.db_time - self.serialize_time, 0.0)
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.statements} queries"']
+        if self.serialize_time:
+            parts.append(f"serialize;dur={self.serialize_time * 1000:.1f}")
+        parts.append(f"app;dur={app_time * 1000:.1f}")
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}        # (method, route, status) -> 件数
+        self.latency = {}         # (method, route) -> Histogram（秒）
+        self.response_size = {}   # (method, route) -> Histogram（バイト）
+        self.statements = {}      # (method, route) -> Histogram（1 リクエストの SQL 文数）
+        self.db_time = {}         # (method, route) -> DB 時間の合計（秒）
+        self.in_flight = {}       # method -> 処理中の件数（ルートはレスポンス後まで確定しないためメソッド単位）
+        self.db_statements_total = 0
+        self.db_time_total = 0.0
+        self.slow_queries_total = 0
+
+    # --- db.py のエンジンイベントから ---
+    def observe_statement(self, statement: str, elapsed: float):
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+        slow = SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS
+        with self._lock:
+            self.db_statements_total += 1
+            self.db_time_total += elapsed
+            if slow:
+                self.slow_queries_total += 1
+        if slow:
+            logger.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+    # --- ミドルウェアから ---
+    def request_started(self, method: str):
+        with self._lock:
+            self.in_flight[method] = self.in_flight.get(method, 0) + 1
+
+    def request_finished(self, key, status: int, elapsed: float, size: int, stats: RequestStats):
+        with self._lock:
+            self.in_flight[key[0]] -= 1
+            self.requests[(*key, status)] = self.requests.get((*key, status), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.response_size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+            self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+
+    def stream_finished(self, key, status: int):
+        with self._lock:
+            self.requests[(*key, status)] = self.requests.get((*key, status), 0) + 1
+
+    def render(self, extra: dict | None = None) -> str:
+        """Prometheus テキスト形式（extra は {名前: (型, 説明, 値)} で追加の値を出力）"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, help_text, series):
+            header(name, "histogram", help_text)
+            for (method, route), h in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {h.count}")
+                lines.append(f"{name}_sum{_labels(method=method, route=route)} {h.sum}")
+                lines.append(f"{name}_count{_labels(method=method, route=route)} {h.count}")
+
+        with self._lock:
+            header("memo_http_requests_total", "counter", "HTTP requests by route and status.")
+            for (method, route, status), n in sorted(self.requests.items()):
+                lines.append(f"memo_http_requests_total{_labels(method=method, route=route, status=status)} {n}")
+            header("memo_http_requests_in_flight", "gauge", "Requests currently being processed (excluding open streams).")
+            for method, n in sorted(self.in_flight.items()):
+                lines.append(f"memo_http_requests_in_flight{_labels(method=method)} {n}")
+            histogram("memo_http_request_duration_seconds", "Request latency until the response is fully sent.", self.latency)
+            histogram("memo_http_response_size_bytes", "Response body size.", self.response_size)
+            histogram("memo_http_db_statements", "SQL statements executed per request.", self.statements)
+            header("memo_http_db_duration_seconds_total", "counter", "Time spent in SQL statements, by route.")
+            for (method, route), seconds in sorted(self.db_time.items()):
+                lines.append(f"memo_http_db_duration_seconds_total{_labels(method=method, route=route)} {seconds}")
+            header("memo_db_statements_total", "counter", "SQL statements executed (including background work).")
+            lines.append(f"memo_db_statements_total {self.db_statements_total}")
+            header("memo_db_duration_seconds_total", "counter", "Time spent in SQL statements (including background work).")
+            lines.append(f"memo_db_duration_seconds_total {self.db_time_total}")
+            header("memo_db_slow_queries_total", "counter", f"SQL statements slower than {SLOW_QUERY_MS:g} ms.")
+            lines.append(f"memo_db_slow_queries_total {self.slow_queries_total}")
+
+        for name, (kind, help_text, value) in (extra or {}).items():
+            header(name, kind, help_text)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def observe_serialization(started: float):
+    """シリアライズに要した時間をリクエストの計測値に加算（Server-Timing の serialize）"""
+    stats = current_request.get()
+    if stats is not None:
+        stats.serialize_time += time.perf_counter() - started
+
+class MetricsMiddleware:
+    """ルートごとのレイテンシ・応答サイズ・処理中件数・DB 時間を記録する ASGI ミドルウェア（streaming_paths は件数のみ）"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING, streaming_paths=STREAMING_PATHS):
+        self.app = app
+        self.server_timing = server_timing
+        self.streaming_paths = streaming_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status, size = 500, 0
+        # 開いたままの応答は処理中件数に数えない（接続している間ずっと処理中になり、通常のリクエストの件数が分からなくなる）
+        streaming = scope["path"] in self.streaming_paths
+        if not streaming:
+            metrics.request_started(scope["method"])
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing(time.perf_counter() - started))
+                    headers.append("Timing-Allow-Origin", "*")  # 別オリジンのフロントエンドからも参照できるように
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # 未定義のパスはラベルの種類が増えないようにまとめる
+            key = (scope["method"], getattr(route, "path", "unmatched"))
+            if streaming:
+                metrics.stream_finished(key, status)
+            else:
+                metrics.request_finished(key, status, time.perf_counter() - started, size, stats)
+            current_request.reset(token)
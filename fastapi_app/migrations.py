@@ -0,0 +1,140 @@
+# fastapi-app/migrations.py
+# スキーマのバージョン管理：適用済みのバージョンを PRAGMA user_version に記録し、未適用の移行だけを順に実行する
+#
+# 起動時は user_version を読むだけ（最新なら何もしない）。移行は `python manage.py migrate` で
+# デプロイ時に 1 回だけ実行する（settings.MIGRATE_ON_STARTUP が有効なら起動時にも実行する）。
+# テーブル・列・インデックス・トリガー・ビューの定義を変えたら、MIGRATIONS の末尾に移行を追加すること。
+# 移行はその変更だけを行う明示的な手順として書く（_baseline は移行 1 専用。以降の移行から呼ばない）。
+
+import logging
+import os
+
+from sqlalchemy import text
+
+from db import Base
+import models.user
+import models.category
+import models.tag
+import models.memo
+import models.sync
+import models.attachment
+import models.shard
+from user_deletion import init_user_deletion
+from foreign_keys import upgrade_foreign_keys, rebuild_table
+from sync import init_sync
+from counters import init_counters
+from links import init_memo_links
+from attachments import init_attachments
+from fts import init_memo_fts
+
+logger = logging.getLogger("memo.db")
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+def _baseline(engine):
+    """バージョン管理の導入前に起動時に毎回行っていた初期化（空の DB・導入前のどの DB からでも最新の形にする）"""
+    Base.metadata.create_all(bind=engine)
+    # ユーザーの削除予約列（users.deleted_at。sync.py のトリガーが参照するため先に追加）
+    init_user_deletion(engine)
+    # 外部キー（ON DELETE）と列の構成をモデルに合わせて作り直す（トリガー・ビューは以下で作り直す）
+    upgrade_foreign_keys(engine)
+    init_sync(engine)
+    init_counters(engine)
+    init_memo_links(engine)
+    init_attachments(engine)
+    # 既存のテーブルにも後から追加したインデックスを作成
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    init_memo_fts(engine)
+
+def _shard_layout(engine):
+    """シャードの構成を記録するテーブル（shards.py）"""
+    models.shard.ShardLayout.__table__.create(bind=engine, checkfirst=True)
+
+def _plain_memo_preview(engine):
+    """memos.preview を SQL 関数 memo_text を使う生成列から通常の列にする
+
+    memos だけを作り直し、保存済みの preview をコピーする（列が無い DB では本文の先頭で埋める。models/memo.py の
+    info["fill"]）。memos のトリガーと memos を参照するトリガー・ビュー（memos_plain）は元の定義のまま作り直す。
+    移行 1 で作った DB では既に通常の列のため何もしない。
+    """
+    rebuild_table(engine, models.memo.Memo.__table__)
+
+def _memo_sort_indexes(engine):
+    """一覧の並び順（作成日時・重要度）のキーセットページング用インデックス
+
+    キーセット条件は NULL を含まない前提なので、一括更新で null が入った重要度は既定値に戻す。
+    """
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE memos SET important = 1 WHERE important IS NULL"))
+    for index in models.memo.Memo.__table__.indexes:
+        if index.name in ("ix_memos_user_created_id", "ix_memos_user_important_updated_id"):
+            index.create(bind=engine, checkfirst=True)
+
+def _tombstone_horizon(engine):
+    """削除記録の保持期間：削除済みの番号（sync_sequences.pruned）"""
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(sync_sequences)"))}
+        if "pruned" not in columns:
+            conn.execute(text("ALTER TABLE sync_sequences ADD COLUMN pruned INTEGER NOT NULL DEFAULT 0"))
+
+# (バージョン, 説明, 移行関数)。バージョンは 1 から連番
+MIGRATIONS = [
+    (1, "tables, foreign keys, triggers, lookup tables and full-text index", _baseline),
+    (2, "shard layout table", _shard_layout),
+    (3, "memos.preview as a plain column set on write", _plain_memo_preview),
+    (4, "memo list indexes for the created and importance sort orders", _memo_sort_indexes),
+    (5, "sync_sequences.pruned for tombstone retention", _tombstone_horizon),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def migrate(engine) -> list[int]:
+    """未適用の移行を順に実行する（適用したバージョンを返す）
+
+    移行ごとに user_version を進めるため、途中で失敗しても再実行すれば続きから適用される。
+    同じ DB に対して複数のプロセスから同時に実行しないこと。
+    """
+    current = schema_version(engine)
+    if current > SCHEMA_VERSION:
+        raise SchemaOutdated(f"database schema version {current} is newer than this code ({SCHEMA_VERSION})")
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.warning("applying schema migration %d: %s", version, description)
+        fn(engine)
+        with engine.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {version}"))
+        applied.append(version)
+    return applied
+
+def check_schema(engine):
+    """スキーマが最新でなければ SchemaOutdated を送出する（移行は行わない）"""
+    current = schema_version(engine)
+    if current != SCHEMA_VERSION:
+        raise SchemaOutdated(
+            f"database schema version is {current}, this code expects {SCHEMA_VERSION}; run `python manage.py migrate`"
+        )
+
+def migrate_shards(pool) -> dict:
+    """全シャードに未適用の移行を実行する（無いシャードのファイルは作成する）。シャード番号 -> 適用したバージョン"""
+    if not pool.enabled:
+        return {}
+    os.makedirs(pool.directory, exist_ok=True)
+    return {shard.index: migrate(shard.engine) for shard in pool.each()}
+
+def check_shards(pool):
+    """スキーマが最新でないシャードがあれば SchemaOutdated を送出する"""
+    if not pool.enabled:
+        return
+    for shard in pool.each():
+        if not os.path.exists(shard.path):
+            raise SchemaOutdated(f"shard {shard.path} does not exist; run `python manage.py migrate`")
+        check_schema(shard.engine)
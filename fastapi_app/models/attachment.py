@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from db import Base
+
+class Blob(Base):
+    """添付ファイルの実体（内容の SHA-256 で識別。同じ内容は 1 つだけ保存）"""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, server_default="0")  # memo_attachments からの参照数（トリガーで増減）
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_blobs_ref_count", "ref_count"),  # 参照数 0 の blob（GC 対象）を引くため
+    )
+
+class MemoAttachment(Base):
+    """メモの添付ファイル（ファイル名・種類はメモごと、実体は blobs を参照）"""
+    __tablename__ = "memo_attachments"
+
+    id = Column(Integer, primary_key=True)
+    memo_id = Column(Integer, ForeignKey("memos.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_memo_attachments_memo_id", "memo_id"),
+        Index("ix_memo_attachments_sha256", "sha256"),
+        Index("ix_memo_attachments_user_id", "user_id"),  # ユーザー削除時の ON DELETE CASCADE 用
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db import Base
@@ -9,9 +9,15 @@ class Category(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50), unique=True, nullable=False)
     description = Column(Text, nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sync_version = Column(Integer, nullable=False, server_default="0")  # 差分同期用（トリガーで採番）
+    memo_count = Column(Integer, nullable=False, server_default="0")    # 使用しているメモ数（トリガーで増減）
 
-    # リレーション：カテゴリに属するメモ一覧
-    memos = relationship("Memo", back_populates="category")
+    # リレーション：カテゴリに属するメモ一覧（削除時の category_id は DB の ON DELETE SET NULL に任せる）
+    memos = relationship("Memo", back_populates="category", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_categories_user_sync_version", "user_id", "sync_version"),
+    )
@@ -1,33 +1,89 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.sqlite import JSON
 from datetime import datetime
 from db import Base
+from compression import CompressedText
 from models.tag import Tag
 from models.category import Category
 
+MEMO_PREVIEW_LENGTH = 200  # 一覧用プレビューの文字数
+
+def memo_preview(content: str | None) -> str | None:
+    """一覧用プレビュー（平文の本文の先頭）"""
+    return None if content is None else content[:MEMO_PREVIEW_LENGTH]
+
+def _preview_default(context):
+    # INSERT（ORM・insert(Memo) の一括 INSERT とも）の各行で、圧縮前の本文から計算する
+    return memo_preview(context.get_current_parameters().get("content"))
+
 # 中間テーブル（多対多）
 memo_tags = Table(
     "memo_tags",
     Base.metadata,
-    Column("memo_id", Integer, ForeignKey("memos.id"), primary_key=True),
-    Column("tag_id", Integer, ForeignKey("tags.id"), primary_key=True),
-    extend_existing=True  # ← 追加
+    Column("memo_id", Integer, ForeignKey("memos.id", ondelete="CASCADE"), primary_key=True),
+    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
 )
+# タグ削除時の ON DELETE CASCADE で memo_tags を tag_id から引くためのインデックス
+Index("ix_memo_tags_tag_id", memo_tags.c.tag_id)
 
 class Memo(Base):
     __tablename__ = "memos"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(400), nullable=False)
-    content = Column(Text, nullable=True)
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    file_paths = Column(JSON, nullable=True)   # 文字列リストをJSONで格納
-    urls = Column(JSON, nullable=True)         # 文字列リストをJSONで格納
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)
+    file_paths = Column(JSON, nullable=True)   # 文字列リストをJSONで格納（検索用に memo_files へも展開）
+    urls = Column(JSON, nullable=True)         # 文字列リストをJSONで格納（検索用に memo_urls へも展開）
     important = Column(Integer, default=1)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sync_version = Column(Integer, nullable=False, server_default="0")  # 差分同期用（トリガーで採番）
+    # 一覧用の本文の先頭。INSERT 時は既定値で、本文の UPDATE 時は crud で memo_preview を設定する
+    # （SQL 関数 memo_text を使う生成列にすると、関数を登録していない接続から memos に書き込めなくなるため）。
+    # fill はこの列の無い既存 DB のテーブルを作り直すときの値（foreign_keys.py）
+    preview = Column(Text, nullable=True, default=_preview_default,
+                     info={"fill": f"substr(memo_text(content), 1, {MEMO_PREVIEW_LENGTH})"})
+    # 本文は行の末尾に置く（長い本文はオーバーフローページに入り、それより後ろの列を読むと本文のページも全て読むことになるため）
+    content = Column(CompressedText, nullable=True)  # 一定サイズ以上は圧縮して保存（compression.py）
 
     category = relationship("Category", back_populates="memos")
-    tags = relationship("Tag", secondary=memo_tags, back_populates="memos")  # ← タグ配列
+    tags = relationship("Tag", secondary=memo_tags, back_populates="memos", lazy="selectin", order_by=Tag.id)  # ← タグ配列（常に一括ロード）
+
+    # 一覧のキーセットページング（並び順ごと）・カテゴリ絞り込み用の複合インデックス
+    __table_args__ = (
+        Index("ix_memos_user_updated_id", "user_id", "updated_at", "id"),
+        Index("ix_memos_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_memos_user_important_updated_id", "user_id", "important", "updated_at", "id"),
+        Index("ix_memos_user_category", "user_id", "category_id"),
+        Index("ix_memos_user_sync_version", "user_id", "sync_version"),
+        Index("ix_memos_category", "category_id"),  # カテゴリ削除時の ON DELETE SET NULL 用
+    )
+
+# --- URL / ファイルパスの検索用テーブル（links.py のトリガーで memos.urls / file_paths から展開） ---
+class MemoUrl(Base):
+    __tablename__ = "memo_urls"
+
+    memo_id = Column(Integer, ForeignKey("memos.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)   # urls 内の位置
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    url = Column(Text, nullable=False)
+    domain = Column(String(255), nullable=True)    # ホスト名（小文字、ポート・ユーザー情報は除く）
+
+    __table_args__ = (
+        Index("ix_memo_urls_user_url", "user_id", "url"),
+        Index("ix_memo_urls_user_domain", "user_id", "domain"),
+    )
+
+class MemoFile(Base):
+    __tablename__ = "memo_files"
+
+    memo_id = Column(Integer, ForeignKey("memos.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)   # file_paths 内の位置
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    path = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_memo_files_user_path", "user_id", "path"),
+    )
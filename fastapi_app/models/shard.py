@@ -0,0 +1,12 @@
+# fastapi-app/models/shard.py
+from sqlalchemy import Column, Integer, DateTime
+from datetime import datetime
+from db import Base
+
+class ShardLayout(Base):
+    """中央 DB に記録するシャードの構成（メモ等を分割したシャード数。shard_split.py が記録する）"""
+    __tablename__ = "shard_layout"
+
+    id = Column(Integer, primary_key=True)
+    shards = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
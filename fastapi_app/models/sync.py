@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from db import Base
+
+class SyncSequence(Base):
+    """ユーザーごとの変更連番（memos / tags / categories の変更のたびに +1）"""
+    __tablename__ = "sync_sequences"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, nullable=False, default=0)
+    # 削除記録を削除済みの番号（これ以下の tombstone は残っていない。これより前からの差分同期はできない）
+    pruned = Column(Integer, nullable=False, server_default="0")
+
+class Tombstone(Base):
+    """削除済みレコードの記録（差分同期で削除を伝えるため）"""
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    entity = Column(String(20), nullable=False)   # "memo" / "tag" / "category"
+    entity_id = Column(Integer, nullable=False)
+    sync_version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_tombstones_user_sync_version", "user_id", "sync_version"),
+    )
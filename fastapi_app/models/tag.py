@@ -1,25 +1,24 @@
-from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db import Base
 
-# 多対多中間テーブル
-memo_tags = Table(
-    "memo_tags",
-    Base.metadata,
-    Column("memo_id", Integer, ForeignKey("memos.id"), primary_key=True),
-    Column("tag_id", Integer, ForeignKey("tags.id"), primary_key=True),
-)
-
 class Tag(Base):
     __tablename__ = "tags"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50), unique=True, nullable=False)
     color = Column(String(20), nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sync_version = Column(Integer, nullable=False, server_default="0")  # 差分同期用（トリガーで採番）
+    memo_count = Column(Integer, nullable=False, server_default="0")    # 使用しているメモ数（トリガーで増減）
+
+    # リレーション：タグに属するメモ一覧（中間テーブル memo_tags は models/memo.py で定義。
+    # 削除時の memo_tags は DB の ON DELETE CASCADE に任せる）
+    memos = relationship("Memo", secondary="memo_tags", back_populates="tags", passive_deletes=True)
 
-    # リレーション：タグに属するメモ一覧
-    memos = relationship("Memo", secondary=memo_tags, back_populates="tags")
+    __table_args__ = (
+        Index("ix_tags_user_sync_version", "user_id", "sync_version"),
+    )
@@ -1,5 +1,5 @@
 # fastapi-app/models/user.py
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, DateTime
 from db import Base
 
 class User(Base):
@@ -9,3 +9,4 @@ class User(Base):
     username = Column(String, unique=True, nullable=False, index=True)
     hashed_password = Column(String, nullable=False)
     role = Column(String, default="user", nullable=False)  # "admin" または "user"
+    deleted_at = Column(DateTime, nullable=True)  # 削除予約（バックグラウンドで分割削除中。ログイン不可）
@@ -0,0 +1,75 @@
+# fastapi-app/principal_cache.py
+# 認証済みユーザー（principal）のキャッシュ：JWT ごとに users テーブル参照を省略する
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class Principal:
+    """認証済みユーザーの軽量・不変な表現"""
+    id: int
+    username: str
+    role: str
+
+class PrincipalCache:
+    """トークンをキーにした TTL 付き LRU キャッシュ"""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[Principal, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Principal | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, principal: Principal, token_exp: float | None = None):
+        """token_exp（UNIX 時刻）を超えて保持しない"""
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (principal, time.monotonic() + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """ユーザー更新・削除時に該当ユーザーのエントリを全て破棄"""
+        with self._lock:
+            stale = [token for token, (p, _) in self._entries.items() if p.id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,351 @@
+# fastapi-app/related.py
+# 関連メモ（GET /memos/{id}/related）と重複に近いメモの検出のためのユーザーごとのベクトル索引
+#
+# - タイトル・本文の文字 2-gram / 3-gram とタグ名を特徴量とし、ハッシュで RELATED_DIM 次元に畳み込んだ TF-IDF ベクトルを作る
+#   （語彙表を持たないため分かち書きが要らず、日本語にも英語にも使える。索引の大きさはメモ数 × 次元数で決まる）
+# - ベクトルは L2 正規化した float32 の行列の 1 行として持ち、行列とベクトルの積（= コサイン類似度）から上位 k 件を選ぶ
+# - 索引は最初の問い合わせで作り、以降は差分同期の番号で変更されたメモの行だけを作り直す（crud/related.py）
+# - 差分更新では文書頻度（IDF）を増やすだけで減らさないため、変更が一定割合を超えたら作り直す
+# - numpy が無い環境では無効（エンドポイントは 503 を返す）
+
+import functools
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# 0 にすると関連メモを無効にする（numpy が無い場合も無効）
+RELATED = os.getenv("MEMO_RELATED", "1") == "1" and np is not None
+
+# ベクトルの次元数（大きいほど特徴量の衝突が減って精度が上がり、索引と問い合わせの時間がメモ数 × 次元数に比例して増える）
+RELATED_DIM = int(os.getenv("MEMO_RELATED_DIM", "256"))
+
+# 特徴量を取り出す本文の文字数（先頭のみ。長い本文の索引作成の時間を抑える）
+RELATED_MAX_CHARS = int(os.getenv("MEMO_RELATED_MAX_CHARS", "1000"))
+
+# 全ユーザーの索引の合計の上限（MB、超えたら最近使われていないユーザーの索引から破棄する）
+RELATED_CACHE_MB = int(os.getenv("MEMO_RELATED_CACHE_MB", "256"))
+
+# これ未満の類似度のメモは関連メモとして返さない
+RELATED_MIN_SCORE = float(os.getenv("MEMO_RELATED_MIN_SCORE", "0.1"))
+
+# 作成後に変更されたメモがこの割合を超えたら索引を作り直す（IDF を付け直す）
+RELATED_REBUILD_RATIO = 0.2
+_REBUILD_MIN_DOCUMENTS = 100  # メモの少ないユーザーで数件の変更ごとに作り直さないための下限
+
+# 特徴量の重み（本文の 1 に対して。出現をこの回数として数える）
+TITLE_WEIGHT = 2
+TAG_WEIGHT = 3
+
+# 問い合わせで前半の次元の類似度から選ぶ候補の数（k 件の何倍か、最低この件数）
+_CANDIDATE_FACTOR = 8
+_MIN_CANDIDATES = 256
+
+# 特徴量を一度に処理するメモの数（並べ替える配列の大きさを抑える）
+_CHUNK_SIZE = 1_000
+# 索引の作成時に文書頻度を数えるメモの数（多い場合は等間隔に選んだメモから全体の文書頻度を推定する）
+_DF_SAMPLE_SIZE = 5_000
+
+_GOLDEN = 0x9E3779B97F4A7C15  # 特徴量のコードを 64 ビットに散らす乗数（フィボナッチハッシュ）
+_TAG_SPACE = 1 << 63  # タグ名の特徴量を文字 n-gram と別の値にする（n-gram のコードは 63 ビット未満）
+_PART_SEPARATOR = " \x00 "  # チャンク内のタイトル・本文の区切り（0 を含む n-gram は捨てる）
+
+@functools.cache
+def _separator_table():
+    """コードポイント（基本多言語面）-> 区切り文字か（英数字・かな・漢字など str.isalnum() でない文字）"""
+    return np.array([not chr(c).isalnum() for c in range(0x10000)], dtype=bool)
+
+def _features(documents):
+    """documents（(タイトル, 本文, タグ名のリスト) のリスト）の特徴量
+
+    (文書番号, 特徴量のキー, 重みを付けた出現数) をそれぞれ 1 次元配列で返す（文書番号・キーの組は重複しない）。
+    特徴量は小文字にして記号・空白を 1 つの空白にまとめたタイトル・本文の文字 2-gram / 3-gram（語の境目は
+    前後の空白を含む n-gram になる）とタグ名。キーはそれをハッシュした 32 ビット整数（異なる特徴量が同じキーになることは許容する）。
+    文書ごとに正規表現や配列の操作をしないよう、チャンク全体を 1 つの文字列につないでまとめて処理する。
+    """
+    texts = []
+    for title, content, _ in documents:
+        texts.append(title or "")
+        texts.append((content or "")[:RELATED_MAX_CHARS])
+    joined = f" {_PART_SEPARATOR.join(t.replace(chr(0), ' ') if chr(0) in t else t for t in texts)} ".lower()
+    cp = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+    part = np.cumsum(cp == 0, dtype=np.int32)  # 各文字のタイトル・本文の番号（文書番号 × 2 + 本文なら 1）
+    separator = _separator_table()[np.minimum(cp, 0xFFFF)] & (cp != 0) & (cp <= 0xFFFF)
+    cp = np.where(separator, np.uint32(32), cp)
+    keep = np.ones(len(cp), dtype=bool)
+    keep[1:] = ~((cp[1:] == 32) & (cp[:-1] == 32))
+    cp, part = cp[keep].astype(np.uint64), part[keep]
+
+    bigrams = (cp[:-1] << np.uint64(21)) | cp[1:]
+    trigrams = (cp[:-2] << np.uint64(42)) | (cp[1:-1] << np.uint64(21)) | cp[2:]
+    valid_bigrams = (cp[:-1] != 0) & (cp[1:] != 0)
+    valid_trigrams = valid_bigrams[:-1] & (cp[2:] != 0)
+    text_parts = np.concatenate((part[:-1][valid_bigrams], part[:-2][valid_trigrams]))
+
+    tags = [(i, name) for i, (_, _, tag_names) in enumerate(documents) for name in tag_names]
+    codes = np.concatenate((
+        bigrams[valid_bigrams],
+        trigrams[valid_trigrams],
+        np.array([zlib.crc32(name.lower().encode()) | _TAG_SPACE for _, name in tags], dtype=np.uint64),
+    ))
+    docs = np.concatenate((text_parts // 2, np.array([i for i, _ in tags], dtype=np.int64))).astype(np.uint64)
+    weights = np.concatenate((np.where(text_parts % 2 == 0, TITLE_WEIGHT, 1), np.full(len(tags), TAG_WEIGHT)))
+    keys = (codes * np.uint64(_GOLDEN)) >> np.uint64(32)
+    # 同じ文書の同じキーをまとめて出現数を数える（タイトル・タグの出現は重みの回数だけ数える）。
+    # np.unique（return_inverse）より、その場で並べ替えて同じ値の連続を数える方が速い
+    pairs = np.repeat((docs << np.uint64(32)) | keys, weights)
+    pairs.sort()
+    starts = np.flatnonzero(np.concatenate(([True], pairs[1:] != pairs[:-1])))
+    counts = np.diff(np.append(starts, len(pairs)))
+    pairs = pairs[starts]
+    return (pairs >> np.uint64(32)).astype(np.int64), (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32), counts
+
+def _df_bits(documents: int) -> int:
+    """文書頻度の表の大きさ（2 の冪の指数）：メモ数に合わせて 1K〜1M 要素"""
+    return min(max(documents.bit_length() + 6, 10), 20)
+
+class RelatedIndex:
+    """1 ユーザーのメモのベクトルと特徴量の文書頻度
+
+    ベクトルは前半・後半の次元を別の行列（head / tail、行はメモ）に持つ。問い合わせでは head だけで全てのメモとの
+    類似度を求めて候補を絞り、候補だけ tail の分を足して正確な類似度を求める（全体を読む量が半分になる）。
+    version はこの索引に反映済みの差分同期の番号。更新・問い合わせは lock を取ってから行う。
+    """
+
+    def __init__(self, version: int, documents: int, dim: int = RELATED_DIM):
+        self.version = version
+        self.dim = dim
+        self.split = dim // 2
+        self.lock = threading.Lock()
+        self.head = np.zeros((0, self.split), dtype=np.float32)
+        self.tail = np.zeros((0, dim - self.split), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)  # 行 -> メモ ID（0 は空き行）
+        self.size = 0  # 使用中の行数（空き行を含む）
+        self.rows: dict[int, int] = {}  # メモ ID -> 行
+        self.free: list[int] = []
+        self.df_bits = _df_bits(documents)
+        self.df = np.zeros(1 << self.df_bits, dtype=np.float32)
+        self.documents = 0
+        self.changes = 0  # 作成後に追加・更新・削除したメモの数
+        self.tag_names: dict[int, str] = {}  # タグ ID -> 名前（名前の変更の検出用）
+
+    @classmethod
+    def build(cls, version: int, memos: list, tag_names: dict, dim: int = RELATED_DIM) -> "RelatedIndex":
+        """memos（(メモ ID, タイトル, 本文, タグ名のリスト) のリスト）から索引を作る"""
+        index = cls(version, len(memos), dim)
+        index.tag_names = dict(tag_names)
+        # 先に文書頻度を数えて（IDF を確定して）からベクトルを作る
+        step = -(-len(memos) // _DF_SAMPLE_SIZE) or 1
+        sample = memos[::step]
+        for start in range(0, len(sample), _CHUNK_SIZE):
+            _, keys, _ = _features([m[1:] for m in sample[start:start + _CHUNK_SIZE]])
+            index._count_documents(keys, len(memos) / len(sample))
+        index.documents = len(memos)
+        index._reserve(len(memos))
+        for start in range(0, len(memos), _CHUNK_SIZE):
+            chunk = memos[start:start + _CHUNK_SIZE]
+            index._store(np.arange(start, start + len(chunk)), index._vectors(len(chunk), *_features([m[1:] for m in chunk])))
+            index.ids[start:start + len(chunk)] = [m[0] for m in chunk]
+            index.rows.update((m[0], start + i) for i, m in enumerate(chunk))
+        index.size = len(memos)
+        return index
+
+    def _count_documents(self, keys, weight: float = 1.0):
+        # 同じ文書内でバケットが衝突した特徴量は 2 回数えるが、IDF の誤差は小さいため許容する
+        buckets = (keys >> np.uint32(32 - self.df_bits)).astype(np.intp)
+        if len(buckets) > len(self.df) // 8:
+            self.df += np.bincount(buckets, minlength=len(self.df)) * np.float32(weight)
+        else:
+            np.add.at(self.df, buckets, weight)
+
+    def _vectors(self, count: int, docs, keys, counts):
+        """特徴量から L2 正規化した (count, dim) の行列を作る"""
+        df = self.df[keys >> np.uint32(32 - self.df_bits)]
+        idf = np.log((1.0 + self.documents) / (1.0 + df)) + 1.0
+        values = (1.0 + np.log(counts)) * idf
+        # キーの最上位ビットで符号を決める（衝突した特徴量どうしが打ち消し合い、内積の偏りが 0 に近づく）
+        values[keys >= np.uint32(1 << 31)] *= -1.0
+        flat = docs * self.dim + (keys % np.uint32(self.dim)).astype(np.int64)
+        vectors = np.bincount(flat, weights=values, minlength=count * self.dim).reshape(count, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        return vectors / norms
+
+    def _store(self, rows, vectors):
+        self.head[rows] = vectors[:, :self.split]
+        self.tail[rows] = vectors[:, self.split:]
+
+    def _reserve(self, rows: int):
+        if rows <= len(self.ids):
+            return
+        capacity = max(rows, len(self.ids) * 2, 16)
+        head = np.zeros((capacity, self.split), dtype=np.float32)
+        tail = np.zeros((capacity, self.dim - self.split), dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        head[:self.size], tail[:self.size], ids[:self.size] = self.head[:self.size], self.tail[:self.size], self.ids[:self.size]
+        self.head, self.tail, self.ids = head, tail, ids
+
+    def upsert(self, memos: list):
+        """追加・更新されたメモ（build と同じ形式）のベクトルを作り直す"""
+        for start in range(0, len(memos), _CHUNK_SIZE):
+            chunk = memos[start:start + _CHUNK_SIZE]
+            docs, keys, counts = _features([m[1:] for m in chunk])
+            # 更新前の文書頻度は差し引けない（特徴量を保存していない）ため、作り直すまでは多めに数えたままにする
+            self._count_documents(keys)
+            self.documents += sum(1 for m in chunk if m[0] not in self.rows)
+            rows = []
+            for memo in chunk:
+                row = self.rows.get(memo[0])
+                if row is None:
+                    row = self._allocate()
+                    self.rows[memo[0]] = row
+                    self.ids[row] = memo[0]
+                rows.append(row)
+            self._store(rows, self._vectors(len(chunk), docs, keys, counts))
+        self.changes += len(memos)
+
+    def _allocate(self) -> int:
+        if self.free:
+            return self.free.pop()
+        self._reserve(self.size + 1)
+        self.size += 1
+        return self.size - 1
+
+    def remove(self, memo_ids):
+        """削除されたメモの行を空き行にする（ゼロベクトルのため、どのメモとの類似度も 0 になる）"""
+        for memo_id in memo_ids:
+            row = self.rows.pop(memo_id, None)
+            if row is None:
+                continue
+            self.head[row] = 0.0
+            self.tail[row] = 0.0
+            self.ids[row] = 0
+            self.free.append(row)
+            self.documents -= 1
+            self.changes += 1
+
+    def stale(self) -> bool:
+        """作り直すべきか（作成後の変更が多く IDF がずれている）"""
+        return self.changes > RELATED_REBUILD_RATIO * max(self.documents, _REBUILD_MIN_DOCUMENTS)
+
+    def query(self, memo_id: int, k: int, min_score: float = RELATED_MIN_SCORE):
+        """memo_id に似たメモの [(メモ ID, 類似度)]（類似度の高い順、最大 k 件）。memo_id が索引に無ければ None"""
+        row = self.rows.get(memo_id)
+        if row is None:
+            return None
+        scores = self.head[:self.size] @ self.head[row]
+        candidates = max(k * _CANDIDATE_FACTOR, _MIN_CANDIDATES)
+        if candidates < self.size:
+            # 全体を並べ替えず、前半の次元の類似度が高い候補を選ぶ
+            rows = np.argpartition(scores, -candidates)[-candidates:]
+        else:
+            rows = np.arange(self.size)
+        scores = scores[rows] + self.tail[rows] @ self.tail[row]
+        scores[rows == row] = -1.0
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in order if scores[i] >= min_score]
+
+    def vectors(self, start: int, end: int):
+        """start〜end 行のベクトル（前半・後半の次元をつないだもの）"""
+        return np.hstack((self.head[start:end], self.tail[start:end]))
+
+    def near_duplicates(self, threshold: float, limit: int, block: int = 1_024) -> list:
+        """類似度が threshold 以上のメモの組 [(メモ ID, メモ ID, 類似度)]（類似度の高い順、最大 limit 件）
+
+        block 行ずつ、その行以降の全ての行との類似度を求める（block × メモ数の行列だけを持つ）。
+        """
+        pairs = []
+        for start in range(0, self.size, block):
+            end = min(start + block, self.size)
+            scores = self.vectors(start, end) @ self.vectors(start, self.size).T
+            # 自分自身と、前のブロックで数えた組（対角より左下）を除く
+            scores = np.triu(scores, 1)
+            rows, columns = np.nonzero(scores >= threshold)
+            pairs.extend(zip(
+                self.ids[start + rows].tolist(),
+                self.ids[start + columns].tolist(),
+                scores[rows, columns].tolist(),
+            ))
+            if len(pairs) > limit * 4:
+                pairs.sort(key=lambda pair: -pair[2])
+                del pairs[limit:]
+        pairs.sort(key=lambda pair: -pair[2])
+        return pairs[:limit]
+
+    @property
+    def nbytes(self) -> int:
+        return self.head.nbytes + self.tail.nbytes + self.ids.nbytes + self.df.nbytes + 64 * (len(self.rows) + len(self.tag_names))
+
+class RelatedIndexCache:
+    """ユーザー ID をキーにした索引の LRU キャッシュ（合計の大きさで上限を決める）"""
+
+    def __init__(self, max_bytes: int = RELATED_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.updates = 0
+        self.queries = 0
+        self._entries: OrderedDict[int, RelatedIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> RelatedIndex | None:
+        with self._lock:
+            index = self._entries.get(user_id)
+            if index is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return index
+
+    def put(self, user_id: int, index: RelatedIndex):
+        with self._lock:
+            self._entries[user_id] = index
+            self._entries.move_to_end(user_id)
+            self.builds += 1
+            self._evict()
+
+    def record_update(self):
+        with self._lock:
+            self.updates += 1
+            self._evict()  # 追加で行列が大きくなった場合
+
+    def record_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def _evict(self):
+        total = sum(index.nbytes for index in self._entries.values())
+        # 最後に使われた索引は上限を超えていても残す（1 ユーザーで上限を超える場合）
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, index = self._entries.popitem(last=False)
+            total -= index.nbytes
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": sum(index.nbytes for index in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "updates": self.updates,
+                "queries": self.queries,
+            }
+
+related_cache = RelatedIndexCache()
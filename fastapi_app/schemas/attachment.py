@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+class AttachmentResponse(BaseModel):
+    id: int
+    memo_id: int
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+from typing import List
+from schemas.memo import MemoResponse
+from schemas.tag import TagResponse
+from schemas.category import CategoryResponse
+
+class BootstrapResponse(BaseModel):
+    memos: List[MemoResponse]  # GET /memos の 1 ページ目（既定の並び順）
+    next_cursor: str | None
+    categories: List[CategoryResponse]
+    tags: List[TagResponse]
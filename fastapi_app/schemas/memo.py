@@ -26,3 +26,66 @@ class MemoResponse(MemoBase):
     tags: List[TagResponse] = []
 
     model_config = {"from_attributes": True}
+
+class MemoSearchResult(MemoResponse):
+    title_highlight: str
+    snippet: Optional[str] = None
+    rank: Optional[float] = None  # BM25（小さいほど関連度が高い）
+
+class MemoRelated(BaseModel):
+    id: int
+    title: str
+    preview: Optional[str] = None  # 本文の先頭（一覧と同じく本文は返さない）
+    category_id: Optional[int] = None
+    important: int = 1
+    updated_at: datetime
+    tags: List[TagResponse] = []
+    score: float  # コサイン類似度（1 に近いほど似ている）
+
+# --- 一括操作 ---
+class MemoPatch(BaseModel):
+    """一括更新の 1 件分（指定したフィールドのみ更新）"""
+    id: int
+    title: Optional[str] = Field(None, min_length=1, max_length=400)
+    content: Optional[str] = None
+    category_id: Optional[int] = None
+    file_paths: Optional[List[str]] = None
+    urls: Optional[List[str]] = None
+    important: Optional[int] = None
+    tag_ids: Optional[List[int]] = None
+
+class MemoBatchCreate(BaseModel):
+    items: List[MemoCreate] = Field(..., min_length=1, max_length=1000)
+    atomic: bool = True  # True: 1 件でも失敗したら全件取り消し / False: 成功分のみ反映
+
+class MemoBatchUpdate(BaseModel):
+    items: List[MemoPatch] = Field(..., min_length=1, max_length=1000)
+    atomic: bool = True
+
+class MemoBatchDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+    atomic: bool = True
+
+# --- インポート 1 行分（エクスポート形式と同じ列） ---
+class MemoImportRow(BaseModel):
+    title: str = Field(..., min_length=1, max_length=400)
+    content: Optional[str] = None
+    category: Optional[str] = Field(None, max_length=50)
+    tags: List[str] = []
+    file_paths: List[str] = []
+    urls: List[str] = []
+    important: int = 1
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class MemoBatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    ok: bool
+    error: Optional[str] = None
+
+class MemoBatchResult(BaseModel):
+    committed: bool
+    succeeded: int
+    failed: int
+    results: List[MemoBatchItemResult]
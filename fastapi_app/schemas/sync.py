@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List
+from schemas.memo import MemoResponse
+from schemas.tag import TagResponse
+from schemas.category import CategoryResponse
+
+class SyncDeleted(BaseModel):
+    memos: List[int] = []
+    tags: List[int] = []
+    categories: List[int] = []
+
+class SyncResponse(BaseModel):
+    token: str                 # 次回の since に渡す（X-Next-Cursor が無くなった最後のページの後で保存する）
+    full: bool                 # True: 全件（手元のデータを置き換える）
+    memos: List[MemoResponse]  # 追加・更新されたもの（deleted を先に適用してから反映する）。X-Next-Cursor のページに分かれる
+    tags: List[TagResponse]
+    categories: List[CategoryResponse]
+    deleted: SyncDeleted
@@ -16,5 +16,6 @@ class TagResponse(TagBase):
     user_id: int  # ← 追加
     created_at: datetime
     updated_at: datetime
+    memo_count: int = 0  # このタグが付いたメモの数
 
     model_config = {"from_attributes": True}
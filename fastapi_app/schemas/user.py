@@ -17,3 +17,10 @@ class UserResponse(UserBase):
 
     class Config:
         from_attributes = True  # ORM モード
+
+class AdminUserResponse(UserResponse):
+    """管理画面の一覧用（利用状況付き）"""
+    memo_count: int = 0
+    tag_count: int = 0
+    category_count: int = 0
+    content_bytes: int = 0  # タイトル + 本文の UTF-8 バイト数
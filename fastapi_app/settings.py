@@ -0,0 +1,33 @@
+# fastapi-app/settings.py
+# アプリケーションの設定（create_app に渡す）。既定値は環境変数から読む
+#
+# USE_ASYNC_DB / USE_WRITE_QUEUE（db.py）・圧縮（compression.py）などはモジュールの読み込み時に決まる
+# プロセス単位の設定のため、ここには含めない
+
+import os
+from dataclasses import dataclass
+
+from attachments import ATTACHMENT_DIR
+from db import SQLALCHEMY_DATABASE_URL
+from shards import SHARDS, SHARD_DIR, SHARD_MAX_OPEN
+
+# 起動時に未適用のスキーマ移行を実行するか（0 なら実行せず、古いスキーマなら起動を中止する）
+# 複数ワーカーで運用する場合は 0 にして、デプロイ時に `python manage.py migrate` を 1 回だけ実行する
+MIGRATE_ON_STARTUP = os.getenv("MEMO_MIGRATE_ON_STARTUP", "1") == "1"
+
+# 最初のリクエストで行われる遅延処理（ルートの依存関係の解析・ORM のマッパー構成・起動直後の GC）を起動時に済ませるか
+PREWARM = os.getenv("MEMO_PREWARM", "1") == "1"
+
+# 起動時にプールへ開いておく接続数（0 で無効。SQLAlchemy のプール既定サイズは 5）
+POOL_PREWARM = int(os.getenv("MEMO_POOL_PREWARM", "5"))
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str = SQLALCHEMY_DATABASE_URL
+    attachment_dir: str = ATTACHMENT_DIR
+    migrate_on_startup: bool = MIGRATE_ON_STARTUP
+    prewarm: bool = PREWARM
+    pool_prewarm: int = POOL_PREWARM
+    shards: int = SHARDS
+    shard_dir: str = SHARD_DIR
+    shard_max_open: int = SHARD_MAX_OPEN
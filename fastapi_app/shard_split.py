@@ -0,0 +1,130 @@
+# fastapi-app/shard_split.py
+# 既存の DB（全ユーザーのメモ等が中央 DB にある）をユーザー単位のシャードに分割する（`python manage.py split-shards`）
+#
+# サーバーを止めてから実行すること。シャードごとに中央 DB を ATTACH して行をコピーし、
+# 件数を確かめてから中央 DB にシャード数を記録し、中央 DB のメモ等を削除する（記録と削除は 1 トランザクション）。
+# 途中で失敗した場合は中央 DB は変更されない（作りかけのシャードのディレクトリを削除してから再実行する）。
+
+import logging
+import os
+import shutil
+
+from sqlalchemy import insert, text
+
+from db import Base
+from models.shard import ShardLayout
+from attachments import AttachmentStore, attachment_store, shard_store
+from migrations import migrate
+
+logger = logging.getLogger("memo.db")
+
+# シャードにコピーしないテーブル（トリガーで作られる索引はシャードの移行時に作り直す）
+_DERIVED_TABLES = {"memo_urls", "memo_files", "shard_layout"}
+
+# 中央 DB から削除する順（memos の削除で memo_tags・memo_urls 等が連鎖削除される）
+_PURGE_TABLES = ["memos", "tags", "categories", "tombstones", "sync_sequences", "blobs"]
+
+class ShardSplitError(RuntimeError):
+    pass
+
+def _copy_statement(table) -> str:
+    """central（ATTACH した中央 DB）からこのシャードの行をコピーする INSERT 文（:n シャード数、:i シャード番号）"""
+    columns = [c.name for c in table.columns if c.computed is None]
+    column_list = ", ".join(columns)
+    if table.name == "users":
+        # 認証情報はコピーしない（外部キーの参照先としての行。shards.py）
+        return (
+            "INSERT INTO users (id, username, hashed_password, role, deleted_at) "
+            "SELECT id, '#' || id, '', 'user', deleted_at FROM central.users WHERE id % :n = :i"
+        )
+    if table.name == "memo_tags":
+        where = "memo_id IN (SELECT id FROM central.memos WHERE user_id % :n = :i)"
+    elif table.name == "blobs":
+        where = "sha256 IN (SELECT sha256 FROM central.memo_attachments WHERE user_id % :n = :i)"
+    else:
+        where = "user_id % :n = :i"
+    return f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM central.{table.name} WHERE {where}"
+
+def _copy_tables():
+    return [table for table in Base.metadata.sorted_tables if table.name not in _DERIVED_TABLES]
+
+def _count(conn, table: str) -> int:
+    return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+def _copy_shard(shard, central_path: str, count: int) -> dict:
+    """シャードを作成して行をコピーし、移行（トリガー・索引の作成と集計）を行う。テーブル名 -> 件数"""
+    # トリガーの無い状態でコピーする（差分同期の採番などを動かさない）。トリガーと派生テーブルは migrate で作る
+    Base.metadata.create_all(bind=shard.engine)
+    copied = {}
+    with shard.engine.connect() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS central", (central_path,))
+        try:
+            for table in _copy_tables():
+                conn.execute(text(_copy_statement(table)), {"n": count, "i": shard.index})
+                copied[table.name] = _count(conn, table.name)
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DETACH DATABASE central")
+    migrate(shard.engine)
+    return copied
+
+def _copy_files(shard, store: AttachmentStore) -> tuple[int, int]:
+    """シャードの blob のファイルをシャードの置き場所へハードリンク（できなければコピー）する。(件数, 見つからない件数)"""
+    target = shard_store(shard, store)
+    with shard.engine.connect() as conn:
+        hashes = conn.execute(text("SELECT sha256 FROM blobs")).scalars().all()
+    placed = missing = 0
+    for sha256 in hashes:
+        source, destination = store.path(sha256), target.path(sha256)
+        if not os.path.exists(source):
+            missing += 1
+            continue
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+        placed += 1
+    return placed, missing
+
+def split_shards(engine, pool, store: AttachmentStore = attachment_store) -> dict:
+    """中央 DB（engine）のメモ・タグ・カテゴリ等を pool のシャードに分割する
+
+    {"shards": シャード番号 -> テーブル名 -> 件数, "files": 配置したファイル数, "missing_files": 見つからなかった件数} を返す。
+    """
+    if not pool.enabled:
+        raise ShardSplitError("the number of shards must be at least 1")
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT shards FROM shard_layout")).first():
+            raise ShardSplitError("the database has already been split into shards")
+        expected = {table.name: _count(conn, table.name) for table in _copy_tables() if table.name != "blobs"}
+    existing = [pool.path(index) for index in pool.indexes() if os.path.exists(pool.path(index))]
+    if existing:
+        raise ShardSplitError(f"shard files already exist (remove them first): {', '.join(existing)}")
+
+    os.makedirs(pool.directory, exist_ok=True)
+    central_path = os.path.abspath(engine.url.database)
+    copied, placed, missing = {}, 0, 0
+    for shard in pool.each():
+        copied[shard.index] = _copy_shard(shard, central_path, pool.count)
+        shard_placed, shard_missing = _copy_files(shard, store)
+        placed += shard_placed
+        missing += shard_missing
+        logger.warning("shard %d: %s", shard.index, copied[shard.index])
+
+    # 各行がちょうど 1 つのシャードにコピーされたこと（blobs は複数のシャードで共有されうるため除く）
+    for name, total in expected.items():
+        actual = sum(counts[name] for counts in copied.values())
+        if actual != total:
+            raise ShardSplitError(f"{name}: copied {actual} rows into shards, expected {total}; the central database was not changed")
+
+    with engine.begin() as conn:
+        hashes = conn.execute(text("SELECT sha256 FROM blobs")).scalars().all()
+        conn.execute(insert(ShardLayout).values(shards=pool.count))
+        for name in _PURGE_TABLES:
+            conn.execute(text(f"DELETE FROM {name}"))
+    # シャード側にリンク済みのため、中央の置き場所からは削除する
+    for sha256 in hashes:
+        store.remove(sha256)
+    return {"shards": copied, "files": placed, "missing_files": missing}
@@ -0,0 +1,244 @@
+# fastapi-app/shards.py
+# ユーザー単位のシャード：メモ・タグ・カテゴリ・添付ファイルをユーザーごとに決まるシャード DB に置く（MEMO_SHARDS > 0 で有効）
+#
+# SQLite は 1 ファイルに同時に 1 つしか書き込めないため、1 つの DB では全ユーザーの書き込みが直列化される。
+# シャードごとに別のファイル・別の単一ライターにすれば、別のシャードのユーザーの書き込みは並行してコミットできる。
+#
+# - users（ログイン・認証）は中央 DB に置く。シャードの users にはそのシャードのユーザーの行だけを置く
+#   （外部キーの ON DELETE CASCADE・差分同期のトリガーをそのまま使うための行で、ユーザー名・パスワードは持たない）
+# - シャードは user_id % シャード数 で決まる。分割後にシャード数は変えられない（中央 DB の shard_layout に記録する）
+# - 開いておくシャード（エンジン・単一ライター）は最大 max_open 個。使用中でないものから LRU で閉じる
+# - 既存の DB の分割は `python manage.py split-shards`（shard_split.py）
+# - 非同期モード（USE_ASYNC_DB）とは併用できない
+
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session, sessionmaker
+
+import db as database
+from db import USE_WRITE_QUEUE
+from write_queue import WriteQueue, write_queue
+from models.shard import ShardLayout
+from crud.user import get_user_stats
+
+# シャード数（0 でシャードを使わず、全て中央 DB に置く）
+SHARDS = int(os.getenv("MEMO_SHARDS", "0"))
+SHARD_DIR = os.getenv("MEMO_SHARD_DIR", "./shards")
+# 同時に開いておくシャードの上限（1 シャードあたり接続プールと書き込みスレッドを持つ）
+SHARD_MAX_OPEN = int(os.getenv("MEMO_SHARD_MAX_OPEN", "16"))
+
+class ShardLayoutMismatch(RuntimeError):
+    pass
+
+class Shard:
+    """1 つのシャード DB（読み書き用エンジン・単一ライター）。ShardPool から取得する"""
+
+    def __init__(self, index: int, path: str):
+        self.index = index
+        self.path = path
+        self.engine, self.writer_engine = database.create_engines(f"sqlite:///{path}")
+        # セッションからシャードを引けるようにする（shard_of）
+        self.session = sessionmaker(bind=self.engine, autocommit=False, autoflush=False, info={"shard": self})
+        self.write_queue = WriteQueue(bind=self.writer_engine)
+        self.refs = 0  # 使用中の数（0 のものだけ閉じる）
+
+    def write(self, fn, *args, db: Session | None = None):
+        """書き込み関数 fn(db, *args) を実行する（USE_WRITE_QUEUE 時は単一ライターでまとめてコミット）
+
+        db が None の場合は専用のセッションを開いて実行する。
+        """
+        if USE_WRITE_QUEUE:
+            return self.write_queue.run(fn, *args)
+        if db is None:
+            with self.session() as own_db:
+                return fn(own_db, *args)
+        return fn(db, *args)
+
+    def close(self):
+        self.write_queue.stop()
+        self.engine.dispose()
+        self.writer_engine.dispose()
+
+class _CentralShard:
+    """シャードを使わない場合の保存先（db.py のエンジンとグローバルの単一ライター）"""
+    index = None
+    write = Shard.write
+
+    @property
+    def engine(self):
+        return database.engine
+
+    @property
+    def session(self):
+        return database.SessionLocal
+
+    @property
+    def write_queue(self):
+        return write_queue
+
+class ShardPool:
+    """シャードの番号の決定と、開いているシャードの LRU 管理"""
+
+    def __init__(self, count: int = SHARDS, directory: str = SHARD_DIR, max_open: int = SHARD_MAX_OPEN):
+        self.count = count
+        self.directory = directory
+        self.max_open = max_open
+        self.central = _CentralShard()
+        self.opened = 0
+        self.evicted = 0
+        self._closed_batches = 0
+        self._closed_jobs = 0
+        self._open: OrderedDict[int, Shard] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, count: int, directory: str, max_open: int):
+        """設定を変える（create_app から呼ぶ。開いているシャードは閉じる）"""
+        self.close_all()
+        self.count = count
+        self.directory = directory
+        self.max_open = max_open
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 0
+
+    def index(self, user_id: int) -> int:
+        return user_id % self.count
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.directory, f"shard-{index:04d}.db")
+
+    def indexes(self) -> list[int]:
+        return list(range(self.count))
+
+    def acquire(self, user_id: int):
+        """user_id のシャードを返す（シャードを使わない場合は中央 DB）。使い終わったら release すること"""
+        if not self.enabled:
+            return self.central
+        return self.acquire_index(self.index(user_id))
+
+    def acquire_index(self, index: int) -> Shard:
+        with self._lock:
+            shard = self._open.get(index)
+            if shard is None:
+                # エンジンを作るだけで接続は開かない（最初の使用時に開く）
+                shard = Shard(index, self.path(index))
+                self._open[index] = shard
+                self.opened += 1
+            self._open.move_to_end(index)
+            shard.refs += 1
+            idle = self._evict()
+        self._close(idle)
+        return shard
+
+    def release(self, shard):
+        if shard is self.central:
+            return
+        with self._lock:
+            shard.refs -= 1
+            idle = self._evict()
+        self._close(idle)
+
+    @contextmanager
+    def use(self, user_id: int):
+        shard = self.acquire(user_id)
+        try:
+            yield shard
+        finally:
+            self.release(shard)
+
+    @contextmanager
+    def use_index(self, index: int):
+        shard = self.acquire_index(index)
+        try:
+            yield shard
+        finally:
+            self.release(shard)
+
+    def each(self, indexes: list[int] | None = None):
+        """全シャード（indexes を指定すればその番号のみ）を 1 つずつ開いて返す。シャードを使わない場合は中央 DB のみ"""
+        if not self.enabled:
+            yield self.central
+            return
+        for index in self.indexes() if indexes is None else indexes:
+            with self.use_index(index) as shard:
+                yield shard
+
+    def user_stats(self, user_ids: list[int]) -> dict:
+        """get_user_stats をシャードごとに集計する（crud.user.get_user_rows の stats に渡す）"""
+        groups = defaultdict(list)
+        for user_id in user_ids:
+            groups[self.index(user_id)].append(user_id)
+        stats = {}
+        for shard in self.each(sorted(groups)):
+            with shard.session() as db:
+                stats.update(get_user_stats(db, groups[shard.index]))
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            shards = list(self._open.values())
+            self._open.clear()
+        self._close(shards)
+
+    def stats(self) -> dict:
+        with self._lock:
+            shards = list(self._open.values())
+            return {
+                "open": len(shards),
+                "opened": self.opened,
+                "evicted": self.evicted,
+                "write_batches": self._closed_batches + sum(shard.write_queue.batches for shard in shards),
+                "write_jobs": self._closed_jobs + sum(shard.write_queue.jobs for shard in shards),
+            }
+
+    def _evict(self) -> list[Shard]:
+        """上限を超えた分を古い順に取り除く（ロック内で呼ぶ。使用中のシャードは残す）"""
+        idle = []
+        for index, shard in list(self._open.items()):
+            if len(self._open) <= self.max_open:
+                break
+            if shard.refs == 0:
+                del self._open[index]
+                idle.append(shard)
+        self.evicted += len(idle)
+        return idle
+
+    def _close(self, shards: list[Shard]):
+        # 書き込みスレッドの終了を待つためロックの外で閉じる
+        for shard in shards:
+            shard.close()
+            with self._lock:
+                self._closed_batches += shard.write_queue.batches
+                self._closed_jobs += shard.write_queue.jobs
+
+shard_pool = ShardPool()
+
+def shard_of(db: Session):
+    """セッションの接続先のシャード（ShardPool のシャードのセッションでなければ中央 DB）"""
+    return db.info.get("shard", shard_pool.central)
+
+def check_layout(engine, count: int):
+    """中央 DB に記録されたシャード数と count が一致するか確かめる（一致しなければ ShardLayoutMismatch）
+
+    記録が無く、中央 DB にメモ・タグ・カテゴリが無い（新しい DB）場合は count を記録する。
+    """
+    with engine.begin() as conn:
+        recorded = conn.execute(text("SELECT shards FROM shard_layout ORDER BY id DESC LIMIT 1")).scalar()
+        if recorded is None:
+            if count == 0:
+                return
+            has_data = conn.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM memos) OR EXISTS (SELECT 1 FROM tags) OR EXISTS (SELECT 1 FROM categories)"
+            )).scalar()
+            if has_data:
+                raise ShardLayoutMismatch(
+                    f"the central database holds unsharded data; run `python manage.py split-shards --shards {count}`"
+                )
+            conn.execute(insert(ShardLayout).values(shards=count))
+        elif recorded != count:
+            raise ShardLayoutMismatch(f"data is split into {recorded} shards, but {count} are configured")
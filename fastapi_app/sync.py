@@ -0,0 +1,108 @@
+# fastapi-app/sync.py
+# 差分同期：ユーザーごとの変更連番と削除記録（tombstone）をトリガーで維持する
+# （ORM を通らない一括 INSERT / UPDATE / DELETE も漏れなく記録される）
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+# 対象テーブル → tombstone の entity 名
+SYNC_TABLES = {"memos": "memo", "tags": "tag", "categories": "category"}
+
+# 削除記録を残す日数（prune-tombstones で削除する）。これより長く同期していないクライアントは全件から同期し直す
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("MEMO_TOMBSTONE_RETENTION_DAYS", "90"))
+
+def _bump(user_expr: str) -> str:
+    """ユーザーの連番を +1 する SQL（トリガー本体用）"""
+    return (
+        f"INSERT INTO sync_sequences (user_id, seq) VALUES ({user_expr}, 1) "
+        f"ON CONFLICT(user_id) DO UPDATE SET seq = seq + 1;"
+    )
+
+def _current(user_expr: str) -> str:
+    return f"(SELECT seq FROM sync_sequences WHERE user_id = {user_expr})"
+
+def _active(user_expr: str) -> str:
+    """ユーザーが存在し、削除予約中でない（ユーザー削除に伴う連鎖削除では記録しない）"""
+    return f"EXISTS (SELECT 1 FROM users WHERE id = {user_expr} AND deleted_at IS NULL)"
+
+def _table_triggers(table: str, entity: str) -> list[str]:
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_sync_ai AFTER INSERT ON {table}
+        WHEN {_active("new.user_id")} BEGIN
+            {_bump("new.user_id")}
+            UPDATE {table} SET sync_version = {_current("new.user_id")} WHERE id = new.id;
+        END
+        """,
+        # sync_version 自体の更新では発火させない
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_sync_au AFTER UPDATE ON {table}
+        WHEN new.sync_version IS old.sync_version AND {_active("new.user_id")} BEGIN
+            {_bump("new.user_id")}
+            UPDATE {table} SET sync_version = {_current("new.user_id")} WHERE id = new.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_sync_ad AFTER DELETE ON {table}
+        WHEN {_active("old.user_id")} BEGIN
+            {_bump("old.user_id")}
+            INSERT INTO tombstones (user_id, entity, entity_id, sync_version, deleted_at)
+            VALUES (old.user_id, '{entity}', old.id, {_current("old.user_id")}, CURRENT_TIMESTAMP);
+        END
+        """,
+    ]
+
+def _memo_tag_triggers() -> list[str]:
+    # タグの付け替えはメモ側の変更として扱う
+    owner = (
+        "(SELECT m.user_id FROM memos m JOIN users u ON u.id = m.user_id "
+        "WHERE m.id = {row}.memo_id AND u.deleted_at IS NULL)"
+    )
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS memo_tags_sync_a{op} AFTER {event} ON memo_tags
+        WHEN {owner.format(row=row)} IS NOT NULL BEGIN
+            {_bump(owner.format(row=row))}
+            UPDATE memos SET sync_version = {_current(owner.format(row=row))} WHERE id = {row}.memo_id;
+        END
+        """
+        for op, event, row in (("i", "INSERT", "new"), ("d", "DELETE", "old"))
+    ]
+
+_TRIGGER_NAMES = [f"{table}_sync_a{op}" for table in SYNC_TABLES for op in "iud"] + ["memo_tags_sync_ai", "memo_tags_sync_ad"]
+
+def init_sync(engine):
+    """既存 DB に sync_version 列を追加し、トリガーを作成する（定義の変更を反映するため毎回作り直す）
+
+    トリガーは users.deleted_at を参照するため、先に init_user_deletion で列を追加しておくこと。
+    """
+    with engine.begin() as conn:
+        for table in SYNC_TABLES:
+            columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+            if "sync_version" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN sync_version INTEGER NOT NULL DEFAULT 0"))
+        for name in _TRIGGER_NAMES:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        for table, entity in SYNC_TABLES.items():
+            for ddl in _table_triggers(table, entity):
+                conn.execute(text(ddl))
+        for ddl in _memo_tag_triggers():
+            conn.execute(text(ddl))
+
+def prune_tombstones(engine, days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """days 日より前の削除記録を削除する（件数を返す）
+
+    ユーザーごとに削除した記録の最大の番号を sync_sequences.pruned に残し、それより前の since からの
+    差分同期を拒否する（削除を伝えられないため。crud/sync.py の SyncTokenExpired）。
+    """
+    # トリガーの CURRENT_TIMESTAMP と ORM の datetime のどちらの形式とも文字列で比べられる形
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE sync_sequences SET pruned = max(pruned, ("
+            "SELECT max(t.sync_version) FROM tombstones t WHERE t.user_id = sync_sequences.user_id AND t.deleted_at < :cutoff"
+            ")) WHERE user_id IN (SELECT user_id FROM tombstones WHERE deleted_at < :cutoff)"
+        ), {"cutoff": cutoff})
+        return conn.execute(text("DELETE FROM tombstones WHERE deleted_at < :cutoff"), {"cutoff": cutoff}).rowcount
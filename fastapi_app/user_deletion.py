@@ -0,0 +1,107 @@
+# fastapi-app/user_deletion.py
+# 大量のメモを持つユーザーの削除：users.deleted_at で削除を予約（ログイン・認証は即座に不可）してから、
+# バックグラウンドでメモを一定件数ずつ別トランザクションで削除する
+# （1 回の書き込みロックを短く保ち、他のユーザーの書き込みを止めない）
+#
+# シャード使用時（shards.py）はユーザーのシャードで削除予約・分割削除を行い、シャードのデータが無くなってから
+# 中央 DB のユーザーを削除する（中央の行が残っている間は同じ ID が再利用されない）。
+
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import text
+
+from shards import shard_pool
+from crud.user import get_pending_user_deletions, mark_user_deleted, purge_user_chunk
+
+logger = logging.getLogger("memo.db")
+
+USER_DELETE_CHUNK_SIZE = 1000  # 1 トランザクションで削除するメモの件数
+USER_DELETE_PAUSE = 0.01       # チャンクの間に他の書き込みへ譲る時間（秒）
+
+def init_user_deletion(engine):
+    """既存 DB に users.deleted_at 列を追加する（sync.py のトリガーが参照するため init_sync より先に呼ぶ）"""
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(users)"))}
+        if "deleted_at" not in columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN deleted_at DATETIME"))
+
+class UserDeleter:
+    """削除予約されたユーザーを専用スレッドで 1 人ずつ分割削除する"""
+
+    def __init__(self, chunk_size: int = USER_DELETE_CHUNK_SIZE, pause: float = USER_DELETE_PAUSE):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.chunks = 0
+        self.users_deleted = 0
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: int):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="user-deleter", daemon=True)
+                self._thread.start()
+        self._queue.put(user_id)
+
+    def resume(self):
+        """削除予約のまま残っているユーザー（再起動前に途中だったもの）の削除を再開する"""
+        with shard_pool.central.session() as db:
+            pending = set(get_pending_user_deletions(db))
+        if shard_pool.enabled:
+            for shard in shard_pool.each():
+                with shard.session() as db:
+                    pending.update(get_pending_user_deletions(db))
+        for user_id in sorted(pending):
+            self.submit(user_id)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": len(self._pending), "chunks": self.chunks, "users_deleted": self.users_deleted}
+
+    def _purge_chunk(self, user_id: int) -> bool:
+        central = shard_pool.central
+        if not shard_pool.enabled:
+            return central.write(purge_user_chunk, user_id, self.chunk_size)
+        with shard_pool.use(user_id) as shard:
+            # 中央 DB だけが予約済みの場合（シャードの予約前に中断した）もシャードの行を削除できるよう予約する
+            shard.write(mark_user_deleted, user_id)
+            if shard.write(purge_user_chunk, user_id, self.chunk_size):
+                return True
+        # 中央 DB にはメモが無いため 1 回でユーザーの行だけが削除される
+        central.write(purge_user_chunk, user_id, 1)
+        return False
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            if user_id is None:
+                return
+            try:
+                while self._purge_chunk(user_id):
+                    self.chunks += 1
+                    time.sleep(self.pause)
+                self.chunks += 1
+                self.users_deleted += 1
+            except Exception:
+                # 予約は DB に残るため、次回起動時の resume() で再開される
+                logger.exception("background deletion of user %s failed", user_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(user_id)
+
+user_deleter = UserDeleter()
@@ -0,0 +1,121 @@
+# fastapi-app/write_queue.py
+# 単一ライター：書き込みを 1 本の接続に集約し、同時に届いた小さな書き込みをまとめてコミットする
+# （SQLite は同時に 1 つしか書き込めないため、ロック待ち・"database is locked" を避ける）
+
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session, sessionmaker
+
+import db as database
+
+class _GroupCommitSession(Session):
+    """CRUD 関数内の commit() を flush() に置き換える（実際のコミットはライターがまとめて行う）"""
+
+    def commit(self):
+        self.flush()
+
+class WriteQueue:
+    """書き込み関数 fn(db, *args) を専用スレッドで順に実行し、バッチ単位でコミットする
+
+    bind を省略した場合はスレッドの開始時点の db.writer_engine を使う（create_app で作り直されたエンジンに追従する）。
+    """
+
+    def __init__(self, bind=None, max_batch: int = 64):
+        self.bind = bind
+        self.max_batch = max_batch
+        self.batches = 0
+        self.jobs = 0
+        self._session_factory = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._session_factory = sessionmaker(
+                    bind=self.bind or database.writer_engine,
+                    class_=_GroupCommitSession,
+                    autoflush=False,
+                    expire_on_commit=False,
+                )
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self._ensure_started()
+        future = Future()
+        # 呼び出し元のコンテキストで実行する（リクエスト単位の計測を引き継ぐ）
+        self._queue.put((fn, args, kwargs, future, contextvars.copy_context()))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """同期版：コミット完了まで待って fn の戻り値を返す"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run_async(self, fn, *args, **kwargs):
+        """非同期版：スレッドを占有せずにコミット完了を待つ"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            # 前のコミット中に溜まった書き込みを同じトランザクションに入れる
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)
+                    break
+                batch.append(job)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        db = self._session_factory()
+        outcomes = []
+        try:
+            for fn, args, kwargs, future, context in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # 1 件の失敗が他の書き込みを巻き込まないよう SAVEPOINT で分離
+                # （SAVEPOINT の解放でも after_commit が発火するため、コミット後の処理は db.defer_until_commit で記録する）
+                try:
+                    with db.begin_nested():
+                        result = context.run(fn, db, *args, **kwargs)
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            Session.commit(db)
+        except Exception as e:
+            db.rollback()
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+        finally:
+            # 結果のオブジェクトはリクエスト側スレッドでシリアライズするため切り離す
+            db.expunge_all()
+            db.close()
+
+        self.batches += 1
+        self.jobs += len(outcomes)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+write_queue = WriteQueue()
@@ -35,8 +35,34 @@ export function logout() {
 /* =========================
    MEMO
 ========================= */
-export async function fetchMemos() {
-  const res = await fetch(`${API_URL}/memos`, { headers: authHeaders() });
+// params: { category_id, tag_id, important, sort, cursor, limit, fields }
+// fields: 取得する項目（カンマ区切り。preview は本文の先頭）。省略時は全項目
+// 戻り値: { items, nextCursor }（nextCursor が null なら最終ページ）
+export async function fetchMemos(params = {}) {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== "" && value !== null && value !== undefined) query.append(key, value);
+  });
+  const qs = query.toString();
+  const res = await fetch(`${API_URL}/memos${qs ? `?${qs}` : ""}`, { headers: authHeaders() });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return {
+    items: await res.json(),
+    nextCursor: res.headers.get("X-Next-Cursor"),
+  };
+}
+
+// 全文検索（BM25 順）
+export async function searchMemos(q, { limit = 100, offset = 0 } = {}) {
+  const query = new URLSearchParams({ q, limit, offset });
+  const res = await fetch(`${API_URL}/memos/search?${query}`, { headers: authHeaders() });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
+}
+
+// 関連メモ（タイトル・本文・タグの似ている順。score はコサイン類似度）
+export async function fetchRelatedMemos(id, k = 5) {
+  const res = await fetch(`${API_URL}/memos/${id}/related?k=${k}`, { headers: authHeaders() });
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
   return res.json();
 }
@@ -76,6 +102,113 @@ export async function deleteMemo(id) {
   return true;
 }
 
+/* =========================
+   ATTACHMENT
+========================= */
+export async function fetchAttachments(memoId) {
+  const res = await fetch(`${API_URL}/memos/${memoId}/attachments`, { headers: authHeaders() });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
+}
+
+// 本体はファイルそのもの（multipart ではない）。サーバーは受信しながらハッシュを計算し、同じ内容は 1 つだけ保存する
+export async function uploadAttachment(memoId, file) {
+  const query = new URLSearchParams({ filename: file.name });
+  const res = await fetch(`${API_URL}/memos/${memoId}/attachments?${query}`, {
+    method: "POST",
+    headers: { ...authHeaders(), "Content-Type": file.type || "application/octet-stream" },
+    body: file,
+  });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
+}
+
+// 認証ヘッダが必要なため、リンクではなく fetch で取得して Blob で返す
+export async function downloadAttachment(memoId, attachmentId) {
+  const res = await fetch(`${API_URL}/memos/${memoId}/attachments/${attachmentId}`, { headers: authHeaders() });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.blob();
+}
+
+export async function deleteAttachment(memoId, attachmentId) {
+  const res = await fetch(`${API_URL}/memos/${memoId}/attachments/${attachmentId}`, {
+    method: "DELETE",
+    headers: authHeaders(),
+  });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return true;
+}
+
+/* =========================
+   BOOTSTRAP
+========================= */
+// 初期表示用：メモ 1 ページ目・カテゴリ・タグを 1 回で取得
+// （ETag によりブラウザが再検証し、変更がなければ 304 で本体を省略）
+export async function fetchBootstrap() {
+  const res = await fetch(`${API_URL}/bootstrap`, { headers: authHeaders(), cache: "no-cache" });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
+}
+
+/* =========================
+   EVENTS（変更通知）
+========================= */
+// GET /events（Server-Sent Events）を購読する。EventSource は認証ヘッダを付けられないため fetch で読む
+// handlers: { onChange({ entity, op, ids }), onResync(), onOpen(), onClose() }
+// onResync: 切断中・受信が遅れた間の通知が失われた（全件を取り直す）。再接続時にも呼ぶ
+// 戻り値: 購読を止める関数
+export function subscribeEvents({ onChange, onResync, onOpen, onClose } = {}) {
+  const controller = new AbortController();
+  let retry = 3000;
+  let connected = false;
+
+  const dispatch = (frame) => {
+    let event = "message";
+    const data = [];
+    frame.split("\n").forEach((line) => {
+      if (line.startsWith("event:")) event = line.slice(6).trim();
+      else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+      else if (line.startsWith("retry:")) retry = Number(line.slice(6)) || retry;
+    });
+    if (event === "change" && onChange) onChange(JSON.parse(data.join("\n")));
+    else if (event === "resync" && onResync) onResync();
+  };
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const res = await fetch(`${API_URL}/events`, { headers: authHeaders(), signal: controller.signal });
+        if (res.status === 401 || res.status === 403) return;
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        // 2 回目以降の接続では切断中の変更を取りこぼしているため取り直す
+        if (connected && onResync) onResync();
+        connected = true;
+        if (onOpen) onOpen();
+
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf("\n\n")) >= 0) {
+            dispatch(buffer.slice(0, end));
+            buffer = buffer.slice(end + 2);
+          }
+        }
+      } catch (err) {
+        if (controller.signal.aborted) return;
+      }
+      if (onClose) onClose();
+      await new Promise((resolve) => setTimeout(resolve, retry));
+    }
+  };
+
+  connect();
+  return () => controller.abort();
+}
+
 /* =========================
    CATEGORY
 ========================= */
@@ -155,10 +288,20 @@ export async function deleteTag(id) {
 /* =========================
    USERS（admin only）
 ========================= */
-export async function fetchUsers() {
-  const res = await fetch(`${API_URL}/admin/users`, { headers: authHeaders() });
+// params: { q（ユーザー名の前方一致）, cursor, limit }
+// 戻り値: { items, nextCursor }（各ユーザーにメモ・タグ・カテゴリ件数と content_bytes 付き）
+export async function fetchUsers(params = {}) {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== "" && value !== null && value !== undefined) query.append(key, value);
+  });
+  const qs = query.toString();
+  const res = await fetch(`${API_URL}/admin/users${qs ? `?${qs}` : ""}`, { headers: authHeaders() });
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
-  return res.json();
+  return {
+    items: await res.json(),
+    nextCursor: res.headers.get("X-Next-Cursor"),
+  };
 }
 
 export async function fetchUser(id) {